@@ -1,3 +1,5 @@
+from typing import Literal
+
 from pydantic_settings import BaseSettings, SettingsConfigDict
 
 
@@ -16,6 +18,68 @@ class Settings(BaseSettings):
     telegram_bot_token: str
     telegram_user_name: str
     telegram_user_chat_id: str
+    # Registered recipients of the Telegram notifications (chats discovered from the bot updates)
+    telegram_chats_file: str = "telegram_chats.json"
+    # Optional monthly range partitioning of the "objects" and "history" tables on the "time" column
+    objects_partitioning: bool = False
+    partition_archive_directory: str = "archive"
+    # Optional copies of "time" and "type" from the "objects" table in the "defects", "history" and "state_of_conv"
+    denormalized_timestamps: bool = False
+    # Protection of the audit log against a flood of similar records: maximum count of records of each type
+    # in the window (types without limit aren't limited) and suppression of the same records of the given types
+    # in the window (records about new defects are always written, also the "warning" ones of normal-level defects)
+    log_rate_limit_window_seconds: int = 60
+    log_rate_limits: dict[str, int] = {"error": 20, "warning": 20}
+    log_deduplicated_types: set[str] = {"error", "warning"}
+    # Processing of the new defects: count of concurrent handlers, size of the queue of the defects waiting for the
+    # handlers and the maximum pause between the attempts to restore the listening connection to the database
+    new_defect_handlers: int = 4
+    new_defect_queue_size: int = 1000
+    listener_reconnect_max_seconds: float = 30
+    # Period of the attempts of the server process to become the leader (only the leader processes the new defects
+    # and delivers the notifications when the server is run with several workers)
+    leader_election_interval_seconds: float = 5
+    # Server-sent events: count of the events waiting for a slow client, policy for the client whose buffer is full
+    # (drop_oldest / disconnect), the interval of the heartbeat comments and count of the last events which are sent
+    # again to the reconnected clients
+    sse_client_buffer_size: int = 256
+    sse_slow_client_policy: Literal["drop_oldest", "disconnect"] = "drop_oldest"
+    sse_heartbeat_interval_seconds: float = 15
+    sse_replay_buffer_size: int = 1000
+    # Health of the server: lifetime of the result of the database check shared by all requests and the interval of
+    # sending the health to the clients of the event stream
+    health_database_probe_ttl_seconds: float = 5
+    health_push_interval_seconds: float = 10
+    # Delivery of notifications from the outbox: count of workers, retries with exponential backoff
+    notification_workers: int = 4
+    notification_max_attempts: int = 6
+    notification_retry_base_seconds: float = 5
+    notification_retry_max_seconds: float = 600
+    # Non-critical defect notifications found during the window are sent as one digest (0 disables coalescing)
+    notification_coalescing_window_seconds: float = 10
+    notification_coalescing_max_batch_size: int = 50
+    notification_coalescing_bypass_criticalities: list[str] = ["critical"]
+    # Quotas of the providers: sending rate (messages per second) for the whole channel and for one recipient
+    # (channels missing here aren't limited). The rates are a bit lower than the quotas because of the network jitter
+    notification_channel_rate_limits: dict[str, float] = {"Telegram": 25, "Gmail": 5}
+    notification_recipient_rate_limits: dict[str, float] = {"Telegram": 0.9, "Gmail": 2}
+    # Generation of the reports: count of the processes building the reports at the same time, the time limit of
+    # the building of one report, the directory of the generated reports and the time they are kept for downloading
+    report_build_processes: int = 2
+    report_build_timeout_seconds: float = 600
+    reports_directory: str = "reports"
+    report_jobs_retention_hours: float = 24
+    # Disk space for the generated reports kept to be returned again while the data is the same (0 disables the cache)
+    report_cache_size_bytes: int = 256 * 1024 * 1024
+    # Variant of the defect photo attached to the notifications, the memory limit of the cache of the photo variants,
+    # the directory keeping the variants between restarts (empty string disables it) and its disk space limit
+    notification_photo_variant: Literal["thumbnail", "preview", "full"] = "preview"
+    image_variants_cache_size_bytes: int = 128 * 1024 * 1024
+    image_variants_directory: str = "image_variants"
+    image_variants_directory_size_bytes: int = 1024 * 1024 * 1024
+    # Base URLs of the provider APIs (can be replaced with the local stand-ins from "benchmarks" directory)
+    telegram_api_base_url: str = "https://api.telegram.org/bot"
+    gmail_api_base_url: str = "https://gmail.googleapis.com/"
 
     model_config = SettingsConfigDict(
         env_file=".env",
@@ -1,23 +1,70 @@
-import base64
-from io import BytesIO
+"""
+Listening for the new defects notified by the database trigger (only in the leader process of the server). The
+listening connection is supervised (it's restored with backoff after the failures) and the defects missed while it
+was lost are found in the table.
+Notified defects are put into the bounded queue and processed by the concurrent handlers, the synchronous database
+work of the handlers is done in the threads. The id up to which all defects are processed is saved in the database,
+so the next leader process handles the defects added during the failover or not finished by the previous leader
+(notifications are enqueued with the idempotency keys, so they aren't sent twice)
+"""
+import asyncio
 import json
-import binascii
-from asyncio import sleep
+import random
+from uuid import uuid4
 
-from asyncpg import connect
-from sqlmodel import Session, select
+from asyncpg import connect, Connection, PostgresError, InterfaceError
+from PIL import UnidentifiedImageError
+from fastapi.concurrency import run_in_threadpool
+from sqlmodel import Session, select, func, col
 
-from application.models.db_models import Defect
+from application.models.db_models import Defect, ProcessedDefectsWatermark
+from application.models.api_models import DefectResponseModel
 from application.services.defect_info_service import form_response_model_from_defect, determine_defect_criticality
 from application.services.conveyor_info_service import create_record_of_current_general_conveyor_status
-from application.services.notification_service import (send_telegram_notification_from_server,
-                                                       send_gmail_notification_from_server)
 from application.services.maintenance_service import notify_clients
 from application.services.logging_service import create_log_record
 
 from .config import settings
 from .user_settings import load_user_settings
 from .db_connection import engine
+from .notification_outbox import enqueue_notification
+from .notification_workers import new_notifications_event
+from .image_variants import get_image_variant
+from .defect_feed import publish_defect_delta
+from .denormalized_timestamps import get_defect_loading_options
+
+LISTENER_RECONNECT_MIN_SECONDS = 1
+LISTENER_CHECK_INTERVAL_SECONDS = 5
+LISTENER_CHECK_TIMEOUT_SECONDS = 10
+CATCH_UP_BATCH_SIZE = 100
+HANDLER_BATCH_SIZE = 50
+
+# Id of the last defect put into the queue, the catch-up is looking for the defects after it. Notifications received
+# during the catch-up are not queued, the last of their ids is kept to check that the catch-up has found them
+LISTENER_STATE = {"is_connected": False, "is_catching_up": False, "last_defect_id": None,
+                  "last_notified_defect_id": None, "saved_watermark": None}
+new_defects_queue = asyncio.Queue(maxsize=settings.new_defect_queue_size)
+# Ids of the defects which are queued or being handled
+pending_defect_ids = set()
+conveyor_status_lock = asyncio.Lock()
+
+
+def enqueue_new_defect_notifications(key: str, subject: str, text: str, telegram_text: str,
+                                     attachment: bytes | None = None, attachment_name: str | None = None,
+                                     digest_item: dict | None = None, user_settings: dict | None = None):
+    """
+    Put notifications into the outbox for the channels from the user settings (the snapshot of the settings can be
+    given), they are delivered by the workers (notifications with the digest item are coalesced into the digests)
+    """
+    # pylint: disable=R0913,R0917
+    if user_settings is None:
+        user_settings = load_user_settings()
+    for channel in ("Telegram", "Gmail"):
+        if not user_settings or channel in user_settings["new_defect_notification_scope"]:
+            enqueue_notification(idempotency_key=f"{key}:{channel}", channel=channel, subject=subject,
+                                 text=telegram_text if channel == "Telegram" else text,
+                                 attachment=attachment, attachment_name=attachment_name, digest_item=digest_item)
+    new_notifications_event.set()
 
 
 async def send_error_notification(subject: str, message: str):
@@ -26,87 +73,279 @@ async def send_error_notification(subject: str, message: str):
     but defect info has turned out to be corrupted
     """
     # Action logging
-    create_log_record("error", "New undefined defect has appeared on the conveyor, "
-                               "but defect info has corrupted!")
+    await run_in_threadpool(create_log_record, "error", "New undefined defect has appeared on the conveyor, "
+                                                        "but defect info has corrupted!")
 
-    telegram_sending_details = None
-    gmail_sending_details = None
+    await run_in_threadpool(enqueue_new_defect_notifications, key=f"corrupted_defect:{uuid4()}", subject=subject,
+                            text=message, telegram_text=f"{subject}\n\n{message}")
+    await notify_clients(json.dumps({"title": subject, "text": message}))
 
-    if not load_user_settings() or "Telegram" in load_user_settings()["new_defect_notification_scope"]:
-        _, telegram_sending_details = await send_telegram_notification_from_server(f"{subject}\n\n{message}")
-    if not load_user_settings() or "Gmail" in load_user_settings()["new_defect_notification_scope"]:
-        _, gmail_sending_details = send_gmail_notification_from_server(subject, message)
 
-    if telegram_sending_details is None and gmail_sending_details is None:
-        await notify_clients(json.dumps({"title": subject, "text": message}))
-    else:
-        await notify_clients(
-            json.dumps({"title": subject,
-                        "text": "There were some errors when trying to send a notification via Telegram or Gmail. \n"
-                                f"Telegram error info: {telegram_sending_details}; \n"
-                                f"Gmail error info: {gmail_sending_details}. \n\n"
-                                f"Failure notification info: \n{message}"}))
+def get_new_defects_info(defect_ids: list[int]):
+    """
+    Returns the dictionary {<defect id>: (<DefectResponseModel without photo>, <criticality>, <photo>)}. Defects are
+    fetched in one query together with their types, photos and base objects (if the time isn't denormalized)
+    """
+    with Session(engine) as session:
+        defects = session.exec(select(Defect).where(col(Defect.id).in_(defect_ids))
+                               .options(*get_defect_loading_options())).all()
+        return {defect.id: (form_response_model_from_defect(defect, include_photo=False),
+                            determine_defect_criticality(defect), defect.photo_object.image) for defect in defects}
 
 
-async def on_new_defect_notify_handler(_connection, _pid, _channel, payload):
-    try:
-        json_payload = json.loads(payload)
-    except (json.JSONDecodeError, KeyError) as e:
-        await send_error_notification(
-            subject="New defect on the conveyor! [Corrupted Info]".upper(),
-            message=f"New defect has appeared, but it seems the defect has corrupted info. Exception info: {e}")
+async def handle_new_defects(payloads: list[str]):
+    """
+    Defects notified together are fetched from the database at once
+    """
+    defect_ids = []
+    for payload in payloads:
+        try:
+            defect_ids.append(int(json.loads(payload)["id"]))
+        except (json.JSONDecodeError, KeyError, TypeError, ValueError) as e:
+            await send_error_notification(
+                subject="New defect on the conveyor! [Corrupted Info]".upper(),
+                message=f"New defect has appeared, but it seems the defect has corrupted info. Exception info: {e!r}")
+    if not defect_ids:
         return
 
-    with Session(engine) as session:
-        new_defect = session.exec(select(Defect).where(Defect.id == json_payload["id"])).one()
-        formatted_defect = form_response_model_from_defect(new_defect)
-        criticality = determine_defect_criticality(new_defect)
+    defects_info = await run_in_threadpool(get_new_defects_info, defect_ids)
+    user_settings = await run_in_threadpool(load_user_settings)
+    # New defects may cause changing of the general conveyor status (concurrent handlers mustn't create
+    # the same status record twice)
+    async with conveyor_status_lock:
+        await run_in_threadpool(create_record_of_current_general_conveyor_status)
+
+    for defect_id in defect_ids:
+        # Defect deleted before the handling is skipped
+        if defect_id not in defects_info:
+            continue
+        # Error of one defect doesn't stop the handling of the other defects of the batch
+        try:
+            await handle_new_defect(defect_id, *defects_info[defect_id], user_settings=user_settings)
+        except Exception as e:  # pylint: disable=W0718
+            # Action logging
+            await run_in_threadpool(create_log_record, "error", f"Error has occurred while processing the new defect "
+                                                                f"with id={defect_id}. Error info: {e!r}")
+
+
+async def handle_new_defect(defect_id: int, formatted_defect: DefectResponseModel, criticality: str,
+                            defect_photo: bytes | None, user_settings: dict):
+    # pylint: disable=R0913,R0917
     message_header = f"New {criticality}-level defect on the conveyor!".upper()
     defect_to_text = "\n".join([f"{key} = {str(value)}" for (key, value) in
                                 formatted_defect.model_dump(exclude={"base64_photo"}).items()])
+    await publish_defect_delta("created", formatted_defect)
 
-    try:
-        defect_photo = BytesIO(base64.b64decode(formatted_defect.base64_photo))
-        defect_photo.name = "Defect.jpg"
-    except (binascii.Error, TypeError):
+    if defect_photo is None:
         await send_error_notification(subject=f"{message_header} [Corrupted Photo]".upper(),
-                                      message="New defect has appeared, but it seems like there is incorrect "
-                                              "base64-encoded representation of the photo for the new defect!.\n"
+                                      message="New defect has appeared, but it seems like there is no photo "
+                                              "for the new defect!.\n"
                                               f"Defect info:\n\n{defect_to_text}")
         return
 
-    # Action logging
+    # Action logging (records about the new defects are never suppressed by the audit log limiter, also the ones
+    # of the normal-level defects written with the "warning" type)
     log_type = "warning" if criticality == "normal" else f"{criticality}_defect"
-    create_log_record(log_type, f"New {criticality}-level defect with id={json_payload["id"]} "
-                                f"has appeared on the conveyor!")
-
-    # New defect may cause changing of the general conveyor status
-    create_record_of_current_general_conveyor_status()
-
-    telegram_sending_details = None
-    gmail_sending_details = None
-
-    # Notification sending
-    if not load_user_settings() or "Telegram" in load_user_settings()["new_defect_notification_scope"]:
-        _, telegram_sending_details = await send_telegram_notification_from_server(
-            f"{message_header} \n\n{defect_to_text}", io_file=defect_photo)
-    if not load_user_settings() or "Gmail" in load_user_settings()["new_defect_notification_scope"]:
-        _, gmail_sending_details = send_gmail_notification_from_server(
-            message_header, f"Defect info: \n\n{defect_to_text}", io_file=defect_photo)
-
-    if telegram_sending_details is None and gmail_sending_details is None:
-        await notify_clients(json.dumps({"title": message_header, "text": defect_to_text}))
-    else:
-        await notify_clients(
-            json.dumps({"title": message_header,
-                        "text": "There were some errors when trying to send notification via Telegram or Gmail. \n"
-                                f"Telegram error info: {telegram_sending_details}; \n"
-                                f"Gmail error info: {gmail_sending_details}. \n\n"
-                                f"Notification info: \n{defect_to_text}"}))
+    await run_in_threadpool(create_log_record, log_type, f"New {criticality}-level defect with id={defect_id} "
+                                                         f"has appeared on the conveyor!", is_limited=False)
 
+    # Notification sending is done by the outbox workers, so slow or failing providers don't stall the handler.
+    # Bursts of defects are coalesced into digests, but critical defects are sent immediately
+    try:
+        photo = await run_in_threadpool(get_image_variant, defect_photo, settings.notification_photo_variant)
+    except (UnidentifiedImageError, OSError):
+        # Photo which can't be decoded is sent as is
+        photo = defect_photo
+    digest_item = None
+    if (settings.notification_coalescing_window_seconds > 0
+            and criticality not in settings.notification_coalescing_bypass_criticalities):
+        digest_item = {"defect_id": defect_id, "criticality": criticality, "header": message_header,
+                       "text": defect_to_text}
+    await run_in_threadpool(enqueue_new_defect_notifications, key=f"new_defect:{defect_id}", subject=message_header,
+                            text=f"Defect info: \n\n{defect_to_text}",
+                            telegram_text=f"{message_header} \n\n{defect_to_text}",
+                            attachment=photo, attachment_name="Defect.jpg", digest_item=digest_item,
+                            user_settings=user_settings)
+    await notify_clients(json.dumps({"title": message_header, "text": defect_to_text}))
 
-async def listen_for_new_defects():
-    db_connection = await connect(settings.database_url)
+
+def get_defect_id_from_payload(payload: str):
+    try:
+        return int(json.loads(payload)["id"])
+    except (json.JSONDecodeError, KeyError, TypeError, ValueError):
+        return None
+
+
+def on_new_defect_notify_handler(_connection, _pid, _channel, payload):
+    """
+    Only puts the defect into the queue, so the listening connection is never blocked by the handling
+    """
+    # Corrupted payload is reported by the handler
+    defect_id = get_defect_id_from_payload(payload)
+
+    if defect_id is not None and LISTENER_STATE["is_catching_up"]:
+        # The defect will be found by the catch-up
+        LISTENER_STATE["last_notified_defect_id"] = max(LISTENER_STATE["last_notified_defect_id"] or 0, defect_id)
+        return
+    try:
+        new_defects_queue.put_nowait(payload)
+    except asyncio.QueueFull:
+        if defect_id is not None:
+            # Defects are taken from the table after the handlers have caught up with the queue
+            LISTENER_STATE["is_catching_up"] = True
+            LISTENER_STATE["last_notified_defect_id"] = defect_id
+        return
+    if defect_id is not None:
+        pending_defect_ids.add(defect_id)
+        LISTENER_STATE["last_defect_id"] = max(LISTENER_STATE["last_defect_id"] or 0, defect_id)
+
+
+def get_processed_defects_watermark():
+    """
+    All defects up to the returned id are processed (the ones after it are queued, handled or not found yet)
+    """
+    if pending_defect_ids:
+        return min(pending_defect_ids) - 1
+    return LISTENER_STATE["last_defect_id"]
+
+
+def load_processed_defects_watermark():
+    with Session(engine) as session:
+        watermark = session.get(ProcessedDefectsWatermark, 1)
+        return watermark.last_defect_id if watermark else None
+
+
+def save_processed_defects_watermark(defect_id: int):
+    with Session(engine) as session:
+        session.merge(ProcessedDefectsWatermark(id=1, last_defect_id=defect_id))
+        session.commit()
+
+
+async def save_processed_defects_watermark_if_changed():
+    watermark = get_processed_defects_watermark()
+    if watermark is None or watermark == LISTENER_STATE["saved_watermark"]:
+        return
+    try:
+        await run_in_threadpool(save_processed_defects_watermark, watermark)
+    except Exception:  # pylint: disable=W0718
+        # Watermark is saved again after the next handled defects
+        return
+    LISTENER_STATE["saved_watermark"] = watermark
+
+
+def get_last_defect_id():
+    with Session(engine) as session:
+        return session.exec(select(func.max(Defect.id))).one()  # pylint: disable=E1102
+
+
+def get_defect_ids_after(defect_id: int, limit: int):
+    with Session(engine) as session:
+        return session.exec(select(Defect.id).where(Defect.id > defect_id).order_by(Defect.id).limit(limit)).all()
+
+
+async def catch_up_with_missed_defects():
+    """
+    Put into the queue the defects added after the last queued one (while the connection was lost or the queue was
+    full). Returns the count of the found defects
+    """
+    count_of_missed_defects = 0
+    while True:
+        defect_ids = await run_in_threadpool(get_defect_ids_after, LISTENER_STATE["last_defect_id"] or 0,
+                                             CATCH_UP_BATCH_SIZE)
+        for defect_id in defect_ids:
+            # Waiting for the free place in the queue slows the catch-up down to the speed of the handlers
+            pending_defect_ids.add(defect_id)
+            await new_defects_queue.put(json.dumps({"id": defect_id}))
+            LISTENER_STATE["last_defect_id"] = defect_id
+        count_of_missed_defects += len(defect_ids)
+        # Defects notified during the last query are looked for again
+        last_defect_id = LISTENER_STATE["last_defect_id"] or 0
+        if not defect_ids and (LISTENER_STATE["last_notified_defect_id"] or 0) <= last_defect_id:
+            LISTENER_STATE["is_catching_up"] = False
+            return count_of_missed_defects
+
+
+async def new_defect_handler():
+    while True:
+        # Defects which are already waiting in the queue are handled together
+        payloads = [await new_defects_queue.get()]
+        while len(payloads) < HANDLER_BATCH_SIZE and not new_defects_queue.empty():
+            payloads.append(new_defects_queue.get_nowait())
+        try:
+            await handle_new_defects(payloads)
+        except Exception as e:  # pylint: disable=W0718
+            # Action logging
+            await run_in_threadpool(create_log_record, "error", "Error has occurred while processing the new "
+                                                                f"defect notifications. Error info: {e!r}")
+        finally:
+            for payload in payloads:
+                pending_defect_ids.discard(get_defect_id_from_payload(payload))
+                new_defects_queue.task_done()
+        await save_processed_defects_watermark_if_changed()
+
+
+async def listen_with_connection(db_connection: Connection, previous_error: str | None):
+    """
+    Listen until the connection fails (the failure is raised)
+    """
+    LISTENER_STATE["is_catching_up"] = True
     await db_connection.add_listener("new_defect", on_new_defect_notify_handler)
+    LISTENER_STATE["is_connected"] = True
+    if LISTENER_STATE["last_defect_id"] is None:
+        watermark = await run_in_threadpool(load_processed_defects_watermark)
+        if watermark is None:
+            # Defects added before the first start of the server are not processed
+            watermark = await run_in_threadpool(get_last_defect_id) or 0
+            await run_in_threadpool(save_processed_defects_watermark, watermark)
+        LISTENER_STATE["last_defect_id"] = LISTENER_STATE["saved_watermark"] = watermark
+    count_of_missed_defects = await catch_up_with_missed_defects()
+    if previous_error is not None:
+        # Action logging
+        await run_in_threadpool(create_log_record, "warning", "Connection for listening to the new defects has been "
+                                                              f"restored after the error: {previous_error}. "
+                                                              f"{count_of_missed_defects} missed defect(s) were found")
+
     while True:
-        await sleep(1)
+        # Connection which is broken silently is found by the regular check
+        await asyncio.wait_for(db_connection.fetchval("SELECT 1"), timeout=LISTENER_CHECK_TIMEOUT_SECONDS)
+        if LISTENER_STATE["is_catching_up"]:
+            await catch_up_with_missed_defects()
+        await asyncio.sleep(LISTENER_CHECK_INTERVAL_SECONDS)
+
+
+async def listen_for_new_defects():
+    """
+    Supervisor of the listening connection: the connection is restored with exponential backoff after the failures
+    """
+    # Processing continues from the saved watermark after the (re-)election. Defects left in the queue by the previous
+    # leadership of this process are found again by the catch-up
+    LISTENER_STATE["last_defect_id"] = None
+    pending_defect_ids.clear()
+    while not new_defects_queue.empty():
+        new_defects_queue.get_nowait()
+        new_defects_queue.task_done()
+    handlers = [asyncio.create_task(new_defect_handler()) for _ in range(settings.new_defect_handlers)]
+    reconnect_delay, previous_error = LISTENER_RECONNECT_MIN_SECONDS, None
+    try:
+        while True:
+            try:
+                db_connection = await connect(settings.database_url, timeout=LISTENER_CHECK_TIMEOUT_SECONDS)
+            except (OSError, PostgresError, asyncio.TimeoutError) as e:
+                previous_error = repr(e)
+                # Jitter prevents simultaneous reconnections of several servers
+                await asyncio.sleep(reconnect_delay * random.uniform(0.8, 1.2))
+                reconnect_delay = min(reconnect_delay * 2, settings.listener_reconnect_max_seconds)
+                continue
+
+            reconnect_delay = LISTENER_RECONNECT_MIN_SECONDS
+            try:
+                await listen_with_connection(db_connection, previous_error)
+            except (OSError, PostgresError, InterfaceError, asyncio.TimeoutError) as e:
+                previous_error = repr(e)
+            finally:
+                LISTENER_STATE["is_connected"] = False
+                db_connection.terminate()
+            await asyncio.sleep(reconnect_delay)
+    finally:
+        for handler in handlers:
+            handler.cancel()
@@ -0,0 +1,92 @@
+"""
+Tracking of the changes of the "defects" table for the clients keeping the local copy of the defects. The triggers
+write the id of the transaction into the "change_version" column of the inserted or updated defect and into
+the tombstone of the deleted one. Only the changes of the transactions older than the oldest running transaction
+are returned, so the changes committed later by the older transactions are never skipped by the clients
+"""
+from sqlalchemy import Connection, inspect, or_
+from sqlmodel import Session, select, text
+
+from .denormalized_timestamps import get_defect_loading_options
+from .models.db_models import Defect, DefectTombstone
+
+CHANGE_TRACKING_DDL = \
+    """
+    CREATE OR REPLACE FUNCTION set_defect_change_version()
+    RETURNS TRIGGER AS $$
+    BEGIN
+        NEW.change_version := pg_current_xact_id()::TEXT::BIGINT;
+        RETURN NEW;
+    END;
+    $$ LANGUAGE plpgsql;
+
+    CREATE OR REPLACE FUNCTION create_defect_tombstone()
+    RETURNS TRIGGER AS $$
+    BEGIN
+        INSERT INTO defect_tombstones (defect_id, change_version)
+        VALUES (OLD.id, pg_current_xact_id()::TEXT::BIGINT)
+        ON CONFLICT (defect_id) DO UPDATE SET change_version = EXCLUDED.change_version;
+        RETURN OLD;
+    END;
+    $$ LANGUAGE plpgsql;
+
+    DROP TRIGGER IF EXISTS trigger_set_defect_change_version ON defects;
+    CREATE TRIGGER trigger_set_defect_change_version
+    BEFORE INSERT OR UPDATE ON defects
+    FOR EACH ROW
+    EXECUTE FUNCTION set_defect_change_version();
+
+    DROP TRIGGER IF EXISTS trigger_create_defect_tombstone ON defects;
+    CREATE TRIGGER trigger_create_defect_tombstone
+    AFTER DELETE ON defects
+    FOR EACH ROW
+    EXECUTE FUNCTION create_defect_tombstone();
+    """
+
+
+def enable_defect_change_tracking(connection: Connection):
+    """
+    Column, table of tombstones and triggers (the statements are idempotent, so they are also run at startup for
+    the databases created before the change tracking)
+    """
+    if not inspect(connection).has_table("defects"):
+        return
+    connection.execute(text("ALTER TABLE defects ADD COLUMN IF NOT EXISTS change_version BIGINT"))
+    connection.execute(text("CREATE INDEX IF NOT EXISTS ix_defects_change_version ON defects (change_version)"))
+    DefectTombstone.__table__.create(connection, checkfirst=True)
+    connection.execute(text(CHANGE_TRACKING_DDL))
+
+
+def get_defect_changes(session: Session, since_version: int):
+    """
+    Returns (<version to request the next changes since>, <changed defects>, <ids of deleted defects>). Version 0
+    means that the client has no copy, then all defects are returned (also the ones written before the tracking)
+    """
+    # Transactions with smaller ids are finished, so no change older than this version can appear later
+    version = session.connection().execute(
+        text("SELECT pg_snapshot_xmin(pg_current_snapshot())::TEXT::BIGINT")).scalar_one()
+    change_version = Defect.__table__.c.change_version
+    changed_condition = change_version.between(since_version, version - 1)
+    if since_version == 0:
+        changed_condition = or_(changed_condition, change_version.is_(None))
+    defects = session.exec(select(Defect).where(changed_condition).order_by(Defect.id)
+                           .options(*get_defect_loading_options())).all()
+
+    deleted_defect_ids = []
+    if since_version > 0:
+        deleted_defect_ids = session.exec(select(DefectTombstone.defect_id)
+                                          .where(DefectTombstone.__table__.c.change_version
+                                                 .between(since_version, version - 1))
+                                          .order_by(DefectTombstone.defect_id)).all()
+    return version, defects, list(deleted_defect_ids)
+
+
+def get_version_of_defects(session: Session):
+    """
+    Version of the whole content of the "defects" table for the caches. It changes after every insert, update (the row
+    gets the id of the new transaction) and deletion (the tombstone is written or updated), also if the older
+    transaction commits after the newer one, which the maximum of the versions would miss
+    """
+    return session.connection().execute(text(
+        "SELECT (SELECT COUNT(*) || ':' || COALESCE(SUM(change_version), 0) FROM defects) || ':' || "
+        "(SELECT COUNT(*) || ':' || COALESCE(SUM(change_version), 0) FROM defect_tombstones)")).scalar_one()
@@ -0,0 +1,77 @@
+"""
+Live feed of the changes of the defects (created, criticality changed, deleted) for the WebSocket clients. Changes are
+sent to all processes of the server through the event bus, every process filters them by the filters of its clients
+(types, criticalities, segment of the belt), so a client receives only the defects it displays. A slow client is
+disconnected instead of losing the changes silently, so it reloads the defects after reconnection
+"""
+from .config import settings
+from .event_bus import add_event_bus_handler, publish_to_event_bus
+from .models.api_models import DefectResponseModel, DefectDeltaResponseModel, DefectFeedFilters
+from .sse_hub import SSEClient
+
+
+def does_defect_match_filters(filters: DefectFeedFilters, defect: DefectResponseModel, criticality: str):
+    return ((filters.types is None or defect.type in filters.types)
+            and (filters.criticalities is None or criticality in filters.criticalities)
+            and (filters.min_longitudinal_position is None
+                 or defect.longitudinal_position >= filters.min_longitudinal_position)
+            and (filters.max_longitudinal_position is None
+                 or defect.longitudinal_position <= filters.max_longitudinal_position))
+
+
+def does_delta_match_filters(filters: DefectFeedFilters, delta: DefectDeltaResponseModel):
+    """
+    Defect whose criticality has changed is also sent to the clients which displayed it with the previous criticality
+    (they have to remove it)
+    """
+    return (does_defect_match_filters(filters, delta.defect, delta.defect.criticality)
+            or (delta.previous_criticality is not None
+                and does_defect_match_filters(filters, delta.defect, delta.previous_criticality)))
+
+
+class DefectFeedClient(SSEClient):
+    def __init__(self, buffer_size: int):
+        super().__init__(buffer_size)
+        self.filters = DefectFeedFilters()
+
+
+class DefectFeed:
+    def __init__(self, buffer_size: int):
+        self.buffer_size = buffer_size
+        self.clients = set()
+
+    def subscribe(self):
+        client = DefectFeedClient(self.buffer_size)
+        self.clients.add(client)
+        return client
+
+    def unsubscribe(self, client: DefectFeedClient):
+        self.clients.discard(client)
+
+    def publish(self, delta: DefectDeltaResponseModel):
+        # The delta is serialized once for all clients
+        message = None
+        for client in list(self.clients):
+            if not does_delta_match_filters(client.filters, delta):
+                continue
+            message = message or delta.model_dump_json()
+            if not client.push(delta.defect.id, message):
+                client.is_disconnected = True
+                self.unsubscribe(client)
+
+
+defect_feed = DefectFeed(buffer_size=settings.sse_client_buffer_size)
+
+
+async def publish_defect_delta(action: str, defect: DefectResponseModel, previous_criticality: str | None = None):
+    delta = DefectDeltaResponseModel(action=action, defect=defect.model_copy(update={"base64_photo": ""}),
+                                     previous_criticality=previous_criticality)
+    if not await publish_to_event_bus("defect_delta", delta.model_dump_json()):
+        defect_feed.publish(delta)
+
+
+async def on_defect_delta(payload: str):
+    defect_feed.publish(DefectDeltaResponseModel.model_validate_json(payload))
+
+
+add_event_bus_handler("defect_delta", on_defect_delta)
@@ -0,0 +1,150 @@
+"""
+Optional denormalization of the "time" and "type" columns of the "objects" table into the "defects", "history"
+and "state_of_conv" tables, so that time-range queries don't need to join the "objects" table.
+
+Usage from the root of the project (backfill migration for the existing data):
+    python -m application.denormalized_timestamps
+"""
+from sqlalchemy import Connection, inspect
+from sqlalchemy.orm import joinedload
+from sqlmodel import text
+
+from .config import settings
+from .db_connection import engine
+from .models.db_models import Defect
+
+# Table name -> name of the column referencing "objects" table
+DENORMALIZED_TABLES = {
+    "defects": "obj_id",
+    "history": "id_obj",
+    "state_of_conv": "id_obj",
+}
+# Turned off at startup if the triggers or the backfill are missing (see find_missing_denormalization)
+DENORMALIZATION_STATE = {"is_ready": True}
+# Count of rows updated in one statement during the backfill to avoid long locks of the tables
+BACKFILL_BATCH_SIZE = 10000
+
+TRIGGERS_DDL = \
+    """
+    CREATE OR REPLACE FUNCTION copy_time_and_type_of_base_object()
+    RETURNS TRIGGER AS $$
+    DECLARE
+        base_object RECORD;
+    BEGIN
+        SELECT time, type INTO base_object FROM objects WHERE id = (to_jsonb(NEW) ->> TG_ARGV[0])::INTEGER;
+        IF FOUND THEN
+            NEW.time := base_object.time;
+            NEW.object_type := base_object.type;
+        END IF;
+        RETURN NEW;
+    END;
+    $$ LANGUAGE plpgsql;
+
+    CREATE OR REPLACE FUNCTION propagate_time_and_type_of_object()
+    RETURNS TRIGGER AS $$
+    BEGIN
+        UPDATE defects SET time = NEW.time, object_type = NEW.type WHERE obj_id = NEW.id;
+        UPDATE history SET time = NEW.time, object_type = NEW.type WHERE id_obj = NEW.id;
+        UPDATE state_of_conv SET time = NEW.time, object_type = NEW.type WHERE id_obj = NEW.id;
+        RETURN NEW;
+    END;
+    $$ LANGUAGE plpgsql;
+
+    DROP TRIGGER IF EXISTS trigger_on_object_time_and_type_change ON objects;
+    CREATE TRIGGER trigger_on_object_time_and_type_change
+    AFTER UPDATE OF time, type ON objects
+    FOR EACH ROW
+    WHEN (OLD.time IS DISTINCT FROM NEW.time OR OLD.type IS DISTINCT FROM NEW.type)
+    EXECUTE FUNCTION propagate_time_and_type_of_object();
+    """
+
+
+def add_denormalized_columns(connection: Connection):
+    """
+    Columns for the tables created before the denormalization was introduced (the statements are idempotent)
+    """
+    for table in DENORMALIZED_TABLES:
+        connection.execute(text(f"ALTER TABLE IF EXISTS {table} ADD COLUMN IF NOT EXISTS time TIMESTAMP"))
+        connection.execute(text(f"ALTER TABLE IF EXISTS {table} ADD COLUMN IF NOT EXISTS object_type INTEGER"))
+
+
+def enable_denormalized_timestamps(connection: Connection):
+    """
+    Create triggers keeping the copies of "time" and "type" consistent on write and indexes for time-range queries
+    """
+    add_denormalized_columns(connection)
+    connection.execute(text(TRIGGERS_DDL))
+    DENORMALIZATION_STATE["is_ready"] = True
+    for table, reference_column in DENORMALIZED_TABLES.items():
+        connection.execute(text(f"DROP TRIGGER IF EXISTS trigger_copy_time_and_type_of_base_object ON {table}"))
+        connection.execute(text(f"CREATE TRIGGER trigger_copy_time_and_type_of_base_object "
+                                f"BEFORE INSERT OR UPDATE OF {reference_column} ON {table} FOR EACH ROW "
+                                f"EXECUTE FUNCTION copy_time_and_type_of_base_object('{reference_column}')"))
+        connection.execute(text(f"CREATE INDEX IF NOT EXISTS ix_{table}_time ON {table} (time)"))
+
+
+def are_denormalized_timestamps_used():
+    return settings.denormalized_timestamps and DENORMALIZATION_STATE["is_ready"]
+
+
+def get_defect_loading_options():
+    """
+    Relationships loaded together with the defects. The base object is loaded only if the denormalized time can't be
+    used, because its lookup by id checks every partition of the partitioned "objects" table
+    """
+    options = [joinedload(Defect.type_object), joinedload(Defect.photo_object)]
+    if not are_denormalized_timestamps_used():
+        options.append(joinedload(Defect.base_object))
+    return options
+
+
+def find_missing_denormalization(connection: Connection):
+    """
+    Returns the description of what is missing for the denormalized queries (triggers or backfill of the existing
+    rows) or None if the denormalized columns can be used
+    """
+    for table, reference_column in DENORMALIZED_TABLES.items():
+        if not inspect(connection).has_table(table):
+            continue
+        has_trigger = connection.execute(text(
+            "SELECT 1 FROM pg_trigger WHERE tgrelid = CAST(:table AS regclass) "
+            "AND tgname = 'trigger_copy_time_and_type_of_base_object'"), {"table": table}).first() is not None
+        if not has_trigger:
+            return f"trigger on the \"{table}\" table is not created"
+        has_rows_without_time = connection.execute(text(
+            f"SELECT 1 FROM {table} JOIN objects ON objects.id = {table}.{reference_column} "
+            f"WHERE {table}.time IS NULL LIMIT 1")).first() is not None
+        if has_rows_without_time:
+            return f"existing rows of the \"{table}\" table are not backfilled"
+    return None
+
+
+def backfill_denormalized_timestamps():
+    """
+    Fill the copies of "time" and "type" for the existing rows in batches (each batch is committed separately)
+    """
+    count_of_updated = 0
+    for table, reference_column in DENORMALIZED_TABLES.items():
+        with engine.connect() as connection:
+            max_id = connection.execute(text(f"SELECT MAX(id) FROM {table}")).scalar() or 0
+        for first_id in range(0, max_id + 1, BACKFILL_BATCH_SIZE):
+            with engine.begin() as connection:
+                count_of_updated += connection.execute(text(
+                    f"UPDATE {table} SET time = objects.time, object_type = objects.type FROM objects "
+                    f"WHERE objects.id = {table}.{reference_column} "
+                    f"AND {table}.id >= :first_id AND {table}.id < :last_id "
+                    f"AND ({table}.time IS DISTINCT FROM objects.time "
+                    f"OR {table}.object_type IS DISTINCT FROM objects.type)"),
+                    {"first_id": first_id, "last_id": first_id + BACKFILL_BATCH_SIZE}).rowcount
+    return count_of_updated
+
+
+def main():
+    with engine.begin() as connection:
+        enable_denormalized_timestamps(connection)
+    print(f"Triggers are created, {backfill_denormalized_timestamps()} rows are backfilled. "
+          "Set DENORMALIZED_TIMESTAMPS=true in the .env file to use the denormalized columns in queries")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,93 @@
+"""
+Event bus between the worker processes of the server based on LISTEN/NOTIFY of the database: every process listens
+to the channels of the bus and passes the received payloads to its handlers (e.g. to the hub of its SSE clients),
+so the events published by one process reach the clients connected to any process
+"""
+import asyncio
+import random
+
+from asyncpg import connect, Connection, PostgresError, InterfaceError
+from fastapi.concurrency import run_in_threadpool
+from sqlalchemy.exc import DBAPIError
+from sqlmodel import text
+
+from .config import settings
+from .db_connection import engine
+
+EVENT_BUS_RECONNECT_MIN_SECONDS = 1
+EVENT_BUS_CHECK_INTERVAL_SECONDS = 5
+EVENT_BUS_CHECK_TIMEOUT_SECONDS = 10
+# Payload of NOTIFY is limited by 8000 bytes
+EVENT_BUS_MAX_PAYLOAD_BYTES = 7900
+
+EVENT_BUS_STATE = {"is_connected": False}
+# Channel -> coroutine function handling the payload in this process
+EVENT_BUS_HANDLERS = {}
+
+
+def add_event_bus_handler(channel: str, handler):
+    EVENT_BUS_HANDLERS[channel] = handler
+
+
+def send_to_event_bus(channel: str, payload: str):
+    with engine.begin() as connection:
+        connection.execute(text("SELECT pg_notify(:channel, :payload)"), {"channel": channel, "payload": payload})
+
+
+async def publish_to_event_bus(channel: str, payload: str):
+    """
+    Returns False if the event hasn't been published (the bus isn't connected, e.g. in the tests, or the payload
+    is too large), then the event has to be handled only by this process
+    """
+    if not EVENT_BUS_STATE["is_connected"] or len(payload.encode()) > EVENT_BUS_MAX_PAYLOAD_BYTES:
+        return False
+    try:
+        await run_in_threadpool(send_to_event_bus, channel, payload)
+    except DBAPIError:
+        return False
+    return True
+
+
+def create_notify_handler(handler):
+    async def on_notify(_connection, _pid, _channel, payload):
+        await handler(payload)
+    return on_notify
+
+
+async def listen_with_connection(db_connection: Connection):
+    """
+    Listen until the connection fails (the failure is raised)
+    """
+    for channel, handler in EVENT_BUS_HANDLERS.items():
+        await db_connection.add_listener(channel, create_notify_handler(handler))
+    EVENT_BUS_STATE["is_connected"] = True
+    while True:
+        # Connection which is broken silently is found by the regular check
+        await asyncio.wait_for(db_connection.fetchval("SELECT 1"), timeout=EVENT_BUS_CHECK_TIMEOUT_SECONDS)
+        await asyncio.sleep(EVENT_BUS_CHECK_INTERVAL_SECONDS)
+
+
+async def listen_to_event_bus():
+    """
+    The listening connection is restored with exponential backoff after the failures. Events published while it is
+    lost are handled only by the publishing process
+    """
+    reconnect_delay = EVENT_BUS_RECONNECT_MIN_SECONDS
+    while True:
+        try:
+            db_connection = await connect(settings.database_url, timeout=EVENT_BUS_CHECK_TIMEOUT_SECONDS)
+        except (OSError, PostgresError, asyncio.TimeoutError):
+            # Jitter prevents simultaneous reconnections of several processes
+            await asyncio.sleep(reconnect_delay * random.uniform(0.8, 1.2))
+            reconnect_delay = min(reconnect_delay * 2, settings.listener_reconnect_max_seconds)
+            continue
+
+        reconnect_delay = EVENT_BUS_RECONNECT_MIN_SECONDS
+        try:
+            await listen_with_connection(db_connection)
+        except (OSError, PostgresError, InterfaceError, asyncio.TimeoutError):
+            pass
+        finally:
+            EVENT_BUS_STATE["is_connected"] = False
+            db_connection.terminate()
+        await asyncio.sleep(reconnect_delay)
@@ -0,0 +1,175 @@
+"""
+Resized and recompressed variants of the defect photos. Every variant is produced only when it's requested for the
+first time and is kept in the in-memory cache and in the directory on disk, so the notifications and the reports
+don't decode the originals again (also after the restart of the server). The least recently used variants are removed
+from the directory when it grows over its limit
+"""
+import os
+from collections import OrderedDict
+from hashlib import blake2b
+from io import BytesIO
+from pathlib import Path
+from tempfile import NamedTemporaryFile
+from threading import Lock
+
+from PIL import Image, ImageOps
+
+from .config import settings
+
+# Variant name -> (maximum size, JPEG quality). Thumbnails are drawn in the PDF-tables at 133x100 points, previews
+# are sent in the notifications and the full variant keeps the original resolution (if it isn't too large)
+IMAGE_VARIANTS = {
+    "thumbnail": ((266, 200), 75),
+    "preview": ((1280, 960), 82),
+    "full": ((3840, 2880), 90),
+}
+EXIF_ORIENTATION_TAG = 0x0112
+# Share of the directory limit left after the removal of the least recently used variants, so the directory isn't
+# scanned again after every new variant
+PRUNED_DIRECTORY_FILL = 0.9
+
+
+def create_image_variant(image: bytes, variant: str):
+    """
+    Returns JPEG bytes of the variant. Raises PIL.UnidentifiedImageError or OSError if the image is corrupted
+    """
+    max_size, quality = IMAGE_VARIANTS[variant]
+    with Image.open(BytesIO(image)) as original:
+        # Recompression of the JPEG which doesn't have to be downscaled or rotated would only make it worse
+        if (original.format == "JPEG" and original.width <= max_size[0] and original.height <= max_size[1]
+                and original.getexif().get(EXIF_ORIENTATION_TAG, 1) == 1):
+            return image
+        # JPEG is downscaled by the decoder (by 1/2, 1/4 or 1/8), so small variants don't decode the whole photo
+        original.draft("RGB", (max(max_size), max(max_size)))
+        picture = ImageOps.exif_transpose(original).convert("RGB")
+    picture.thumbnail(max_size)
+    output = BytesIO()
+    picture.save(output, format="JPEG", quality=quality, optimize=True)
+    return output.getvalue()
+
+
+class ImageVariantsCache:  # pylint: disable=R0903
+    """
+    LRU-cache of the variants keyed by the hash of the original photo and the variant name and limited by the total
+    size of the variants. Variants are also saved to the directory (if it's given) and read from it after the restart.
+    The directory is limited by max_directory_size_bytes (None means no limit), the time of the last use of the variant
+    is the modification time of its file, so the directory is shared by the processes of the server
+    """
+
+    def __init__(self, max_size_bytes: int, directory: str = "", max_directory_size_bytes: int | None = None):
+        self.max_size_bytes = max_size_bytes
+        self.directory = Path(directory) if directory else None
+        self.max_directory_size_bytes = max_directory_size_bytes
+        self.size_bytes = 0
+        self._variants = OrderedDict()
+        self._lock = Lock()
+        # Estimation of the directory size (the directory is scanned on the first write and on the pruning)
+        self._directory_size_bytes = None
+        self._directory_lock = Lock()
+
+    def get_variant(self, image: bytes, variant: str):
+        key = (blake2b(image, digest_size=16).hexdigest(), variant)
+        with self._lock:
+            if key in self._variants:
+                self._variants.move_to_end(key)
+                return self._variants[key]
+
+        data = self._read_from_directory(key)
+        if data is None:
+            data = create_image_variant(image, variant)
+            if data is not image:
+                self._write_to_directory(key, data)
+
+        with self._lock:
+            if key not in self._variants:
+                self._variants[key] = data
+                self.size_bytes += len(data)
+            while self.size_bytes > self.max_size_bytes and len(self._variants) > 1:
+                _, removed_data = self._variants.popitem(last=False)
+                self.size_bytes -= len(removed_data)
+        return data
+
+    def _get_path(self, key: tuple[str, str]):
+        image_hash, variant = key
+        return self.directory / image_hash[:2] / f"{image_hash}_{variant}.jpg"
+
+    def _read_from_directory(self, key: tuple[str, str]):
+        if self.directory is None:
+            return None
+        path = self._get_path(key)
+        try:
+            data = path.read_bytes()
+            os.utime(path)
+        except OSError:
+            return None
+        return data
+
+    def _write_to_directory(self, key: tuple[str, str], data: bytes):
+        if self.directory is None:
+            return
+        path = self._get_path(key)
+        try:
+            path.parent.mkdir(parents=True, exist_ok=True)
+            # Writing to the temporary file with renaming, so that the variant is never seen half-written
+            with NamedTemporaryFile(dir=path.parent, suffix=".tmp", delete=False) as file:
+                file.write(data)
+            os.replace(file.name, path)
+        except OSError:
+            # Variant which isn't saved is just created again after the restart
+            return
+        self._limit_directory_size(len(data))
+
+    def _list_directory(self):
+        """
+        Returns the list of (<time of the last use>, <size>, <path>) of the saved variants
+        """
+        variants = []
+        for path in self.directory.glob("*/*.jpg"):
+            try:
+                file_stat = path.stat()
+            except OSError:
+                # Variant which has just been removed by another process
+                continue
+            variants.append((file_stat.st_mtime, file_stat.st_size, path))
+        return variants
+
+    def _limit_directory_size(self, written_size_bytes: int):
+        if self.max_directory_size_bytes is None:
+            return
+        with self._directory_lock:
+            if self._directory_size_bytes is None:
+                self._directory_size_bytes = sum(size for _, size, _ in self._list_directory())
+            else:
+                self._directory_size_bytes += written_size_bytes
+            if self._directory_size_bytes <= self.max_directory_size_bytes:
+                return
+
+            variants = sorted(self._list_directory())
+            self._directory_size_bytes = sum(size for _, size, _ in variants)
+            for _, size, path in variants:
+                if self._directory_size_bytes <= self.max_directory_size_bytes * PRUNED_DIRECTORY_FILL:
+                    break
+                path.unlink(missing_ok=True)
+                self._directory_size_bytes -= size
+
+
+image_variants_cache = ImageVariantsCache(max_size_bytes=settings.image_variants_cache_size_bytes,
+                                          directory=settings.image_variants_directory,
+                                          max_directory_size_bytes=settings.image_variants_directory_size_bytes)
+
+
+def get_image_variant(image: bytes, variant: str):
+    """
+    Raises PIL.UnidentifiedImageError or OSError if the image is corrupted
+    """
+    return image_variants_cache.get_variant(image, variant)
+
+
+def choose_variant_for_size(width: float, height: float):
+    """
+    The smallest variant which is sharp enough to be drawn at the given size (twice as many pixels as points)
+    """
+    for name, ((max_width, max_height), _) in sorted(IMAGE_VARIANTS.items(), key=lambda item: item[1][0][0]):
+        if max_width >= 2 * width and max_height >= 2 * height:
+            return name
+    return "full"
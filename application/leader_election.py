@@ -0,0 +1,99 @@
+"""
+Election of the leader among the worker processes of the server by the session advisory lock of the database. Only
+the leader processes the new defects and delivers the notifications, so they aren't duplicated when the server is run
+with several workers. The lock is released by the database when the connection of the leader is lost, then another
+process becomes the leader
+"""
+import asyncio
+
+from asyncpg import connect, Connection
+from fastapi.concurrency import run_in_threadpool
+
+from application.services.logging_service import create_log_record
+
+from .config import settings
+
+# Arbitrary key of the advisory lock which is held by the leader
+LEADER_LOCK_KEY = 2_080_613_405
+LEADER_CHECK_TIMEOUT_SECONDS = 10
+LEADER_RETRY_MAX_SECONDS = 60
+
+# "elections_won" is the count of the times this process has become the leader
+LEADER_STATE = {"is_leader": False, "elections_won": 0}
+
+
+async def create_log_record_safely(log_type: str, log_text: str):
+    """
+    Failure of the logging (e.g. the database is unavailable) doesn't stop the election and the leader tasks
+    """
+    try:
+        await run_in_threadpool(create_log_record, log_type, log_text)
+    except Exception:  # pylint: disable=W0718
+        pass
+
+
+async def restart_stopped_leader_tasks(tasks: dict):
+    """
+    Leader tasks run forever, so the finished one has crashed and is started again (tasks are checked at the interval
+    of the election, so the task crashing at once isn't restarted in a busy loop)
+    """
+    for leader_task, task in list(tasks.items()):
+        if not task.done():
+            continue
+        error = None if task.cancelled() else task.exception()
+        tasks[leader_task] = asyncio.create_task(leader_task())
+        # Action logging
+        await create_log_record_safely("error", f"Leader task \"{leader_task.__name__}\" has stopped with the error: "
+                                                f"{error!r}. The task has been restarted")
+
+
+async def lead_with_connection(db_connection: Connection, leader_tasks: list):
+    """
+    Wait for the lock, run the tasks of the leader and keep the lock until the connection fails (the failure
+    is raised). Crashed tasks are restarted while the lock is held
+    """
+    while not await asyncio.wait_for(db_connection.fetchval("SELECT pg_try_advisory_lock($1)", LEADER_LOCK_KEY),
+                                     timeout=LEADER_CHECK_TIMEOUT_SECONDS):
+        await asyncio.sleep(settings.leader_election_interval_seconds)
+
+    LEADER_STATE["is_leader"] = True
+    LEADER_STATE["elections_won"] += 1
+    tasks = {leader_task: asyncio.create_task(leader_task()) for leader_task in leader_tasks}
+    try:
+        # Action logging
+        await create_log_record_safely("info", "Server process has become the leader processing the new defects and "
+                                               "delivering the notifications")
+        while True:
+            # Connection which is broken silently is found by the regular check, the other process may become
+            # the leader after that
+            await asyncio.wait_for(db_connection.fetchval("SELECT 1"), timeout=LEADER_CHECK_TIMEOUT_SECONDS)
+            await restart_stopped_leader_tasks(tasks)
+            await asyncio.sleep(settings.leader_election_interval_seconds)
+    finally:
+        LEADER_STATE["is_leader"] = False
+        for task in tasks.values():
+            task.cancel()
+
+
+async def run_as_leader(*leader_tasks):
+    """
+    Coroutine functions are run only while this process is the leader. Any failure of the election (not only of
+    the connection) is retried with the exponential backoff
+    """
+    retry_delay = settings.leader_election_interval_seconds
+    while True:
+        elections_won = LEADER_STATE["elections_won"]
+        try:
+            db_connection = await connect(settings.database_url, timeout=LEADER_CHECK_TIMEOUT_SECONDS)
+            try:
+                await lead_with_connection(db_connection, list(leader_tasks))
+            finally:
+                # The lock is released by the database when the connection is closed
+                db_connection.terminate()
+        except Exception:  # pylint: disable=W0718
+            pass
+        # Backoff grows while the attempts fail before the election
+        if LEADER_STATE["elections_won"] != elections_won:
+            retry_delay = settings.leader_election_interval_seconds
+        await asyncio.sleep(retry_delay)
+        retry_delay = min(retry_delay * 2, LEADER_RETRY_MAX_SECONDS)
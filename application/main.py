@@ -4,23 +4,37 @@ from asyncio import create_task
 from fastapi import FastAPI, APIRouter
 from fastapi.middleware.cors import CORSMiddleware
 from contextlib import asynccontextmanager
-from sqlmodel import Session, select
+from sqlalchemy import inspect
+from sqlmodel import Session, select, text
 from passlib.context import CryptContext
 
-from application.models.db_models import User
+from application.models.db_models import User, NotificationOutbox, ReportJob, ProcessedDefectsWatermark
 from application.models.api_models import ServiceInfoResponseModel
 
 from application.services.authentication_service import router as authentication_service_router
-from application.services.notification_service import router as notification_service_router
-from application.services.defect_info_service import router as defect_info_service_router
+from application.services.notification_service import router as notification_service_router, gmail_client_manager
+from application.services.defect_info_service import (router as defect_info_service_router,
+                                                      feed_router as defect_feed_router)
 from application.services.conveyor_info_service import router as conveyor_info_service_router
-from application.services.logging_service import router as logging_service_router
+from application.services.logging_service import (router as logging_service_router, create_log_record,
+                                                  write_suppressed_log_summaries,
+                                                  write_suppressed_log_summaries_periodically)
 from application.services.report_service import router as report_service_router
-from application.services.maintenance_service import router as maintenance_service_router
+from application.services.maintenance_service import router as maintenance_service_router, NEW_LOG_TRIGGER_DDL
+from application.services.health_service import (router as health_service_router,
+                                                 push_health_to_clients_periodically)
 
 from .config import settings
 from .db_connection import engine
 from .db_listener import listen_for_new_defects
+from .notification_workers import run_notification_workers
+from .leader_election import run_as_leader
+from .report_jobs import maintain_report_jobs_periodically, shutdown_report_process_pool
+from .event_bus import listen_to_event_bus
+from .sse_hub import send_heartbeats_periodically
+from .partitioning import create_upcoming_partitions, create_upcoming_partitions_periodically
+from .denormalized_timestamps import add_denormalized_columns, find_missing_denormalization, DENORMALIZATION_STATE
+from .defect_changes import enable_defect_change_tracking
 
 pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
 
@@ -43,12 +57,68 @@ def create_admin_if_not_exists():
         session.commit()
 
 
+def add_missing_columns_to_existing_tables():
+    """
+    Columns added to the DB models after the tables were created (the statements are idempotent)
+    """
+    NotificationOutbox.__table__.create(engine, checkfirst=True)
+    ReportJob.__table__.create(engine, checkfirst=True)
+    ProcessedDefectsWatermark.__table__.create(engine, checkfirst=True)
+    with engine.begin() as connection:
+        connection.execute(text("ALTER TABLE notification_outbox ADD COLUMN IF NOT EXISTS recipient VARCHAR"))
+        connection.execute(text("ALTER TABLE notification_outbox ADD COLUMN IF NOT EXISTS digest_item JSON"))
+        add_denormalized_columns(connection)
+        enable_defect_change_tracking(connection)
+
+
+def add_missing_triggers_to_existing_tables():
+    """
+    Triggers added after the tables were created (the statements are idempotent)
+    """
+    with engine.begin() as connection:
+        if inspect(connection).has_table("history"):
+            connection.execute(text(NEW_LOG_TRIGGER_DDL))
+
+
+def check_denormalized_timestamps():
+    """
+    Queries by the denormalized columns return nothing until the triggers are created and the existing rows are
+    backfilled, so the denormalized columns aren't used in this case
+    """
+    with engine.connect() as connection:
+        missing_denormalization = find_missing_denormalization(connection)
+    if missing_denormalization:
+        DENORMALIZATION_STATE["is_ready"] = False
+        # Action logging
+        create_log_record("warning", "DENORMALIZED_TIMESTAMPS setting is ignored because "
+                                     f"{missing_denormalization}. Run \"python -m application.denormalized_timestamps\"")
+
+
 @asynccontextmanager
 async def lifespan(_app: FastAPI):
     create_admin_if_not_exists()
+    add_missing_columns_to_existing_tables()
+    if settings.denormalized_timestamps:
+        check_denormalized_timestamps()
+    if settings.objects_partitioning:
+        create_upcoming_partitions()
     if os.getenv("TESTING") != "1":
-        create_task(listen_for_new_defects())
+        add_missing_triggers_to_existing_tables()
+        # Only one of the worker processes of the server processes the new defects and delivers the notifications,
+        # the events for the clients are sent to all processes through the event bus
+        leader_tasks = [listen_for_new_defects, run_notification_workers, maintain_report_jobs_periodically]
+        if settings.objects_partitioning:
+            leader_tasks.append(create_upcoming_partitions_periodically)
+        create_task(run_as_leader(*leader_tasks))
+        create_task(listen_to_event_bus())
+        create_task(gmail_client_manager.refresh_credentials_periodically())
+        create_task(write_suppressed_log_summaries_periodically())
+        create_task(send_heartbeats_periodically())
+        create_task(push_health_to_clients_periodically())
     yield
+    shutdown_report_process_pool()
+    if os.getenv("TESTING") != "1":
+        write_suppressed_log_summaries(everything=True)
 
 
 api_router = APIRouter(prefix="/api/v1")
@@ -56,10 +126,12 @@ api_router = APIRouter(prefix="/api/v1")
 api_router.include_router(authentication_service_router)
 api_router.include_router(notification_service_router)
 api_router.include_router(defect_info_service_router)
+api_router.include_router(defect_feed_router)
 api_router.include_router(conveyor_info_service_router)
 api_router.include_router(logging_service_router)
 api_router.include_router(report_service_router)
 api_router.include_router(maintenance_service_router)
+api_router.include_router(health_service_router)
 
 application = FastAPI(lifespan=lifespan)
 application.include_router(api_router)
@@ -69,7 +141,9 @@ application.add_middleware(
     CORSMiddleware,
     allow_origins=origins,
     allow_methods=["*"],
-    allow_headers=["*"]
+    allow_headers=["*"],
+    # Filename of the downloaded report
+    expose_headers=["Content-Disposition"]
 )
 
 
@@ -1,4 +1,5 @@
 from datetime import datetime
+from typing import Literal
 
 from pydantic import BaseModel
 
@@ -35,6 +36,57 @@ class GmailNotificationResponseModel(BaseModel):
     attached_file: str | None
 
 
+class NotificationOutboxResponseModel(BaseModel):
+    pending: int
+    sending: int
+    delivered: int
+    split: int  # Telegram notifications replaced by the notifications of every chat
+    dead: int
+    oldest_pending_age_seconds: float | None
+    average_delivery_latency_seconds: float | None  # for the notifications delivered during the last hour
+    max_delivery_latency_seconds: float | None  # for the notifications delivered during the last hour
+
+
+class NotificationRateLimitResponseModel(BaseModel):
+    channel: str  # Telegram / Gmail
+    wait_seconds: float  # time until the next notification can be sent through the channel
+    recipients_wait_seconds: dict[str, float]  # only for the recipients which have to wait
+
+
+class SSEHubMetricsResponseModel(BaseModel):
+    name: str  # stream of the server-sent events (e.g. "events", "logs")
+    connected_clients: int
+    max_lag_events: int  # the most events waiting in the buffer of one client
+    published_events: int
+    dropped_events: int  # events lost by the slow clients because of the full buffer
+    disconnected_slow_clients: int
+
+
+class ConnectionPoolResponseModel(BaseModel):
+    size: int
+    checked_out: int  # connections in use
+    checked_in: int  # idle connections
+    overflow: int  # connections over the size of the pool
+
+
+class HealthResponseModel(BaseModel):
+    server: str
+    # Result of the database check shared by all requests (and its time)
+    is_database_available: bool
+    database_details: str | None
+    database_checked_at: datetime
+    is_leader_elected: bool | None  # None if the database is unavailable
+    waiting_notifications: int | None  # pending and sending notifications in the outbox
+    connection_pool: ConnectionPoolResponseModel
+    # State of the process which has handled the request (the new defects are listened only by the leader)
+    is_leader: bool
+    is_new_defect_listener_connected: bool
+    is_event_bus_connected: bool
+    new_defects_queue_size: int
+    # Interval of pushing the health to the clients of the event stream (they detect the missed updates by it)
+    health_push_interval_seconds: float
+
+
 class CountOfDefectGroupsResponseModel(BaseModel):
     total: int
     extreme: int
@@ -55,6 +107,27 @@ class DefectResponseModel(BaseModel):
     base64_photo: str  # from Photo model (converted to base64 format)
 
 
+class DefectDeltaResponseModel(BaseModel):
+    action: Literal["created", "criticality_changed", "deleted"]
+    defect: DefectResponseModel  # without photo (empty "base64_photo")
+    previous_criticality: str | None = None  # only for "criticality_changed"
+
+
+class DefectChangesResponseModel(BaseModel):
+    version: int  # the next changes are requested since this version
+    changed: list[DefectResponseModel]  # created or updated defects
+    deleted_ids: list[int]
+
+
+class DefectFeedFilters(BaseModel):
+    # None means any value
+    types: list[str] | None = None
+    criticalities: list[str] | None = None
+    # Segment of the belt ("longitudinal_position" of the defects)
+    min_longitudinal_position: int | None = None
+    max_longitudinal_position: int | None = None
+
+
 class TypesOfDefectsResponseModel(BaseModel):
     count: int
     types: list[str]
@@ -88,6 +161,23 @@ class AllLogsRemovingResponseModel(BaseModel):
     count_of_removed: int
 
 
+class DefectReportModel(BaseModel):
+    """
+    Defect passed to the report builders (the photo is raw, it is loaded only for the PDF-reports)
+    """
+    id: int
+    timestamp: datetime
+    type: str
+    is_on_belt: bool
+    box_width_in_mm: int
+    box_length_in_mm: int
+    longitudinal_position: int
+    transverse_position: int
+    probability: int
+    criticality: str
+    photo: bytes | None = None
+
+
 class AllDefectsReportResponseModel(BaseModel):
     doc_type: str  # pdf / csv
     timestamp: datetime
@@ -108,6 +198,18 @@ class ConveyorInfoReportResponseModel(BaseModel):
     status: str  # normal / extreme / critical
 
 
+class ReportJobResponseModel(BaseModel):
+    job_id: str
+    report: str  # all_defects / defect / conveyor
+    doc_type: str  # pdf / csv
+    parameters: dict
+    status: str  # queued / running / done / failed
+    error: str | None  # the report can be downloaded if the status is "done" (even if its sending has failed)
+    result: dict | None  # AllDefectsReportResponseModel, OneDefectReportResponseModel or ConveyorInfoReportResponseModel
+    created_at: datetime
+    finished_at: datetime | None
+
+
 class UserNotificationSettings(BaseModel):
     new_defect_notification_scope: list[str]
     report_sending_scope: list[str]
@@ -1,6 +1,7 @@
 from datetime import datetime, timezone
 
-from sqlmodel import SQLModel, Field, Column, Relationship, Integer, TEXT, DateTime, LargeBinary
+from sqlmodel import (SQLModel, Field, Column, Relationship, Integer, BigInteger, TEXT, DateTime, LargeBinary, Index,
+                      JSON)
 
 
 class ObjectType(SQLModel, table=True):
@@ -75,6 +76,11 @@ class Defect(SQLModel, table=True):
     probability: int = Field(nullable=False)
     is_critical: bool = Field(default=False, nullable=False)
     is_extreme: bool = Field(default=False, nullable=False)
+    # Copies of the "time" and "type" values from Object model (filled by trigger when denormalization is enabled)
+    time: datetime | None = Field(default=None, sa_column=Column(DateTime(timezone=False), index=True))
+    object_type: int | None = Field(default=None)
+    # Id of the transaction which has inserted or updated the defect last (set by the trigger)
+    change_version: int | None = Field(default=None, sa_column=Column(BigInteger, index=True))
 
     base_object: Object = Relationship(back_populates="defect")
     type_object: DefectType = Relationship(back_populates="defects")
@@ -119,6 +125,9 @@ class ConveyorStatus(SQLModel, table=True):
     id_obj: int = Field(foreign_key="objects.id", nullable=False, ondelete="CASCADE")
     is_critical: bool = Field(default=False, nullable=False)
     is_extreme: bool = Field(default=False, nullable=False)
+    # Copies of the "time" and "type" values from Object model (filled by trigger when denormalization is enabled)
+    time: datetime | None = Field(default=None, sa_column=Column(DateTime(timezone=False), index=True))
+    object_type: int | None = Field(default=None)
 
     base_object: Object = Relationship(back_populates="conveyor_status")
 
@@ -137,6 +146,10 @@ class Log(SQLModel, table=True):
     id_obj: int = Field(foreign_key="objects.id", nullable=False, ondelete="CASCADE")
     action: str = Field(nullable=False)
     type: int = Field(foreign_key="history_type.id", nullable=False, ondelete="CASCADE")
+    # Copies of the "time" and "type" values from Object model ("time" is the partition key of the table when
+    # partitioning is enabled and it is always set on the log record creation)
+    time: datetime | None = Field(default=None, sa_column=Column(DateTime(timezone=False), index=True))
+    object_type: int | None = Field(default=None)
 
     base_object: Object = Relationship(back_populates="log")
     type_object: LogType = Relationship(back_populates="logs")
@@ -160,3 +173,68 @@ class User(SQLModel, table=True):
     username: str = Field(nullable=False)
     role: str = Field(nullable=False)
     password: str = Field(nullable=False)
+
+
+class DefectTombstone(SQLModel, table=True):
+    """
+    Ids of the deleted defects for the clients synchronizing their copies of the defects (filled by the trigger)
+    """
+    __tablename__ = "defect_tombstones"
+    defect_id: int = Field(sa_column=Column(Integer, primary_key=True, nullable=False, autoincrement=False))
+    change_version: int = Field(sa_column=Column(BigInteger, nullable=False, index=True))
+
+
+class NotificationOutbox(SQLModel, table=True):
+    """
+    Notifications waiting for delivery via Telegram or Gmail by the outbox workers (with retries)
+    """
+    __tablename__ = "notification_outbox"
+    __table_args__ = (Index("ix_notification_outbox_status_next_attempt_at", "status", "next_attempt_at"),)
+    id: int = Field(sa_column=Column(Integer, primary_key=True, nullable=False, autoincrement=True))
+    # The same notification is enqueued only once (e.g. "new_defect:15:Telegram")
+    idempotency_key: str = Field(nullable=False, unique=True)
+    channel: str = Field(nullable=False)  # Telegram / Gmail
+    # Chat id for Telegram (notification without recipient is split into the notifications for every chat)
+    recipient: str | None = Field(default=None)
+    subject: str | None = Field(default=None, sa_column=Column(TEXT))
+    text: str = Field(sa_column=Column(TEXT, nullable=False))
+    attachment: bytes | None = Field(default=None, sa_column=Column(LargeBinary))
+    attachment_name: str | None = Field(default=None)
+    # Defect info (defect_id, criticality, header, text) of the notification which can be merged with other pending
+    # ones of the same channel and recipient into one digest at the delivery
+    digest_item: dict | None = Field(default=None, sa_column=Column(JSON(none_as_null=True)))
+    status: str = Field(default="pending", nullable=False)  # pending / sending / delivered / split / dead
+    attempts: int = Field(default=0, nullable=False)
+    last_error: str | None = Field(default=None, sa_column=Column(TEXT))
+    created_at: datetime = Field(sa_column=Column(DateTime(timezone=False), nullable=False))
+    next_attempt_at: datetime = Field(sa_column=Column(DateTime(timezone=False), nullable=False))
+    delivered_at: datetime | None = Field(default=None, sa_column=Column(DateTime(timezone=False)))
+
+
+class ReportJob(SQLModel, table=True):
+    """
+    Jobs of the report generation (the reports are built in the pool of processes, the clients read the status and
+    download the report by the id of the job from any process of the server)
+    """
+    __tablename__ = "report_jobs"
+    id: str = Field(sa_column=Column(TEXT, primary_key=True, nullable=False))  # UUID
+    report: str = Field(nullable=False)  # all_defects / defect / conveyor
+    doc_type: str = Field(nullable=False)  # pdf / csv
+    parameters: dict = Field(default_factory=dict, sa_column=Column(JSON, nullable=False))  # e.g. {"defect_id": 1}
+    status: str = Field(default="queued", nullable=False)  # queued / running / done / failed
+    # Error of the generation or of the sending of the generated report
+    error: str | None = Field(default=None, sa_column=Column(TEXT))
+    # Response model of the report (e.g. AllDefectsReportResponseModel)
+    result: dict | None = Field(default=None, sa_column=Column(JSON(none_as_null=True)))
+    created_at: datetime = Field(sa_column=Column(DateTime(timezone=False), nullable=False))
+    finished_at: datetime | None = Field(default=None, sa_column=Column(DateTime(timezone=False)))
+
+
+class ProcessedDefectsWatermark(SQLModel, table=True):
+    """
+    Id of the defect up to which all defects have been processed by the leader process (the only row has id=1), so
+    the next leader continues from it after the failover
+    """
+    __tablename__ = "processed_defects_watermark"
+    id: int = Field(sa_column=Column(Integer, primary_key=True, nullable=False))
+    last_defect_id: int = Field(nullable=False)
@@ -0,0 +1,91 @@
+"""
+Coalescing of the new defect notifications: a burst of defects found in the coalescing window is turned into one
+digest notification (summary and contact sheet of the photos) instead of a notification per defect. Notifications
+wait for the end of the window in the outbox (application/notification_outbox.py), so the digest is built from the
+outbox rows at the delivery and nothing is lost if the server is stopped during the window
+"""
+from dataclasses import dataclass
+from io import BytesIO
+from math import ceil
+
+from PIL import Image, ImageDraw, UnidentifiedImageError
+
+from .image_variants import get_image_variant
+from .models.db_models import NotificationOutbox
+
+CONTACT_SHEET_COLUMNS = 5
+CONTACT_SHEET_CELL_SIZE = (240, 180)
+CONTACT_SHEET_CAPTION_HEIGHT = 20
+# Caption of the document in Telegram is limited to 1024 characters
+TELEGRAM_CAPTION_LIMIT = 1024
+
+
+@dataclass
+class DefectNotification:
+    defect_id: int
+    criticality: str
+    header: str
+    text: str
+    photo: bytes
+
+
+def make_contact_sheet(notifications: list[DefectNotification]):
+    """
+    Grid of the defect photo thumbnails (cached variants of the photos) with defect ids in one JPEG image
+    """
+    cell_width, cell_height = CONTACT_SHEET_CELL_SIZE
+    columns = min(CONTACT_SHEET_COLUMNS, len(notifications))
+    rows = ceil(len(notifications) / columns)
+    row_height = cell_height + CONTACT_SHEET_CAPTION_HEIGHT
+    sheet = Image.new("RGB", (columns * cell_width, rows * row_height), "white")
+    draw = ImageDraw.Draw(sheet)
+
+    for index, notification in enumerate(notifications):
+        left, top = (index % columns) * cell_width, (index // columns) * row_height
+        try:
+            with Image.open(BytesIO(get_image_variant(notification.photo, "thumbnail"))) as photo:
+                photo = photo.convert("RGB")
+                photo.thumbnail(CONTACT_SHEET_CELL_SIZE)
+                sheet.paste(photo, (left + (cell_width - photo.width) // 2, top + (cell_height - photo.height) // 2))
+        except (UnidentifiedImageError, OSError):
+            draw.text((left + 10, top + cell_height // 2), "Corrupted photo", fill="red")
+        draw.text((left + 5, top + cell_height + 3), f"id={notification.defect_id} ({notification.criticality})",
+                  fill="black")
+
+    output = BytesIO()
+    sheet.save(output, format="JPEG", quality=80, optimize=True)
+    return output.getvalue()
+
+
+def form_digest(notifications: list[DefectNotification]):
+    """
+    Returns a tuple (<subject>, <full text>, <text shortened for Telegram caption>)
+    """
+    counts = {}
+    for notification in notifications:
+        counts[notification.criticality] = counts.get(notification.criticality, 0) + 1
+    subject = f"{len(notifications)} new defects on the conveyor!".upper()
+    summary = ", ".join(f"{count} {criticality}-level" for criticality, count in sorted(counts.items()))
+    lines = [f"{notification.header}\n{notification.text}" for notification in notifications]
+    text = f"Summary: {summary}. \n\n" + "\n\n".join(lines)
+
+    telegram_text = f"{subject} \n\nSummary: {summary}. \nDefect ids: "
+    ids = ", ".join(str(notification.defect_id) for notification in notifications)
+    if len(telegram_text) + len(ids) > TELEGRAM_CAPTION_LIMIT:
+        ids = ids[:TELEGRAM_CAPTION_LIMIT - len(telegram_text) - 3] + "..."
+    return subject, text, telegram_text + ids
+
+
+def form_digest_notification(notifications: list[NotificationOutbox]):
+    """
+    Digest of the outbox notifications of the same channel and recipient (it isn't stored in the outbox)
+    """
+    defect_notifications = [DefectNotification(photo=notification.attachment or b"", **notification.digest_item)
+                            for notification in notifications]
+    subject, text, telegram_text = form_digest(defect_notifications)
+    first_id, last_id = defect_notifications[0].defect_id, defect_notifications[-1].defect_id
+    channel = notifications[0].channel
+    return NotificationOutbox(idempotency_key=f"defect_digest:{first_id}-{last_id}:{channel}", channel=channel,
+                              recipient=notifications[0].recipient, subject=subject,
+                              text=telegram_text if channel == "Telegram" else text,
+                              attachment=make_contact_sheet(defect_notifications), attachment_name="Defects.jpg")
@@ -0,0 +1,202 @@
+"""
+DB-backed outbox of the notifications: producers enqueue notifications and the workers
+(application/notification_workers.py) claim and deliver them with retries
+"""
+from datetime import datetime, timedelta
+import random
+
+from sqlalchemy import Connection
+from sqlalchemy.dialects.postgresql import insert
+from sqlmodel import Session, select, func, col, delete, update, or_
+
+from .config import settings
+from .db_connection import engine
+from .models.db_models import NotificationOutbox
+from .models.api_models import NotificationOutboxResponseModel
+
+# Delivery which is not finished in this time (e.g. the server was stopped) is retried by another worker
+DELIVERY_LEASE = timedelta(minutes=5)
+DELIVERED_NOTIFICATIONS_RETENTION = timedelta(days=7)
+
+
+def get_pending_digest_items_condition(channel: str, recipient: str | None):
+    """
+    Notifications which haven't been delivered yet and can be merged into the digest of the channel and recipient
+    """
+    columns = NotificationOutbox.__table__.c
+    return (columns.status == "pending", columns.digest_item.is_not(None), columns.channel == channel,
+            columns.recipient.is_not_distinct_from(recipient))
+
+
+def get_digest_window_end(connection: Connection, channel: str, recipient: str | None, now: datetime):
+    """
+    The window is started by the first notification waiting for the digest
+    """
+    # pylint: disable=E1102
+    window_end = connection.execute(
+        select(func.min(NotificationOutbox.next_attempt_at))
+        .where(*get_pending_digest_items_condition(channel, recipient), NotificationOutbox.attempts == 0)).scalar()
+    return window_end or now + timedelta(seconds=settings.notification_coalescing_window_seconds)
+
+
+def release_full_digest(connection: Connection, channel: str, recipient: str | None, now: datetime):
+    """
+    Full digest is delivered without waiting for the end of the window
+    """
+    # pylint: disable=E1102
+    waiting_items = (*get_pending_digest_items_condition(channel, recipient), NotificationOutbox.attempts == 0,
+                     NotificationOutbox.next_attempt_at > now)
+    count_of_waiting = connection.execute(select(func.count()).where(*waiting_items)).scalar()
+    if count_of_waiting >= settings.notification_coalescing_max_batch_size:
+        connection.execute(update(NotificationOutbox).where(*waiting_items).values(next_attempt_at=now))
+
+
+def enqueue_notification(idempotency_key: str, channel: str, text: str, subject: str | None = None,
+                         attachment: bytes | None = None, attachment_name: str | None = None,
+                         recipient: str | None = None, digest_item: dict | None = None):
+    """
+    Add notification to the outbox (the notification with the same idempotency key is not added again).
+    Notification with the digest item waits for the end of the coalescing window and is delivered in one digest
+    with the other notifications of the window. Returns True if the notification was added
+    """
+    # pylint: disable=R0913,R0917
+    now = datetime.now()
+    with engine.begin() as connection:
+        statement = insert(NotificationOutbox).values(
+            idempotency_key=idempotency_key, channel=channel, recipient=recipient, subject=subject, text=text,
+            attachment=attachment, attachment_name=attachment_name, digest_item=digest_item, status="pending",
+            attempts=0, created_at=now,
+            next_attempt_at=now if digest_item is None else get_digest_window_end(connection, channel, recipient, now)
+        ).on_conflict_do_nothing(index_elements=["idempotency_key"])
+        is_added = connection.execute(statement).rowcount > 0
+        if is_added and digest_item is not None:
+            release_full_digest(connection, channel, recipient, now)
+        return is_added
+
+
+def claim_due_notifications():
+    """
+    Take the next notification which has to be delivered now together with the other pending notifications which
+    can be merged with it into one digest (the new ones and the due retries), concurrent workers skip locked rows.
+    Returns an empty list if there are no due notifications
+    """
+    now = datetime.now()
+    with Session(engine) as session:
+        notification = session.exec(
+            select(NotificationOutbox)
+            .where(col(NotificationOutbox.status).in_(["pending", "sending"]),
+                   NotificationOutbox.next_attempt_at <= now)
+            .order_by(NotificationOutbox.next_attempt_at)
+            .limit(1)
+            .with_for_update(skip_locked=True)).first()
+        if not notification:
+            return []
+
+        notifications = [notification]
+        if notification.digest_item is not None:
+            notifications += session.exec(
+                select(NotificationOutbox)
+                .where(*get_pending_digest_items_condition(notification.channel, notification.recipient),
+                       NotificationOutbox.id != notification.id,
+                       or_(NotificationOutbox.attempts == 0, NotificationOutbox.next_attempt_at <= now))
+                .order_by(NotificationOutbox.id)
+                .limit(settings.notification_coalescing_max_batch_size - 1)
+                .with_for_update(skip_locked=True)).all()
+            notifications.sort(key=lambda claimed_notification: claimed_notification.id)
+
+        for claimed_notification in notifications:
+            claimed_notification.status = "sending"
+            claimed_notification.attempts += 1
+            claimed_notification.next_attempt_at = now + DELIVERY_LEASE
+            session.add(claimed_notification)
+        session.commit()
+        for claimed_notification in notifications:
+            session.refresh(claimed_notification)
+            session.expunge(claimed_notification)
+        return notifications
+
+
+def mark_notifications_delivered(notification_ids: list[int]):
+    with Session(engine) as session:
+        session.exec(update(NotificationOutbox).where(NotificationOutbox.__table__.c.id.in_(notification_ids))
+                     .values(status="delivered", delivered_at=datetime.now(), last_error=None))
+        session.commit()
+
+
+def mark_notifications_split(notification_ids: list[int]):
+    """
+    Telegram notifications without recipient are replaced by the notifications of every chat, so they aren't counted
+    as the delivered ones (but are purged together with them)
+    """
+    with Session(engine) as session:
+        session.exec(update(NotificationOutbox).where(NotificationOutbox.__table__.c.id.in_(notification_ids))
+                     .values(status="split", delivered_at=datetime.now(), last_error=None))
+        session.commit()
+
+
+def mark_notification_failed(notification: NotificationOutbox, error: str):
+    """
+    Schedule the next attempt with exponential backoff or move the notification to the dead letters.
+    Returns True if the notification became dead
+    """
+    is_dead = notification.attempts >= settings.notification_max_attempts
+    delay = min(settings.notification_retry_base_seconds * 2 ** (notification.attempts - 1),
+                settings.notification_retry_max_seconds)
+    # Jitter prevents simultaneous retries of the notifications failed at the same time
+    delay *= random.uniform(0.8, 1.2)
+    with Session(engine) as session:
+        session.exec(update(NotificationOutbox).where(NotificationOutbox.id == notification.id)
+                     .values(status="dead" if is_dead else "pending", last_error=error,
+                             next_attempt_at=datetime.now() + timedelta(seconds=delay)))
+        session.commit()
+    return is_dead
+
+
+def requeue_dead_notifications():
+    with Session(engine) as session:
+        result = session.exec(update(NotificationOutbox).where(NotificationOutbox.status == "dead")
+                              .values(status="pending", attempts=0, next_attempt_at=datetime.now()))
+        session.commit()
+        return result.rowcount
+
+
+def purge_delivered_notifications():
+    with Session(engine) as session:
+        session.exec(delete(NotificationOutbox).where(
+            NotificationOutbox.__table__.c.status.in_(["delivered", "split"]),
+            NotificationOutbox.delivered_at < datetime.now() - DELIVERED_NOTIFICATIONS_RETENTION))
+        session.commit()
+
+
+def get_count_of_waiting_notifications():
+    # pylint: disable=E1101,E1102
+    with Session(engine) as session:
+        return session.exec(select(func.count()).select_from(NotificationOutbox)
+                            .where(col(NotificationOutbox.status).in_(["pending", "sending"]))).one()
+
+
+def get_notification_outbox_statistics():
+    # pylint: disable=E1101,E1102
+    now = datetime.now()
+    with Session(engine) as session:
+        counts = dict(session.exec(select(NotificationOutbox.status, func.count())
+                                   .group_by(NotificationOutbox.status)).all())
+        oldest_pending_time = session.exec(
+            select(func.min(NotificationOutbox.created_at))
+            .where(col(NotificationOutbox.status).in_(["pending", "sending"]))).one()
+        latency = func.extract("epoch", NotificationOutbox.delivered_at - NotificationOutbox.created_at)
+        average_latency, max_latency = session.exec(
+            select(func.avg(latency), func.max(latency))
+            .where(NotificationOutbox.status == "delivered",
+                   NotificationOutbox.delivered_at >= now - timedelta(hours=1))).one()
+
+    return NotificationOutboxResponseModel(
+        pending=counts.get("pending", 0),
+        sending=counts.get("sending", 0),
+        delivered=counts.get("delivered", 0),
+        split=counts.get("split", 0),
+        dead=counts.get("dead", 0),
+        oldest_pending_age_seconds=(now - oldest_pending_time).total_seconds() if oldest_pending_time else None,
+        average_delivery_latency_seconds=float(average_latency) if average_latency is not None else None,
+        max_delivery_latency_seconds=float(max_latency) if max_latency is not None else None
+    )
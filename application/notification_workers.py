@@ -0,0 +1,119 @@
+"""
+Pool of asyncio workers delivering notifications from the outbox, so that a slow or failing provider doesn't stall
+the processing of new defects
+"""
+import asyncio
+import json
+from io import BytesIO
+
+from fastapi.concurrency import run_in_threadpool
+
+from application.services.notification_service import (get_telegram_recipients,
+                                                       send_telegram_notification_to_chat_from_server,
+                                                       send_gmail_notification_from_server)
+from application.services.maintenance_service import notify_clients
+
+from .config import settings
+from .notification_outbox import (enqueue_notification, claim_due_notifications, mark_notifications_delivered,
+                                  mark_notifications_split, mark_notification_failed, purge_delivered_notifications)
+from .notification_coalescer import form_digest_notification
+from .models.db_models import NotificationOutbox
+
+# Period of checking the outbox for the notifications to retry when there are no new ones
+POLLING_INTERVAL_SECONDS = 2
+PURGE_INTERVAL_SECONDS = 3600
+
+# Set after enqueueing to wake up the idle workers immediately
+new_notifications_event = asyncio.Event()
+
+
+def is_notification_to_split(notification: NotificationOutbox):
+    return notification.channel == "Telegram" and notification.recipient is None
+
+
+async def split_telegram_notification_by_recipients(notification: NotificationOutbox):
+    """
+    Enqueue the copy of the notification for every registered chat, so that every chat has its own retries.
+    Returns None on success or the error details
+    """
+    recipients, error_type = await get_telegram_recipients()
+    if not recipients:
+        return error_type.value
+    for chat_id in recipients:
+        await run_in_threadpool(enqueue_notification, idempotency_key=f"{notification.idempotency_key}:{chat_id}",
+                                channel=notification.channel, recipient=chat_id, subject=notification.subject,
+                                text=notification.text, attachment=notification.attachment,
+                                attachment_name=notification.attachment_name)
+    new_notifications_event.set()
+    return None
+
+
+async def deliver_notification(notification: NotificationOutbox):
+    """
+    Returns None on successful delivery or the error details
+    """
+    if is_notification_to_split(notification):
+        return await split_telegram_notification_by_recipients(notification)
+
+    io_file = None
+    if notification.attachment is not None:
+        io_file = BytesIO(notification.attachment)
+        io_file.name = notification.attachment_name
+
+    if notification.channel == "Telegram":
+        _, details = await send_telegram_notification_to_chat_from_server(notification.recipient, notification.text,
+                                                                          io_file=io_file)
+    else:
+        _, details = await send_gmail_notification_from_server(notification.subject or "", notification.text,
+                                                               io_file=io_file)
+    return details
+
+
+async def notification_worker():
+    while True:
+        claimed_notifications = await run_in_threadpool(claim_due_notifications)
+        if not claimed_notifications:
+            new_notifications_event.clear()
+            try:
+                await asyncio.wait_for(new_notifications_event.wait(), timeout=POLLING_INTERVAL_SECONDS)
+            except asyncio.TimeoutError:
+                pass
+            continue
+
+        try:
+            if len(claimed_notifications) == 1:
+                notification = claimed_notifications[0]
+            else:
+                notification = await run_in_threadpool(form_digest_notification, claimed_notifications)
+            details = await deliver_notification(notification)
+        except Exception as e:  # pylint: disable=W0718
+            notification, details = claimed_notifications[0], f"Unexpected error: {e!r}"
+
+        if details is None:
+            mark_notifications = (mark_notifications_split if is_notification_to_split(notification)
+                                  else mark_notifications_delivered)
+            await run_in_threadpool(mark_notifications,
+                                    [claimed_notification.id for claimed_notification in claimed_notifications])
+            continue
+
+        count_of_dead = 0
+        for claimed_notification in claimed_notifications:
+            count_of_dead += await run_in_threadpool(mark_notification_failed, claimed_notification, str(details))
+        if count_of_dead:
+            await notify_clients(json.dumps({
+                "title": f"{notification.channel} notification was not delivered".upper(),
+                "text": f"Delivery of {count_of_dead} notification(s) failed after "
+                        f"{settings.notification_max_attempts} attempts. \n"
+                        f"Error info: {details}. \n\n"
+                        f"Notification info: \n{notification.subject or ''}\n{notification.text}"}))
+
+
+async def purge_delivered_notifications_periodically():
+    while True:
+        await run_in_threadpool(purge_delivered_notifications)
+        await asyncio.sleep(PURGE_INTERVAL_SECONDS)
+
+
+async def run_notification_workers():
+    await asyncio.gather(purge_delivered_notifications_periodically(),
+                         *(notification_worker() for _ in range(settings.notification_workers)))
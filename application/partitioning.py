@@ -0,0 +1,332 @@
+"""
+Optional monthly range partitioning of the "objects" and "history" tables on the "time" column
+and archival of old partitions to compressed files on the local disk.
+
+Queries with the period (/by_period, /filtered, export of the logs) read only the partitions of the period. Lookups of
+the base objects by id can't be pruned (the time isn't known), so they check the index of every partition; with
+DENORMALIZED_TIMESTAMPS enabled the defects and the log records are read without their base objects, so the hot
+queries don't touch "objects" at all.
+
+Usage from the root of the project:
+    python -m application.partitioning enable
+    python -m application.partitioning archive --before 2025-01-01
+    python -m application.partitioning restore --month 2024-12
+"""
+import argparse
+import asyncio
+import gzip
+import re
+import shutil
+from datetime import date, datetime
+from pathlib import Path
+
+from fastapi.concurrency import run_in_threadpool
+from sqlalchemy import Connection
+from sqlmodel import text
+
+from .config import settings
+from .db_connection import engine
+
+PARTITIONED_TABLES = ("objects", "history")
+# Count of monthly partitions created in advance so that new rows don't fall into the default partition
+PARTITIONS_CREATED_AHEAD = 3
+PARTITIONS_CHECK_INTERVAL_SECONDS = 24 * 3600
+ARCHIVE_DIRECTORY = Path(settings.partition_archive_directory)
+
+PARTITIONED_TABLES_DDL = {
+    "objects":
+        """
+        CREATE TABLE objects_partitioned (
+            id INTEGER NOT NULL DEFAULT nextval('objects_id_seq'),
+            type INTEGER NOT NULL REFERENCES object_type (id) ON DELETE CASCADE,
+            time TIMESTAMP WITHOUT TIME ZONE NOT NULL,
+            CONSTRAINT objects_partitioned_pkey PRIMARY KEY (id, time)
+        ) PARTITION BY RANGE (time);
+        """,
+    "history":
+        """
+        CREATE TABLE history_partitioned (
+            id INTEGER NOT NULL DEFAULT nextval('history_id_seq'),
+            id_obj INTEGER NOT NULL,
+            action VARCHAR NOT NULL,
+            type INTEGER NOT NULL REFERENCES history_type (id) ON DELETE CASCADE,
+            time TIMESTAMP WITHOUT TIME ZONE NOT NULL,
+            object_type INTEGER,
+            CONSTRAINT history_partitioned_pkey PRIMARY KEY (id, time)
+        ) PARTITION BY RANGE (time);
+        """
+}
+
+PARTITIONED_TABLES_COPYING = {
+    "objects": "INSERT INTO objects_partitioned (id, type, time) "
+               "SELECT id, type, COALESCE(time, LOCALTIMESTAMP) FROM objects;",
+    "history": "INSERT INTO history_partitioned (id, id_obj, action, type, time, object_type) "
+               "SELECT history.id, history.id_obj, history.action, history.type, "
+               "COALESCE(history.time, objects.time, LOCALTIMESTAMP), history.object_type "
+               "FROM history LEFT JOIN objects ON objects.id = history.id_obj;"
+}
+
+# Rows of the tables referencing "objects" are archived together with the partition of their base objects
+# (defects are also archived with their photos because of the cascade foreign key)
+ARCHIVED_PHOTO_IDS = "SELECT id FROM photo WHERE obj_id IN (SELECT id FROM {partition})"
+ARCHIVED_DEFECT_IDS = ("SELECT id FROM defects WHERE obj_id IN (SELECT id FROM {partition}) "
+                       "OR photo_id IN (" + ARCHIVED_PHOTO_IDS + ")")
+DEPENDENT_ROWS_SELECTION = {
+    "photo": "SELECT * FROM photo WHERE id IN (" + ARCHIVED_PHOTO_IDS + ")",
+    "defects": "SELECT * FROM defects WHERE id IN (" + ARCHIVED_DEFECT_IDS + ")",
+    "state_of_conv": "SELECT * FROM state_of_conv WHERE id_obj IN (SELECT id FROM {partition})",
+    "relation": "SELECT * FROM relation WHERE id_current IN (" + ARCHIVED_DEFECT_IDS + ") "
+                "OR id_previous IN (" + ARCHIVED_DEFECT_IDS + ")"
+}
+
+
+def _first_day_of_month(day: date):
+    return date(day.year, day.month, 1)
+
+
+def _shift_month(month: date, count: int):
+    month_index = month.year * 12 + month.month - 1 + count
+    return date(month_index // 12, month_index % 12 + 1, 1)
+
+
+def _partition_name(table: str, month: date):
+    return f"{table}_{month.year:04d}_{month.month:02d}"
+
+
+def is_partitioned(connection: Connection, table: str):
+    return connection.execute(text("SELECT 1 FROM pg_partitioned_table JOIN pg_class "
+                                   "ON pg_class.oid = pg_partitioned_table.partrelid "
+                                   "WHERE pg_class.relname = :table"), {"table": table}).first() is not None
+
+
+def get_monthly_partitions(connection: Connection, table: str):
+    """
+    Returns the dictionary {<first day of month>: <partition name>} of the attached monthly partitions
+    """
+    partition_names = connection.execute(text("SELECT child.relname FROM pg_inherits "
+                                              "JOIN pg_class parent ON parent.oid = pg_inherits.inhparent "
+                                              "JOIN pg_class child ON child.oid = pg_inherits.inhrelid "
+                                              "WHERE parent.relname = :table"), {"table": table}).scalars().all()
+    partitions = {}
+    for partition_name in partition_names:
+        match = re.fullmatch(rf"{table}_(\d{{4}})_(\d{{2}})", partition_name)
+        if match:
+            partitions[date(int(match.group(1)), int(match.group(2)), 1)] = partition_name
+    return partitions
+
+
+def create_monthly_partition(connection: Connection, table: str, month: date, parent: str | None = None):
+    """
+    Partition can't be created while the default partition contains rows of its month, so in this case the default
+    partition is detached for a moment and its rows of the month are moved to the new partition
+    """
+    parent = parent or table
+    partition_name = _partition_name(table, month)
+    if connection.execute(text("SELECT to_regclass(:name)"), {"name": partition_name}).scalar() is not None:
+        return partition_name
+
+    month_range = f"time >= '{month.isoformat()}' AND time < '{_shift_month(month, 1).isoformat()}'"
+    default_partition = f"{table}_default"
+    has_rows_in_default = connection.execute(text(f"SELECT 1 FROM {default_partition} WHERE {month_range} "
+                                                  f"LIMIT 1")).first() is not None
+    if has_rows_in_default:
+        connection.execute(text(f"ALTER TABLE {parent} DETACH PARTITION {default_partition}"))
+    connection.execute(text(f"CREATE TABLE {partition_name} PARTITION OF {parent} "
+                            f"FOR VALUES FROM ('{month.isoformat()}') TO ('{_shift_month(month, 1).isoformat()}')"))
+    if has_rows_in_default:
+        connection.execute(text(f"INSERT INTO {partition_name} SELECT * FROM {default_partition} WHERE {month_range}"))
+        connection.execute(text(f"DELETE FROM {default_partition} WHERE {month_range}"))
+        connection.execute(text(f"ALTER TABLE {parent} ATTACH PARTITION {default_partition} DEFAULT"))
+    return partition_name
+
+
+def create_upcoming_partitions():
+    """
+    Create partitions for the current month and several months ahead (does nothing when partitioning is disabled)
+    """
+    current_month = _first_day_of_month(date.today())
+    with engine.begin() as connection:
+        for table in PARTITIONED_TABLES:
+            if not is_partitioned(connection, table):
+                continue
+            for shift in range(PARTITIONS_CREATED_AHEAD + 1):
+                create_monthly_partition(connection, table, _shift_month(current_month, shift))
+
+
+async def create_upcoming_partitions_periodically():
+    """
+    Background task keeping the partitions created ahead while the server works for months without restart
+    """
+    while True:
+        await run_in_threadpool(create_upcoming_partitions)
+        await asyncio.sleep(PARTITIONS_CHECK_INTERVAL_SECONDS)
+
+
+def enable_partitioning(connection: Connection):
+    """
+    Convert "objects" and "history" tables into tables partitioned by month with preserving of existing rows.
+    Foreign keys referencing "objects" are dropped because partitioned table can't have unique "id" column alone,
+    so cascade deletion of the dependent rows is done by the ORM relationships. Triggers of the tables (e.g. for
+    the notifications about new log records) are re-created on the partitioned tables.
+    Returns the list of the dropped foreign keys as "<table>.<constraint>"
+    """
+    current_month = _first_day_of_month(date.today())
+    dropped_foreign_keys = []
+    for table in PARTITIONED_TABLES:
+        if is_partitioned(connection, table):
+            continue
+
+        first_time = connection.execute(text("SELECT MIN(time) FROM objects")).scalar()
+        first_month = _first_day_of_month(first_time) if first_time else current_month
+
+        connection.execute(text(f"ALTER SEQUENCE {table}_id_seq OWNED BY NONE"))
+        connection.execute(text(PARTITIONED_TABLES_DDL[table]))
+        connection.execute(text(f"CREATE TABLE {table}_default PARTITION OF {table}_partitioned DEFAULT"))
+        month = first_month
+        while month <= _shift_month(current_month, PARTITIONS_CREATED_AHEAD):
+            create_monthly_partition(connection, table, month, parent=f"{table}_partitioned")
+            month = _shift_month(month, 1)
+
+        connection.execute(text(PARTITIONED_TABLES_COPYING[table]))
+        trigger_definitions = connection.execute(text(
+            "SELECT pg_get_triggerdef(oid) FROM pg_trigger WHERE tgrelid = CAST(:table AS regclass) "
+            "AND NOT tgisinternal"), {"table": table}).scalars().all()
+        # Foreign keys are dropped explicitly, any other dependent object (e.g. view) stops the conversion
+        foreign_keys = connection.execute(text(
+            "SELECT conrelid::regclass::TEXT, conname FROM pg_constraint WHERE confrelid = CAST(:table AS regclass) "
+            "AND contype = 'f' AND conrelid <> confrelid"), {"table": table}).all()
+        for referencing_table, constraint in foreign_keys:
+            connection.execute(text(f"ALTER TABLE {referencing_table} DROP CONSTRAINT {constraint}"))
+            dropped_foreign_keys.append(f"{referencing_table}.{constraint}")
+        connection.execute(text(f"DROP TABLE {table}"))
+        connection.execute(text(f"ALTER TABLE {table}_partitioned RENAME TO {table}"))
+        connection.execute(text(f"ALTER TABLE {table} RENAME CONSTRAINT {table}_partitioned_pkey TO {table}_pkey"))
+        connection.execute(text(f"ALTER SEQUENCE {table}_id_seq OWNED BY {table}.id"))
+        for trigger_definition in trigger_definitions:
+            connection.execute(text(trigger_definition))
+    connection.execute(text("CREATE INDEX IF NOT EXISTS ix_history_time ON history (time)"))
+    return dropped_foreign_keys
+
+
+def _copy_query_to_file(cursor, query: str, path: Path):
+    with gzip.open(path, "wt", encoding="utf-8") as file:
+        cursor.copy_expert(f"COPY ({query}) TO STDOUT WITH (FORMAT csv, HEADER)", file)
+
+
+def _copy_file_to_table(cursor, path: Path, table: str):
+    with gzip.open(path, "rt", encoding="utf-8") as file:
+        # Explicit column list keeps archives restorable after new columns are added to the table
+        columns = file.readline().strip()
+        cursor.copy_expert(f"COPY {table} ({columns}) FROM STDIN WITH (FORMAT csv)", file)
+
+
+def archive_partition(month: date):
+    """
+    Detach partitions of the "objects" and "history" tables for the month and export them with all dependent rows
+    to the compressed csv-files in the archive directory, after that the detached partitions are dropped
+    """
+    archive_path = ARCHIVE_DIRECTORY / _partition_name("objects", month)
+    archive_path.mkdir(parents=True, exist_ok=True)
+    objects_partition = _partition_name("objects", month)
+
+    try:
+        with engine.begin() as connection:
+            cursor = connection.connection.cursor()
+            for table, query in DEPENDENT_ROWS_SELECTION.items():
+                _copy_query_to_file(cursor, query.format(partition=objects_partition), archive_path / f"{table}.csv.gz")
+
+            for table in PARTITIONED_TABLES:
+                partition_name = _partition_name(table, month)
+                connection.execute(text(f"ALTER TABLE {table} DETACH PARTITION {partition_name}"))
+                _copy_query_to_file(cursor, f"SELECT * FROM {partition_name}", archive_path / f"{table}.csv.gz")
+
+            # Relations are removed by the cascade deletion of defects
+            for table in ("state_of_conv", "defects", "photo"):
+                selection = DEPENDENT_ROWS_SELECTION[table].format(partition=objects_partition)
+                connection.execute(text(f"DELETE FROM {table} WHERE id IN (SELECT id FROM ({selection}) AS archived)"))
+            for table in PARTITIONED_TABLES:
+                connection.execute(text(f"DROP TABLE {_partition_name(table, month)}"))
+    except Exception:
+        shutil.rmtree(archive_path, ignore_errors=True)
+        raise
+    return archive_path
+
+
+def archive_partitions_older_than(boundary: date):
+    """
+    Archive all monthly partitions which contain only rows older than the boundary date
+    """
+    with engine.connect() as connection:
+        months = [month for month in get_monthly_partitions(connection, "objects")
+                  if _shift_month(month, 1) <= boundary]
+    return [archive_partition(month) for month in sorted(months)]
+
+
+def restore_archived_partition(month: date):
+    """
+    Re-attach the archived partitions of the month (e.g. for investigations) and restore all dependent rows.
+    Archive files are kept, so the month can be archived again after the investigation.
+    """
+    archive_path = ARCHIVE_DIRECTORY / _partition_name("objects", month)
+    if not archive_path.exists():
+        raise FileNotFoundError(f"There is no archive for {month.strftime('%m.%Y')} in {ARCHIVE_DIRECTORY}")
+
+    with engine.begin() as connection:
+        cursor = connection.connection.cursor()
+        for table in PARTITIONED_TABLES:
+            partition_name = _partition_name(table, month)
+            connection.execute(text(f"CREATE TABLE {partition_name} (LIKE {table} INCLUDING DEFAULTS)"))
+            _copy_file_to_table(cursor, archive_path / f"{table}.csv.gz", partition_name)
+            connection.execute(text(f"ALTER TABLE {table} ATTACH PARTITION {partition_name} FOR VALUES FROM "
+                                    f"('{month.isoformat()}') TO ('{_shift_month(month, 1).isoformat()}')"))
+
+        # Restored defects must not be treated as new ones by the notification trigger. The other triggers stay
+        # enabled: restored defects get the new change version (so the synchronized clients receive them again)
+        # and the denormalized time and type of their base objects
+        has_notify_trigger = connection.execute(text(
+            "SELECT 1 FROM pg_trigger WHERE tgrelid = CAST('defects' AS regclass) "
+            "AND tgname = 'trigger_on_new_defect'")).first() is not None
+        if has_notify_trigger:
+            connection.execute(text("ALTER TABLE defects DISABLE TRIGGER trigger_on_new_defect"))
+        for table in ("photo", "defects", "state_of_conv"):
+            _copy_file_to_table(cursor, archive_path / f"{table}.csv.gz", table)
+        if has_notify_trigger:
+            connection.execute(text("ALTER TABLE defects ENABLE TRIGGER trigger_on_new_defect"))
+        # Restored defects aren't deleted for the synchronized clients anymore
+        connection.execute(text("DELETE FROM defect_tombstones WHERE defect_id IN (SELECT id FROM defects)"))
+
+        # Relations with defects which are still archived (in other months) can't be restored
+        connection.execute(text("CREATE TEMPORARY TABLE relation_restoring (LIKE relation) ON COMMIT DROP"))
+        _copy_file_to_table(cursor, archive_path / "relation.csv.gz", "relation_restoring")
+        connection.execute(text("INSERT INTO relation SELECT * FROM relation_restoring "
+                                "WHERE id_current IN (SELECT id FROM defects) AND id_previous IN "
+                                "(SELECT id FROM defects) ON CONFLICT DO NOTHING"))
+    return archive_path
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Monthly partitioning and archival of the objects and history tables")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    subparsers.add_parser("enable", help="convert objects and history tables into the partitioned ones")
+    archive_parser = subparsers.add_parser("archive", help="archive partitions older than the date")
+    archive_parser.add_argument("--before", required=True, type=date.fromisoformat, help="date as YYYY-MM-DD")
+    restore_parser = subparsers.add_parser("restore", help="re-attach archived partitions of the month")
+    restore_parser.add_argument("--month", required=True, type=lambda value: datetime.strptime(value, "%Y-%m").date(),
+                                help="month as YYYY-MM")
+    arguments = parser.parse_args()
+
+    if arguments.command == "enable":
+        with engine.begin() as connection:
+            dropped_foreign_keys = enable_partitioning(connection)
+        print("Tables objects and history are partitioned by month")
+        if dropped_foreign_keys:
+            print(f"Dropped foreign keys referencing objects: {", ".join(dropped_foreign_keys)}")
+    elif arguments.command == "archive":
+        for archive_path in archive_partitions_older_than(arguments.before):
+            print(f"Archived to {archive_path}")
+    elif arguments.command == "restore":
+        print(f"Restored from {restore_archived_partition(arguments.month)}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,224 @@
+"""
+Building of the PDF- and CSV-reports from the data gathered by the report service. The functions are run in the pool
+of processes, so they don't use the database, get only picklable arguments and return the content of the report
+as bytes built in memory (errors are raised as ReportBuildingError and logged by the report service)
+"""
+from datetime import datetime
+from io import BytesIO
+
+import PIL
+
+from reportlab.lib.colors import Color
+from reportlab.lib.pagesizes import A4, landscape
+from reportlab.platypus import SimpleDocTemplate, Table, TableStyle, Paragraph, Image, ListFlowable, Spacer
+from reportlab.lib import colors
+from reportlab.lib.styles import getSampleStyleSheet, ParagraphStyle
+
+from .image_variants import get_image_variant, choose_variant_for_size
+from .models.api_models import (DefectReportModel, ConveyorParametersResponseModel, ConveyorStatusResponseModel,
+                                CountOfDefectGroupsResponseModel)
+
+
+class ReportBuildingError(Exception):
+    pass
+
+
+def format_defects_to_display_in_table(defects: list[DefectReportModel], photo_size: (int, int)):
+    """
+    Parse array of defects into list of lists with values only.
+    Also format timestamp value to readable format and replace raw photo with the image in DefectReportModel obj
+    (the cached variant of the photo with the resolution enough for the given size is embedded instead of original)
+    """
+    photo_variant = choose_variant_for_size(*photo_size)
+    table_values = [list(defect.model_dump().values()) for defect in defects]
+    for defect_values in table_values:
+        timestamp = datetime.fromisoformat(str(defect_values[1]))
+        defect_values[1] = timestamp.strftime("%d.%m.%Y\n%H:%M:%S")
+        try:
+            image_buffer = BytesIO(get_image_variant(defect_values[-1], photo_variant))
+            image = Image(image_buffer, width=photo_size[0], height=photo_size[1])
+        except (PIL.UnidentifiedImageError, OSError, TypeError) as e:
+            raise ReportBuildingError("Unidentified image error: raw representation of the photo is not bytes or has "
+                                      "corrupted bytes sequence") from e
+        defect_values[-1] = image
+    return table_values
+
+
+def render_table_of_defects(table: Table, table_data: list):
+    """
+    Render base table style using TableStyle object.
+    Also apply TableStyle object to table lines with extreme and critical defects
+    """
+    table.setStyle(TableStyle([
+        ('BACKGROUND', (0, 0), (-1, 0), colors.grey),
+        ('BACKGROUND', (0, 1), (-1, -1), colors.white),
+        ('TEXTCOLOR', (0, 0), (-1, 0), colors.black),
+        ('ALIGN', (0, 0), (-1, -1), 'CENTER'),
+        ('VALIGN', (0, 0), (-1, -1), 'MIDDLE'),
+        ('GRID', (0, 0), (-1, -1), 1, colors.black)
+    ]))
+
+    for i, _ in enumerate(table_data):
+        if table_data[i][9] == "extreme":
+            table.setStyle(TableStyle([
+                ('BACKGROUND', (0, i), (-1, i), colors.orange),
+            ]))
+        elif table_data[i][9] == "critical":
+            table.setStyle(TableStyle([
+                ('BACKGROUND', (0, i), (-1, i), colors.red),
+            ]))
+
+
+def convert_color_to_hex(color: Color):
+    r = int(color.red * 255)
+    g = int(color.green * 255)
+    b = int(color.blue * 255)
+    return f"#{r:02X}{g:02X}{b:02X}"
+
+
+def build_pdf_report_of_all_defects(all_defects: list[DefectReportModel], extreme_count: int, critical_count: int):
+    output = BytesIO()
+    report_doc = SimpleDocTemplate(output, pagesize=landscape(A4))
+
+    # Paragraph style for header text line break
+    header_style = getSampleStyleSheet()["Normal"]
+    table_headers = ["ID", "Timestamp", "Type", Paragraph("Is on belt", header_style),
+                     Paragraph("Box width (mm)", header_style), Paragraph("Box length (mm)", header_style),
+                     Paragraph("Longitudinal position (mm)", header_style),
+                     Paragraph("Transverse position (mm)", header_style), "Probability", "Criticality", "Photo"]
+    table_values = format_defects_to_display_in_table(all_defects, (133, 100))
+    table_data = [table_headers] + table_values
+    table = Table(table_data, colWidths=[20, 75, 75, 40, 75, 75, 75, 75, 50, 50, 133],
+                  rowHeights=[30] + [100] * len(table_values))
+    render_table_of_defects(table, table_data)
+
+    title_style = getSampleStyleSheet()["Title"]
+    title_style.fontSize = 24
+    title_style.alignment = 1
+    title_style.spaceAfter = 16
+    title = Paragraph(f"REPORT ABOUT DEFECTS ({datetime.now().strftime("%d.%m.%Y - %H:%M")})", title_style)
+
+    statistics_style = getSampleStyleSheet()["Normal"]
+    general_statistics = ListFlowable(
+        [
+            Paragraph(f"Total count of defects: {len(all_defects)}", statistics_style),
+            Paragraph(f"Count of extreme: {extreme_count}", statistics_style),
+            Paragraph(f"Count of critical: {critical_count}", statistics_style),
+        ],
+        bulletType="bullet"
+    )
+
+    elements = [title, general_statistics, Spacer(1, 25), table]
+    report_doc.build(elements)
+    return output.getvalue()
+
+
+def build_pdf_report_of_defect(defect: DefectReportModel):
+    output = BytesIO()
+    report_doc = SimpleDocTemplate(output, pagesize=A4)
+
+    # Paragraph style for header text line break
+    header_style = getSampleStyleSheet()["Normal"]
+    # Headers without photo!
+    table_headers = ["ID", "Timestamp", "Type", Paragraph("Is on belt", header_style),
+                     Paragraph("Box width (mm)", header_style), Paragraph("Box length (mm)", header_style),
+                     Paragraph("Longitudinal pos. (mm)", header_style),
+                     Paragraph("Transverse pos. (mm)", header_style), "Probability", "Criticality"]
+    table_values = format_defects_to_display_in_table([defect], (575, 430))
+    defect_photo = table_values[0].pop()
+    table_data = [table_headers] + table_values
+    table = Table(table_data, colWidths=[25, 75, 75, 40, 60, 60, 70, 70, 50, 50],
+                  rowHeights=[30, 50])
+    render_table_of_defects(table, table_data)
+
+    title_style = getSampleStyleSheet()["Title"]
+    title_style.fontSize = 24
+    title_style.alignment = 1
+    title_style.spaceAfter = 50
+    title = Paragraph(f"REPORT ABOUT DEFECT WITH ID={defect.id} ({datetime.now().strftime("%d.%m.%Y - %H:%M")})",
+                      title_style)
+
+    elements = [title, table, Spacer(1, 25), defect_photo]
+    report_doc.build(elements)
+    return output.getvalue()
+
+
+def build_pdf_report_of_conveyor(parameters: ConveyorParametersResponseModel,
+                                 status_response: ConveyorStatusResponseModel,
+                                 defects_count: CountOfDefectGroupsResponseModel):
+    output = BytesIO()
+    report_doc = SimpleDocTemplate(output, pagesize=A4)
+
+    title_style = getSampleStyleSheet()["Title"]
+    title_style.fontSize = 24
+    title_style.alignment = 1
+    title_style.spaceAfter = 32
+    title = Paragraph(f"REPORT ABOUT CONVEYOR INFO ({datetime.now().strftime("%d.%m.%Y - %H:%M")})", title_style)
+
+    status_text_color = None
+    if status_response.status == "normal":
+        status_text_color = colors.green
+    elif status_response.status == "extreme":
+        status_text_color = colors.orange
+    elif status_response.status == "critical":
+        status_text_color = colors.red
+
+    info_list_style = ParagraphStyle(
+        name="InfoListStyle",
+        parent=getSampleStyleSheet()["Normal"],
+        fontSize=16,
+        leading=20,
+    )
+
+    parameters_and_status = ListFlowable(
+        [
+            Paragraph(f"Belt length: <b>{parameters.belt_length / 1000000} km</b>", info_list_style),
+            Paragraph(f"Belt width: <b>{parameters.belt_width / 1000} m</b>", info_list_style),
+            Paragraph(f"Belt thickness: <b>{parameters.belt_thickness} mm</b>", info_list_style),
+            Paragraph(f"General status: <b><font color=\"{convert_color_to_hex(status_text_color)}\">"
+                      f"{status_response.status.upper()}</font></b>", info_list_style),
+        ],
+        bulletType="bullet"
+    )
+
+    defects_count_info = ListFlowable(
+        [
+            Paragraph(f"Total count of defects: <b>{defects_count.total}</b>", info_list_style),
+            Paragraph(f"Count of extreme-level defects: <b>{defects_count.extreme}</b>", info_list_style),
+            Paragraph(f"Count of critical-level defects: <b>{defects_count.critical}</b>", info_list_style)
+        ],
+        bulletType="bullet"
+    )
+
+    elements = [title, parameters_and_status, Spacer(1, 32), defects_count_info]
+    report_doc.build(elements)
+    return output.getvalue()
+
+
+def build_csv_report_of_all_defects(all_defects: list[DefectReportModel]):
+    # Photo isn't loaded for the CSV-reports
+    csv_table_headers = ",".join([key for key in DefectReportModel.model_fields.keys() if key != "photo"]) + "\n"
+    csv_table_lines = [",".join([str(value) for value in defect.model_dump(exclude={"photo"}).values()]) + "\n"
+                       for defect in all_defects]
+
+    return (csv_table_headers + "".join(csv_table_lines)).encode("utf-8")
+
+
+def build_csv_report_of_defect(defect: DefectReportModel):
+    # Photo isn't loaded for the CSV-reports
+    csv_headers = ",".join([key for key in DefectReportModel.model_fields.keys() if key != "photo"]) + "\n"
+    csv_defect_info = ",".join([str(value) for value in defect.model_dump(exclude={"photo"}).values()]) + "\n"
+
+    return (csv_headers + csv_defect_info).encode("utf-8")
+
+
+def build_csv_report_of_conveyor(parameters: ConveyorParametersResponseModel,
+                                 status_response: ConveyorStatusResponseModel,
+                                 defects_count: CountOfDefectGroupsResponseModel):
+    csv_headers = ("belt_length,belt_width,belt_thickness,general_status,total_count_of_defects,count_of_extreme,"
+                   "count_of_critical\n")
+    csv_conveyor_info = (",".join([str(value) for value in parameters.model_dump().values()]) +
+                         f",{status_response.status}," +
+                         ",".join([str(value) for value in defects_count.model_dump().values()]) + "\n")
+
+    return (csv_headers + csv_conveyor_info).encode("utf-8")
@@ -0,0 +1,105 @@
+"""
+Cache of the generated reports on the local disk. The key of the report is the hash of its type, parameters and
+version of the data, so the same report is returned again until the data changes, and after any change of the data
+the request gets the new key (the outdated reports are never returned and are removed as the least recently used ones)
+"""
+import hashlib
+import json
+import os
+from pathlib import Path
+from tempfile import NamedTemporaryFile
+from threading import Lock
+
+from .config import settings
+
+
+def get_report_cache_key(report: str, doc_type: str, parameters: dict, data_version: str):
+    key_source = json.dumps({"report": report, "doc_type": doc_type, "parameters": parameters,
+                             "data_version": data_version}, sort_keys=True)
+    return hashlib.sha256(key_source.encode()).hexdigest()
+
+
+class ReportCache:
+    """
+    LRU-cache of the reports limited by their total size. Every report is stored as the file with the content and
+    the file with the result of the job, the time of the last use is the modification time of the result file, so
+    the cache is shared by the processes of the server
+    """
+
+    def __init__(self, max_size_bytes: int, directory: str):
+        self.max_size_bytes = max_size_bytes
+        self.directory = Path(directory)
+        self._lock = Lock()
+
+    def get(self, key: str):
+        """
+        Returns (<content of the report>, <result of the job>) or None if the report isn't cached
+        """
+        if self.max_size_bytes <= 0:
+            return None
+        content_path, result_path = self._get_paths(key)
+        try:
+            result = json.loads(result_path.read_text(encoding="utf-8"))
+            content = content_path.read_bytes()
+            os.utime(result_path)
+        except (OSError, ValueError):
+            # Report which has just been removed by another process is generated again
+            return None
+        return content, result
+
+    def put(self, key: str, content: bytes, result: dict):
+        if self.max_size_bytes <= 0 or len(content) > self.max_size_bytes:
+            return
+        content_path, result_path = self._get_paths(key)
+        try:
+            self.directory.mkdir(parents=True, exist_ok=True)
+            # Result is written last, so the report without the content is never returned
+            self._write_file(content_path, content)
+            self._write_file(result_path, json.dumps(result).encode())
+        except OSError:
+            return
+        self._remove_least_recently_used_reports()
+
+    def link(self, key: str, path: Path):
+        """
+        Create the hard link to the content of the cached report (the file isn't copied). Returns False if the report
+        isn't cached anymore or the link can't be created (e.g. on the other file system)
+        """
+        try:
+            path.parent.mkdir(parents=True, exist_ok=True)
+            os.link(self._get_paths(key)[0], path)
+        except OSError:
+            return False
+        return True
+
+    def _get_paths(self, key: str):
+        return self.directory / key, self.directory / f"{key}.json"
+
+    def _write_file(self, path: Path, data: bytes):
+        # Writing to the temporary file with renaming, so that the report is never seen half-written
+        with NamedTemporaryFile(dir=self.directory, suffix=".tmp", delete=False) as file:
+            file.write(data)
+        os.replace(file.name, path)
+
+    def _remove_least_recently_used_reports(self):
+        with self._lock:
+            reports = []
+            size_bytes = 0
+            for result_path in self.directory.glob("*.json"):
+                content_path = result_path.with_suffix("")
+                try:
+                    report_size = result_path.stat().st_size + content_path.stat().st_size
+                    reports.append((result_path.stat().st_mtime, report_size, content_path, result_path))
+                except OSError:
+                    continue
+                size_bytes += report_size
+            reports.sort()
+            while size_bytes > self.max_size_bytes and len(reports) > 1:
+                _, report_size, content_path, result_path = reports.pop(0)
+                result_path.unlink(missing_ok=True)
+                content_path.unlink(missing_ok=True)
+                size_bytes -= report_size
+
+
+report_cache = ReportCache(max_size_bytes=settings.report_cache_size_bytes,
+                           directory=str(Path(settings.reports_directory) / "cache"))
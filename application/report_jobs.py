@@ -0,0 +1,155 @@
+"""
+Jobs of the report generation: the state of the jobs is kept in the database and the reports are built in the pool
+of processes limited by REPORT_BUILD_PROCESSES, so a large report doesn't block the event loop of the server
+"""
+import asyncio
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime, timedelta
+from pathlib import Path
+from uuid import uuid4
+
+from fastapi.concurrency import run_in_threadpool
+from sqlmodel import Session, select, update, delete
+
+from .config import settings
+from .db_connection import engine
+from .models.db_models import ReportJob
+
+REPORT_JOBS_CHECK_INTERVAL_SECONDS = 60
+# Jobs which are unfinished for this count of the build timeouts are considered abandoned (e.g. the process of the server
+# running them was stopped), the margin is left for the jobs waiting for the free process
+STALE_JOB_TIMEOUTS = 3
+REPORT_CHUNK_SIZE = 64 * 1024
+
+# Reports waiting for the free process stay in the "queued" status
+report_build_semaphore = asyncio.Semaphore(settings.report_build_processes)
+REPORT_PROCESS_POOL = {"pool": None}
+
+
+def get_report_process_pool():
+    """
+    Processes are started by "spawn", so they don't inherit the connections and the threads of the server
+    """
+    if REPORT_PROCESS_POOL["pool"] is None:
+        REPORT_PROCESS_POOL["pool"] = ProcessPoolExecutor(max_workers=settings.report_build_processes,
+                                                          mp_context=multiprocessing.get_context("spawn"))
+    return REPORT_PROCESS_POOL["pool"]
+
+
+def reset_report_process_pool(pool: ProcessPoolExecutor):
+    """
+    Pool becomes unusable when one of its processes dies (BrokenProcessPool) and a process stuck in the building can't
+    be stopped, so the pool is replaced by the new one. The builds running in the old pool aren't cancelled.
+    """
+    if REPORT_PROCESS_POOL["pool"] is pool:
+        REPORT_PROCESS_POOL["pool"] = None
+    pool.shutdown(wait=False)
+
+
+def shutdown_report_process_pool():
+    if REPORT_PROCESS_POOL["pool"] is not None:
+        REPORT_PROCESS_POOL["pool"].shutdown(cancel_futures=True)
+        REPORT_PROCESS_POOL["pool"] = None
+
+
+def get_report_path(job_id: str):
+    """
+    Every job has its own file named by the id of the job, so the concurrent reports don't overwrite each other
+    """
+    return Path(settings.reports_directory) / job_id
+
+
+def save_report(job_id: str, content: bytes):
+    """
+    The report is written into the temporary file first, so the partially written report is never downloaded
+    """
+    path = get_report_path(job_id)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    temporary_path = path.with_suffix(".tmp")
+    temporary_path.write_bytes(content)
+    temporary_path.replace(path)
+
+
+def iterate_report(job_id: str):
+    """
+    Returns the iterator of the chunks of the saved report or None if the report has been removed
+    """
+    try:
+        report_file = open(get_report_path(job_id), "rb")  # pylint: disable=R1732
+    except FileNotFoundError:
+        return None
+
+    def read_chunks():
+        with report_file:
+            while chunk := report_file.read(REPORT_CHUNK_SIZE):
+                yield chunk
+
+    return read_chunks()
+
+
+def create_report_job(report: str, doc_type: str, parameters: dict | None = None, **values):
+    """
+    Job is created in the "queued" status if the other one isn't given in the values
+    """
+    if values.get("status") in ("done", "failed"):
+        values["finished_at"] = datetime.now()
+    job = ReportJob(id=str(uuid4()), report=report, doc_type=doc_type, parameters=parameters or {},
+                    created_at=datetime.now(), **values)
+    with Session(engine) as session:
+        session.add(job)
+        session.commit()
+        session.refresh(job)
+        return job
+
+
+def get_report_job(job_id: str):
+    with Session(engine) as session:
+        return session.exec(select(ReportJob).where(ReportJob.id == job_id)).first()
+
+
+def update_report_job(job_id: str, **values):
+    if values.get("status") in ("done", "failed"):
+        values["finished_at"] = datetime.now()
+    with Session(engine) as session:
+        session.exec(update(ReportJob).where(ReportJob.id == job_id).values(**values))
+        session.commit()
+
+
+def purge_old_report_jobs():
+    """
+    Remove the jobs and the reports older than REPORT_JOBS_RETENTION_HOURS
+    """
+    threshold = datetime.now() - timedelta(hours=settings.report_jobs_retention_hours)
+    with Session(engine) as session:
+        job_ids = session.exec(select(ReportJob.id).where(ReportJob.created_at < threshold)).all()
+        session.exec(delete(ReportJob).where(ReportJob.created_at < threshold))
+        session.commit()
+    for job_id in job_ids:
+        get_report_path(job_id).unlink(missing_ok=True)
+    return len(job_ids)
+
+
+def fail_stale_report_jobs():
+    """
+    Mark as failed the jobs staying "queued" or "running" for too long, because the process of the server running them
+    was stopped or restarted
+    """
+    threshold = datetime.now() - timedelta(seconds=settings.report_build_timeout_seconds * STALE_JOB_TIMEOUTS)
+    with Session(engine) as session:
+        job_ids = session.exec(select(ReportJob.id).where(ReportJob.__table__.c.status.in_(("queued", "running")),
+                                                          ReportJob.created_at < threshold)).all()
+    for job_id in job_ids:
+        update_report_job(job_id, status="failed", error="Report generation was interrupted")
+    return len(job_ids)
+
+
+async def maintain_report_jobs_periodically():
+    """
+    Background task of the leader checking the stale jobs (the first check is done at the start of the server)
+    and removing the old jobs
+    """
+    while True:
+        await run_in_threadpool(fail_stale_report_jobs)
+        await run_in_threadpool(purge_old_report_jobs)
+        await asyncio.sleep(REPORT_JOBS_CHECK_INTERVAL_SECONDS)
@@ -53,6 +53,16 @@ def get_current_user(token: Annotated[str, Depends(oauth2_scheme)]):
         return user
 
 
+def get_token_expiration(token: str):
+    """
+    Returns the expiration time of the already validated token (None if the token has no expiration)
+    """
+    expiration_timestamp = jwt.get_unverified_claims(token).get("exp")
+    if expiration_timestamp is None:
+        return None
+    return datetime.fromtimestamp(expiration_timestamp, timezone.utc)
+
+
 def get_current_admin_user(current_user: User = Depends(get_current_user)):
     if current_user.role != "Admin":
         raise HTTPException(status_code=403, detail="Forbidden: you do not have sufficient rights "
@@ -1,7 +1,7 @@
 from datetime import datetime, timezone
 
 from fastapi import APIRouter, Depends, status
-from sqlmodel import Session, select, desc
+from sqlmodel import Session, select, desc, func
 
 from application.db_connection import engine
 from application.models.db_models import ObjectType, Object, ConveyorParameters, ConveyorStatus, Defect
@@ -70,10 +70,10 @@ def get_general_status_of_conveyor():
 def create_record_of_current_general_conveyor_status():
     with Session(engine) as session:
         conv_status_object_type = session.exec(select(ObjectType).where(ObjectType.name == "conv_state")).one()
-        defects = session.exec(select(Defect)).all()
-
-        count_of_critical_defects = sum(1 for defect in defects if defect.is_critical)
-        count_of_extreme_defects = sum(1 for defect in defects if defect.is_extreme)
+        # Counting in the database instead of loading all defects
+        # pylint: disable=E1102
+        count_of_critical_defects, count_of_extreme_defects = session.exec(
+            select(func.count().filter(Defect.is_critical), func.count().filter(Defect.is_extreme))).one()
 
         current_status = None
         if count_of_critical_defects > 0:
@@ -1,19 +1,32 @@
+import asyncio
+import json
 from base64 import b64encode
 from datetime import datetime, timezone
 
-from fastapi import APIRouter, Depends, HTTPException
-from sqlmodel import Session, select, and_, not_
+from fastapi import APIRouter, Depends, HTTPException, BackgroundTasks, WebSocket, WebSocketDisconnect, status
+from fastapi.concurrency import run_in_threadpool
+from pydantic import ValidationError
+from sqlmodel import Session, select, and_, not_, func
 
 from application.db_connection import engine
+from application.defect_feed import defect_feed, publish_defect_delta, DefectFeedClient
+from application.defect_changes import get_defect_changes
+from application.denormalized_timestamps import are_denormalized_timestamps_used
 from application.models.db_models import Object, DefectType, Defect, Relation
 from application.models.api_models import (ServiceInfoResponseModel, CountOfDefectGroupsResponseModel,
-                                           DefectResponseModel, TypesOfDefectsResponseModel)
-from application.services.authentication_service import get_current_admin_user
+                                           DefectResponseModel, TypesOfDefectsResponseModel, DefectFeedFilters,
+                                           DefectChangesResponseModel)
+from application.services.authentication_service import get_current_user, get_current_admin_user, get_token_expiration
 from application.services.conveyor_info_service import create_record_of_current_general_conveyor_status
 from application.services.logging_service import create_log_record
 
+# Time for the client of the feed to send the token after the connection
+FEED_AUTHENTICATION_TIMEOUT_SECONDS = 10
+
 router = APIRouter(prefix="/defect_info", tags=["Defects Information Service"],
                    dependencies=[Depends(get_current_admin_user)])
+# WebSocket can't send the authorization header, the token is sent in the first message and checked by the endpoint
+feed_router = APIRouter(prefix="/defect_info", tags=["Defects Information Service"])
 
 
 def determine_defect_criticality(defect: Defect):
@@ -34,13 +47,24 @@ def determine_criticality_select_condition(criticality: str):
     return False
 
 
-def form_response_model_from_defect(defect: Defect):
+def restrict_select_of_defects_to_time_period(statement, start_datetime: datetime, end_datetime: datetime):
+    """
+    Filter by the denormalized "time" column of the "defects" table if it is enabled, else join the "objects" table
+    """
+    if are_denormalized_timestamps_used():
+        return statement.where(and_(start_datetime <= Defect.time, Defect.time <= end_datetime))
+    return (statement.join(Object, Object.id == Defect.obj_id)
+            .where(and_(start_datetime <= Object.time, Object.time <= end_datetime)))
+
+
+def form_response_model_from_defect(defect: Defect, include_photo: bool = True):
     """
     Create DefectResponseModel from Defect DB model using sqlmodel Relationship class and other DB models
+    (the photo isn't loaded and encoded if it's not needed)
     """
     response = DefectResponseModel(
         id=defect.id,
-        timestamp=defect.base_object.time,
+        timestamp=defect.time if defect.time is not None else defect.base_object.time,
         type=defect.type_object.name,
         is_on_belt=defect.type_object.is_belt,
         box_width_in_mm=defect.box_width,
@@ -49,7 +73,7 @@ def form_response_model_from_defect(defect: Defect):
         transverse_position=defect.location_width_in_conv,
         probability=defect.probability,
         criticality=determine_defect_criticality(defect),
-        base64_photo=b64encode(defect.photo_object.image).decode()
+        base64_photo=b64encode(defect.photo_object.image).decode() if include_photo else ""
     )
     return response
 
@@ -63,19 +87,19 @@ def get_service_info():
 
 @router.get(path="/count", response_model=CountOfDefectGroupsResponseModel)
 def get_count_of_all_and_extreme_and_critical_defects():
-    count_of_extreme = 0
-    count_of_critical = 0
-
+    """
+    Counts are computed by the database in one pass (critical defects aren't counted as extreme ones)
+    """
+    # pylint: disable=E1102
     with Session(engine) as session:
-        defects = session.exec(select(Defect)).all()
-        for defect in defects:
-            if defect.is_critical:
-                count_of_critical += 1
-            elif defect.is_extreme:
-                count_of_extreme += 1
+        total, count_of_extreme, count_of_critical = session.exec(select(
+            func.count(),
+            func.count().filter(and_(Defect.is_extreme, not_(Defect.is_critical))),
+            func.count().filter(Defect.is_critical)
+        ).select_from(Defect)).one()
 
     return CountOfDefectGroupsResponseModel(
-        total=len(defects),
+        total=total,
         extreme=count_of_extreme,
         critical=count_of_critical
     )
@@ -88,6 +112,21 @@ def get_all_defects():
         return [form_response_model_from_defect(defect) for defect in defects]
 
 
+@router.get(path="/changes", response_model=DefectChangesResponseModel)
+def get_changes_of_defects_since_version(since: int = 0):
+    """
+    Defects created, updated or deleted since the version returned by the previous request (all defects for
+    since=0), so the client keeps its copy of the defects up to date without reloading them
+    """
+    with Session(engine) as session:
+        version, defects, deleted_defect_ids = get_defect_changes(session, since)
+        return DefectChangesResponseModel(
+            version=version,
+            changed=[form_response_model_from_defect(defect) for defect in defects],
+            deleted_ids=deleted_defect_ids
+        )
+
+
 @router.get(path="/id={defect_id}", response_model=DefectResponseModel)
 def get_defect_by_id(defect_id: int):
     with Session(engine) as session:
@@ -125,10 +164,9 @@ def get_all_defects_in_certain_time_period(start_datetime: datetime = datetime.f
                                            .replace(tzinfo=None),
                                            end_datetime: datetime = datetime.now(timezone.utc).replace(tzinfo=None)):
     with Session(engine) as session:
-        results = session.exec(select(Defect, Object).join(Object).
-                               where(and_(start_datetime <= Object.time, Object.time <= end_datetime))
-                               .order_by(Defect.id)).all()
-        return [form_response_model_from_defect(defect) for defect, _ in results]
+        statement = restrict_select_of_defects_to_time_period(select(Defect), start_datetime, end_datetime)
+        defects = session.exec(statement.order_by(Defect.id)).all()
+        return [form_response_model_from_defect(defect) for defect in defects]
 
 
 @router.get(path="/filtered", response_model=list[DefectResponseModel])
@@ -144,11 +182,11 @@ def get_filtered_defects_by_all_parameters(defect_type: str = "all", criticality
         criticality_select_condition = True
 
     with Session(engine) as session:
-        results = session.exec(select(Defect, Object, DefectType).join(Object).join(DefectType).
-                               where(and_(start_datetime <= Object.time, Object.time <= end_datetime,
-                                          type_select_condition, criticality_select_condition))
+        statement = restrict_select_of_defects_to_time_period(select(Defect).join(DefectType), start_datetime,
+                                                              end_datetime)
+        defects = session.exec(statement.where(and_(type_select_condition, criticality_select_condition))
                                .order_by(Defect.id)).all()
-        return [form_response_model_from_defect(defect) for defect, _, _ in results]
+        return [form_response_model_from_defect(defect) for defect in defects]
 
 
 @router.get(path="/all_types", response_model=TypesOfDefectsResponseModel)
@@ -195,7 +233,8 @@ def get_chain_of_all_previous_variations_of_defect_by_id(current_defect_id: int)
 
 
 @router.put(path="/id={defect_id}/set_criticality", response_model=DefectResponseModel)
-def change_criticality_of_defect_by_id(defect_id: int, is_extreme: bool, is_critical: bool):
+def change_criticality_of_defect_by_id(defect_id: int, is_extreme: bool, is_critical: bool,
+                                       background_tasks: BackgroundTasks):
     with Session(engine) as session:
         defect = session.exec(select(Defect).where(Defect.id == defect_id)).first()
         if not defect:
@@ -228,11 +267,12 @@ def change_criticality_of_defect_by_id(defect_id: int, is_extreme: bool, is_crit
         create_record_of_current_general_conveyor_status()
 
         response = form_response_model_from_defect(defect)
+        background_tasks.add_task(publish_defect_delta, "criticality_changed", response, previous_criticality)
         return response
 
 
 @router.delete(path="/id={defect_id}/delete", response_model=DefectResponseModel)
-def delete_defect_by_id(defect_id: int):
+def delete_defect_by_id(defect_id: int, background_tasks: BackgroundTasks):
     with Session(engine) as session:
         defect = session.exec(select(Defect).where(Defect.id == defect_id)).first()
         if not defect:
@@ -267,4 +307,89 @@ def delete_defect_by_id(defect_id: int):
         # Defect removing causes changing of the general conveyor status
         create_record_of_current_general_conveyor_status()
 
+        background_tasks.add_task(publish_defect_delta, "deleted", response)
         return response
+
+
+def authenticate_admin_by_token(token: str):
+    """
+    Returns the expiration time of the token
+    """
+    get_current_admin_user(get_current_user(token))
+    return get_token_expiration(token)
+
+
+async def authenticate_defect_feed_client(websocket: WebSocket):
+    """
+    The first message of the client is {"token": <access token of the admin>}, so the token doesn't get into the access
+    logs with the URL. Returns the expiration time of the token. Raises TimeoutError, ValueError, TypeError, KeyError
+    or HTTPException if the client isn't authenticated
+    """
+    message = json.loads(await asyncio.wait_for(websocket.receive_text(), FEED_AUTHENTICATION_TIMEOUT_SECONDS))
+    return await run_in_threadpool(authenticate_admin_by_token, message["token"])
+
+
+async def close_defect_feed_on_token_expiration(websocket: WebSocket, expiration: datetime | None):
+    """
+    The client has to connect again with the new token after the expiration of the current one
+    """
+    if expiration is None:
+        await asyncio.Event().wait()
+        return
+    await asyncio.sleep(max((expiration - datetime.now(timezone.utc)).total_seconds(), 0))
+    await websocket.close(code=status.WS_1008_POLICY_VIOLATION, reason="Token has expired")
+
+
+async def receive_defect_feed_filters(websocket: WebSocket, client: DefectFeedClient):
+    """
+    Every message of the client replaces its filters (until the connection is closed)
+    """
+    while True:
+        message = await websocket.receive_text()
+        try:
+            client.filters = DefectFeedFilters.model_validate_json(message)
+        except ValidationError as e:
+            await websocket.send_json({"error": f"Invalid filters: {e.errors(include_url=False)}"})
+
+
+async def send_defect_deltas(websocket: WebSocket, client: DefectFeedClient):
+    while True:
+        events = await client.get_events()
+        if client.is_disconnected:
+            # The client is too slow and has missed some changes, it has to reload the defects
+            await websocket.close(code=status.WS_1013_TRY_AGAIN_LATER)
+            return
+        for _, message in events:
+            await websocket.send_text(message)
+
+
+@feed_router.websocket(path="/feed")
+async def stream_defect_deltas(websocket: WebSocket):
+    """
+    Changes of the defects as JSON (DefectDeltaResponseModel without photos). The client sends the token as the first
+    message and then the filters (DefectFeedFilters) as JSON-messages, by default all changes are sent. The connection
+    is closed with the code 1008 if the token is invalid and when it expires
+    """
+    await websocket.accept()
+    try:
+        expiration = await authenticate_defect_feed_client(websocket)
+    except WebSocketDisconnect:
+        return
+    except (TimeoutError, ValueError, TypeError, KeyError, HTTPException):
+        await websocket.close(code=status.WS_1008_POLICY_VIOLATION, reason="Invalid token")
+        return
+
+    client = defect_feed.subscribe()
+    tasks = [asyncio.create_task(receive_defect_feed_filters(websocket, client)),
+             asyncio.create_task(send_defect_deltas(websocket, client)),
+             asyncio.create_task(close_defect_feed_on_token_expiration(websocket, expiration))]
+    try:
+        done_tasks, _ = await asyncio.wait(tasks, return_when=asyncio.FIRST_COMPLETED)
+        for task in done_tasks:
+            # Closing of the connection by the client isn't an error
+            if not isinstance(task.exception(), WebSocketDisconnect):
+                task.result()
+    finally:
+        defect_feed.unsubscribe(client)
+        for task in tasks:
+            task.cancel()
@@ -0,0 +1,100 @@
+import asyncio
+from datetime import datetime
+from threading import Lock
+from time import monotonic
+
+from fastapi import APIRouter
+from fastapi.concurrency import run_in_threadpool
+from sqlmodel import text
+from sqlalchemy.exc import OperationalError, DatabaseError
+
+from application.config import settings
+from application.db_connection import engine
+from application.db_listener import LISTENER_STATE, new_defects_queue
+from application.event_bus import EVENT_BUS_STATE
+from application.leader_election import LEADER_STATE, LEADER_LOCK_KEY
+from application.notification_outbox import get_count_of_waiting_notifications
+from application.models.api_models import HealthResponseModel, ConnectionPoolResponseModel
+from application.services.maintenance_service import events_hub
+
+# Health is checked by the clients often, so it doesn't need the authentication (it doesn't reveal any data)
+router = APIRouter(prefix="/health", tags=["Health Service"])
+
+
+def probe_database():
+    """
+    Returns the dictionary of the database fields of HealthResponseModel
+    """
+    result = {"is_database_available": False, "database_details": None, "database_checked_at": datetime.now(),
+              "is_leader_elected": None, "waiting_notifications": None}
+    try:
+        with engine.connect() as connection:
+            result["is_leader_elected"] = connection.execute(
+                text("SELECT EXISTS(SELECT 1 FROM pg_locks WHERE locktype = 'advisory' AND granted "
+                     "AND classid = 0 AND objid::TEXT::BIGINT = :key AND objsubid = 1)"),
+                {"key": LEADER_LOCK_KEY}).scalar_one()
+        result["waiting_notifications"] = get_count_of_waiting_notifications()
+        result["is_database_available"] = True
+    except UnicodeDecodeError:
+        result["database_details"] = "Connection string in configuration is invalid"
+    except OperationalError:
+        result["database_details"] = "Some problems with database connection"
+    except DatabaseError:
+        result["database_details"] = "Some problems in database"
+    return result
+
+
+class DatabaseProbe:  # pylint: disable=R0903
+    """
+    Result of the database check is shared by all requests during its lifetime, the concurrent requests wait for
+    one check instead of checking the database too
+    """
+
+    def __init__(self, lifetime_seconds: float, probe_function):
+        self.lifetime_seconds = lifetime_seconds
+        self.probe_function = probe_function
+        self._result = None
+        self._checked_at = None
+        self._lock = Lock()
+
+    def get_result(self):
+        with self._lock:
+            if self._checked_at is None or monotonic() - self._checked_at >= self.lifetime_seconds:
+                self._result = self.probe_function()
+                self._checked_at = monotonic()
+            return self._result
+
+
+database_probe = DatabaseProbe(settings.health_database_probe_ttl_seconds, probe_database)
+
+
+def get_connection_pool_statistics():
+    pool = engine.pool
+    return ConnectionPoolResponseModel(size=pool.size(), checked_out=pool.checkedout(), checked_in=pool.checkedin(),
+                                       overflow=pool.overflow())
+
+
+@router.get(path="/", response_model=HealthResponseModel)
+def get_health():
+    return HealthResponseModel(
+        server="OK",
+        **database_probe.get_result(),
+        connection_pool=get_connection_pool_statistics(),
+        is_leader=LEADER_STATE["is_leader"],
+        is_new_defect_listener_connected=LISTENER_STATE["is_connected"],
+        is_event_bus_connected=EVENT_BUS_STATE["is_connected"],
+        new_defects_queue_size=new_defects_queue.qsize(),
+        health_push_interval_seconds=settings.health_push_interval_seconds
+    )
+
+
+async def push_health_to_clients_periodically():
+    """
+    Clients of the event stream get the health without polling (the outdated health isn't sent again after
+    the reconnection)
+    """
+    while True:
+        await asyncio.sleep(settings.health_push_interval_seconds)
+        if events_hub.clients:
+            health = await run_in_threadpool(get_health)
+            events_hub.publish(health.model_dump_json(), event="health", is_replayed=False)
@@ -1,24 +1,145 @@
-from datetime import datetime
+from datetime import datetime, timezone
+from typing import Annotated, Literal
+from threading import Lock
+from time import monotonic
+import csv
+import io
+import json
+import re
+import zlib
 
-from fastapi import APIRouter, Depends, HTTPException
-from sqlmodel import Session, select, desc, text
+import asyncio
 
+from fastapi import APIRouter, Depends, HTTPException, Header
+from fastapi.concurrency import run_in_threadpool
+from fastapi.responses import StreamingResponse
+from sqlmodel import Session, select, desc, text, col
+
+from application.config import settings
 from application.db_connection import engine
+from application.denormalized_timestamps import are_denormalized_timestamps_used
 from application.models.db_models import ObjectType, Object, LogType, Log
 from application.models.api_models import ServiceInfoResponseModel, LogResponseModel, AllLogsRemovingResponseModel
 from application.services.authentication_service import get_current_admin_user
+from application.sse_hub import create_sse_hub, format_server_sent_event, HEARTBEAT_MESSAGE
+from application.event_bus import add_event_bus_handler
+
+# Count of rows fetched from the server-side cursor and compressed at once during the export
+EXPORT_BATCH_SIZE = 1000
 
 router = APIRouter(prefix="/logs", tags=["Logging Service"],
                    dependencies=[Depends(get_current_admin_user)])
 
 
+
+class AuditLogLimiter:
+    """
+    Rate limiting and deduplication of the log records created by the services, so that a failure storm (e.g.
+    Telegram outage) doesn't multiply the DB write load. Records of the deduplicated types are similar if they differ
+    only in numbers (ids, counts), suppressed records are reported by one summary record after the window is over
+    """
+
+    def __init__(self, window_seconds: float, limits: dict[str, int], deduplicated_types: set[str]):
+        self.window_seconds = window_seconds
+        self.limits = limits
+        self.deduplicated_types = deduplicated_types
+        self._lock = Lock()
+        # Log type -> (start of the window, count of written records in the window)
+        self._windows = {}
+        # (log type, normalized text) -> time of the last written record
+        self._last_written = {}
+        # (log type, normalized text) -> [time of the first suppressed record, count of suppressed, example text]
+        self._suppressed = {}
+
+    @staticmethod
+    def _normalize(log_text: str):
+        return re.sub(r"\d+", "#", log_text)
+
+    def _collect_summaries(self, now: float, everything: bool = False):
+        summaries = []
+        for key, (first_suppressed_time, count, example_text) in list(self._suppressed.items()):
+            if everything or now - first_suppressed_time >= self.window_seconds:
+                del self._suppressed[key]
+                summaries.append((key[0], f"{count} similar messages suppressed during {self.window_seconds} s. "
+                                          f"Last one: \"{example_text}\""))
+        for key, last_written_time in list(self._last_written.items()):
+            if now - last_written_time >= self.window_seconds:
+                del self._last_written[key]
+        return summaries
+
+    def register(self, log_type: str, log_text: str, now: float | None = None, is_limited: bool = True):
+        """
+        Returns a tuple (<is_allowed>, <summaries>), where <is_allowed> tells if the record has to be written and
+        <summaries> is the list of (<log type>, <text>) records about suppressed records that have to be written.
+        Records which aren't limited (e.g. about new defects) are always allowed and don't count towards the limits
+        """
+        now = monotonic() if now is None else now
+        with self._lock:
+            summaries = self._collect_summaries(now)
+            if not is_limited:
+                return True, summaries
+            key = (log_type, self._normalize(log_text))
+
+            window_start, count_in_window = self._windows.get(log_type, (now, 0))
+            if now - window_start >= self.window_seconds:
+                window_start, count_in_window = now, 0
+            limit = self.limits.get(log_type)
+
+            is_duplicate = log_type in self.deduplicated_types and key in self._last_written
+            is_over_limit = limit is not None and count_in_window >= limit
+            if is_duplicate or is_over_limit:
+                suppressed = self._suppressed.setdefault(key, [now, 0, log_text])
+                suppressed[1] += 1
+                suppressed[2] = log_text
+                self._windows[log_type] = (window_start, count_in_window)
+                return False, summaries
+
+            self._windows[log_type] = (window_start, count_in_window + 1)
+            self._last_written[key] = now
+            return True, summaries
+
+    def collect_summaries(self, now: float | None = None, everything: bool = False):
+        """
+        Summaries of the suppressed records whose window is over (or of all suppressed records, e.g. on shutdown),
+        so that the summary is written even if no record is created after the storm
+        """
+        now = monotonic() if now is None else now
+        with self._lock:
+            return self._collect_summaries(now, everything)
+
+
+audit_log_limiter = AuditLogLimiter(settings.log_rate_limit_window_seconds, settings.log_rate_limits,
+                                    settings.log_deduplicated_types)
+
+# Clients subscribed to the live tail of log records
+log_tail_hub = create_sse_hub("logs")
+
+
+def format_log_record_event(log: LogResponseModel):
+    return format_server_sent_event(log.model_dump_json(), event="log", event_id=log.id)
+
+
+async def notify_log_tail_subscribers(payload: str):
+    """
+    Handler of the new log records notified by the trigger in every process of the server
+    """
+    # The record is read once for all subscribers
+    if not log_tail_hub.clients:
+        return
+    for log in await run_in_threadpool(get_log_records_by_ids, [int(payload)]):
+        log_tail_hub.publish(log.model_dump_json(), event="log", event_id=log.id)
+
+
+add_event_bus_handler("new_log", notify_log_tail_subscribers)
+
+
 def form_response_model_from_log(log: Log):
     """
     Create LogResponseModel from Log DB model using sqlmodel Relationship class and other DB models
     """
     response = LogResponseModel(
         id=log.id,
-        timestamp=log.base_object.time,
+        timestamp=log.time if log.time is not None else log.base_object.time,
         type=log.type_object.name,
         text=log.action
     )
@@ -39,6 +160,104 @@ def get_all_log_records_in_reverse_order():
         return [form_response_model_from_log(log) for log in logs]
 
 
+def get_log_records_by_ids(log_ids: list[int]):
+    with Session(engine) as session:
+        logs = session.exec(select(Log).where(col(Log.id).in_(log_ids)).order_by(Log.id)).all()
+        return [form_response_model_from_log(log) for log in logs]
+
+
+def get_log_records_after_id(log_id: int):
+    with Session(engine) as session:
+        logs = session.exec(select(Log).where(Log.id > log_id).order_by(Log.id)).all()
+        return [form_response_model_from_log(log) for log in logs]
+
+
+@router.get(path="/tail")
+async def stream_new_log_records(since_id: int | None = None, last_event_id: Annotated[int | None, Header()] = None):
+    """
+    Server-sent events with new log records. Records with id greater than "since_id" (or "Last-Event-ID" header
+    on reconnection) are sent first, after that only the new records are pushed as they are written
+    """
+    resume_from_id = since_id if since_id is not None else last_event_id
+
+    async def event_generator():
+        # Subscription goes before reading of the missed records so that no record is lost between them
+        client = log_tail_hub.subscribe()
+        try:
+            last_sent_id = None
+            if resume_from_id is not None:
+                for log in await run_in_threadpool(get_log_records_after_id, resume_from_id):
+                    last_sent_id = log.id
+                    yield format_log_record_event(log)
+
+            while True:
+                events = await client.get_events()
+                if client.is_disconnected:
+                    break
+                if not events:
+                    yield HEARTBEAT_MESSAGE
+                    continue
+                # Records which have been already read with the missed ones are skipped
+                messages = [message for log_id, message in events if last_sent_id is None or log_id > last_sent_id]
+                if messages:
+                    yield "".join(messages)
+        finally:
+            log_tail_hub.unsubscribe(client)
+
+    return StreamingResponse(event_generator(), media_type="text/event-stream")
+
+
+def generate_compressed_log_records_export(export_format: str, start_datetime: datetime, end_datetime: datetime):
+    """
+    Generator of gzip-compressed chunks of the log records (joined with type and timestamp) in the period.
+    Rows are read from the server-side cursor in batches, so the memory consumption doesn't depend on the period size
+    """
+    compressor = zlib.compressobj(wbits=zlib.MAX_WBITS | 16)  # gzip container
+    if export_format == "csv":
+        yield compressor.compress(b"id,timestamp,type,text\n")
+
+    if are_denormalized_timestamps_used():
+        statement = (select(Log.id, Log.time, LogType.name, Log.action).join(LogType, LogType.id == Log.type)
+                     .where(start_datetime <= Log.time, Log.time <= end_datetime))
+    else:
+        statement = (select(Log.id, Object.time, LogType.name, Log.action)
+                     .join(Object, Object.id == Log.id_obj).join(LogType, LogType.id == Log.type)
+                     .where(start_datetime <= Object.time, Object.time <= end_datetime))
+    statement = statement.order_by(Log.id)
+    count_of_exported = 0
+    with engine.connect() as connection:
+        result = connection.execution_options(stream_results=True, yield_per=EXPORT_BATCH_SIZE).execute(statement)
+        for rows in result.partitions():
+            buffer = io.StringIO()
+            if export_format == "csv":
+                csv.writer(buffer, lineterminator="\n").writerows(
+                    (log_id, timestamp.isoformat(), log_type, action) for log_id, timestamp, log_type, action in rows)
+            else:
+                for log_id, timestamp, log_type, action in rows:
+                    buffer.write(json.dumps({"id": log_id, "timestamp": timestamp.isoformat(), "type": log_type,
+                                             "text": action}) + "\n")
+            count_of_exported += len(rows)
+            yield compressor.compress(buffer.getvalue().encode())
+    yield compressor.flush()
+
+    # Action logging
+    create_log_record("report_info", f"{count_of_exported} log records from {start_datetime} to {end_datetime} "
+                                     f"were exported in .{export_format}.gz format")
+
+
+@router.get(path="/export")
+def export_log_records_in_period(export_format: Literal["csv", "ndjson"] = "csv",
+                                 start_datetime: datetime = datetime.fromtimestamp(0, timezone.utc)
+                                 .replace(tzinfo=None),
+                                 end_datetime: datetime | None = None):
+    end_datetime = end_datetime or datetime.now()
+    filename = (f"logs_{start_datetime.strftime("%Y-%m-%d")}_{end_datetime.strftime("%Y-%m-%d")}"
+                f".{export_format}.gz")
+    return StreamingResponse(generate_compressed_log_records_export(export_format, start_datetime, end_datetime),
+                             media_type="application/gzip",
+                             headers={"Content-Disposition": f"attachment; filename=\"{filename}\""})
+
+
 @router.get(path="/id={log_id}", response_model=LogResponseModel)
 def get_log_record_by_id(log_id: int):
     with Session(engine) as session:
@@ -57,16 +276,42 @@ def get_log_records_of_certain_type(log_type: str):
         return [form_response_model_from_log(log) for log, _ in results]
 
 
+def create_log_record(log_type: str, log_text: str, is_limited: bool = True):
+    """
+    Log record creation by the services of the application (suppressed records aren't written and None is returned).
+    Records which must be kept in the audit trail (e.g. about new defects) are created with is_limited=False
+    """
+    is_allowed, summaries = audit_log_limiter.register(log_type, log_text, is_limited=is_limited)
+    for summary_type, summary_text in summaries:
+        write_log_record(summary_type, summary_text)
+    if not is_allowed:
+        return None
+    return write_log_record(log_type, log_text)
+
+
+def write_suppressed_log_summaries(everything: bool = False):
+    for summary_type, summary_text in audit_log_limiter.collect_summaries(everything=everything):
+        write_log_record(summary_type, summary_text)
+
+
+async def write_suppressed_log_summaries_periodically():
+    while True:
+        await asyncio.sleep(settings.log_rate_limit_window_seconds)
+        await run_in_threadpool(write_suppressed_log_summaries)
+
+
 @router.post(path="/create_record", response_model=LogResponseModel)
-def create_log_record(log_type: str, log_text: str):
+def write_log_record(log_type: str, log_text: str):
     with Session(engine) as session:
         log_record_object_type = session.exec(select(ObjectType).where(ObjectType.name == "history")).one()
-        base_object_for_new_log_record = Object(type_object=log_record_object_type, time=datetime.now())
+        creation_time = datetime.now()
+        base_object_for_new_log_record = Object(type_object=log_record_object_type, time=creation_time)
         session.add(base_object_for_new_log_record)
         log_type_object = session.exec(select(LogType).where(LogType.name == log_type)).first()
         if not log_type_object:
             raise HTTPException(status_code=404, detail=f"There is no log record type with title={log_type}")
-        new_log_record = Log(action=log_text, base_object=base_object_for_new_log_record, type_object=log_type_object)
+        new_log_record = Log(action=log_text, base_object=base_object_for_new_log_record, type_object=log_type_object,
+                             time=creation_time)
 
         session.add(new_log_record)
         session.commit()
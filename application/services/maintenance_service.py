@@ -1,10 +1,8 @@
 from datetime import datetime
-from json import JSONDecodeError
+from json import JSONDecodeError, dumps, loads
 from typing import Annotated
 
-import asyncio
-
-from fastapi import APIRouter, Depends, Request, HTTPException
+from fastapi import APIRouter, Depends, HTTPException, Header
 from fastapi.responses import StreamingResponse
 from pydantic import ValidationError
 from sqlmodel import SQLModel, Session, select, text
@@ -16,21 +14,59 @@ from application.db_connection import engine
 from application.models.db_models import (ObjectType, Object, DefectType, Photo, Defect, Relation, ConveyorParameters,
                                           LogType, Version, User)
 from application.models.api_models import (ServiceInfoResponseModel, MaintenanceActionResponseModel,
-                                           UserNotificationSettings)
+                                           UserNotificationSettings, SSEHubMetricsResponseModel)
 from application.user_settings import save_user_settings, load_user_settings
+from application.partitioning import enable_partitioning
+from application.denormalized_timestamps import enable_denormalized_timestamps
+from application.defect_changes import enable_defect_change_tracking
+from application.sse_hub import create_sse_hub, SSE_HUBS
+from application.event_bus import add_event_bus_handler, publish_to_event_bus
 from application.services.authentication_service import get_current_admin_user
 from application.services.logging_service import create_log_record
 
+# Idempotent, so that it is also installed at startup into the databases created before the live tail of logs
+NEW_LOG_TRIGGER_DDL = \
+    """
+    CREATE OR REPLACE FUNCTION notify_on_new_log()
+    RETURNS TRIGGER AS $$
+    BEGIN
+        PERFORM pg_notify('new_log', NEW.id::TEXT);
+        RETURN NEW;
+    END;
+    $$ LANGUAGE plpgsql;
+
+    DROP TRIGGER IF EXISTS trigger_on_new_log ON history;
+    CREATE TRIGGER trigger_on_new_log
+    AFTER INSERT ON history
+    FOR EACH ROW
+    EXECUTE FUNCTION notify_on_new_log();
+    """
+
 router = APIRouter(prefix="/maintenance", tags=["Maintenance Service"])
 
 pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
 
-connectedClients = set()
+# Notifications shown to the users in the client (new defects, undelivered notifications). The last events are kept
+# for the clients which reconnect after the network failure
+events_hub = create_sse_hub("events", replay_size=settings.sse_replay_buffer_size)
 
 
 async def notify_clients(message: str):
-    for queue in list(connectedClients):
-        await queue.put(message)
+    """
+    The event is sent to the clients of all processes of the server through the event bus
+    """
+    # The id is given here, so the event has the same id in the hubs of all processes
+    event_id = events_hub.generate_event_id()
+    if not await publish_to_event_bus("client_event", dumps({"id": event_id, "data": message})):
+        events_hub.publish(message, event_id=event_id)
+
+
+async def on_client_event(payload: str):
+    event = loads(payload)
+    events_hub.publish(event["data"], event_id=event["id"])
+
+
+add_event_bus_handler("client_event", on_client_event)
 
 
 def create_versions():
@@ -154,23 +190,19 @@ def get_service_info():
 
 
 @router.get(path="/get_events")
-async def subscribe_client_to_server_events(request: Request):
-    async def event_generator():
-        queue = asyncio.Queue()
-        connectedClients.add(queue)
-        while True:
-            # On connection closing by client side
-            if await request.is_disconnected():
-                break
-            try:
-                data = await asyncio.wait_for(queue.get(), timeout=1)
-                yield f"data: {data}\n\n"
-            except asyncio.TimeoutError:
-                # To be able to check the request.is_disconnected() condition
-                continue
-        connectedClients.discard(queue)
-
-    return StreamingResponse(event_generator(), media_type="text/event-stream")
+async def subscribe_client_to_server_events(last_event_id: Annotated[int | None, Header()] = None):
+    """
+    Events missed since the "Last-Event-ID" (sent by the browser on reconnection) are sent first. If some of them
+    are lost, the "resync" event is sent and the client has to reload the defects
+    """
+    # The stream is cancelled by the server when the client closes the connection
+    return StreamingResponse(events_hub.stream(events_hub.subscribe(last_event_id)), media_type="text/event-stream")
+
+
+@router.get(path="/sse_metrics", response_model=list[SSEHubMetricsResponseModel],
+            dependencies=[Depends(get_current_admin_user)])
+def get_metrics_of_server_sent_events():
+    return [hub.get_metrics() for hub in SSE_HUBS]
 
 
 @router.get(path="/check_server", response_model=MaintenanceActionResponseModel,
@@ -202,12 +234,27 @@ def create_or_recreate_all_database_tables(user_admin: Annotated[User, Depends(g
         with Session(engine) as session:
             # Removing trigger function with trigger (SQLModel.metadata.drop_all() removes only tables)
             session.connection().execute(text("DROP FUNCTION IF EXISTS notify_on_new_defect CASCADE;"))
+            session.connection().execute(text("DROP FUNCTION IF EXISTS notify_on_new_log CASCADE;"))
             session.commit()
 
     SQLModel.metadata.drop_all(engine)
     SQLModel.metadata.create_all(engine)
 
-    # Creating trigger and trigger function for the table "defects" (apart the case when running in the test mode)
+    # Optional monthly partitioning of the fastest-growing tables "objects" and "history"
+    if settings.objects_partitioning:
+        with engine.begin() as connection:
+            enable_partitioning(connection)
+    # Optional copies of objects' "time" and "type" in the dependent tables (the triggers are required in the test
+    # mode too, because they keep the data consistent)
+    if settings.denormalized_timestamps:
+        with engine.begin() as connection:
+            enable_denormalized_timestamps(connection)
+    # Versions of the changes of the defects for the synchronization of the clients (required in the test mode too)
+    with engine.begin() as connection:
+        enable_defect_change_tracking(connection)
+
+    # Creating triggers and trigger functions for the tables "defects" and "history" (apart the case when running
+    # in the test mode)
     raw_sql = \
         """
         CREATE OR REPLACE FUNCTION notify_on_new_defect()
@@ -225,7 +272,7 @@ def create_or_recreate_all_database_tables(user_admin: Annotated[User, Depends(g
         AFTER INSERT ON defects
         FOR EACH ROW
         EXECUTE FUNCTION notify_on_new_defect();
-        """
+        """ + NEW_LOG_TRIGGER_DDL
     if not test_mode:
         with Session(engine) as session:
             session.connection().execute(text(raw_sql))
@@ -390,5 +437,10 @@ def get_user_notification_settings():
 @router.put(path="/update_user_notification_settings", response_model=UserNotificationSettings,
             dependencies=[Depends(get_current_admin_user)])
 def update_user_notification_settings(updated_settings: UserNotificationSettings):
-    save_user_settings(updated_settings.model_dump())
+    new_settings = updated_settings.model_dump()
+    # Logged here and not by the subscriber of the store, because the subscribers are also called by reloading
+    # of the file, which may happen on the event loop and in every worker process
+    if save_user_settings(new_settings):
+        # Action logging
+        create_log_record("info", f"User notification settings were changed: {dumps(new_settings)}")
     return updated_settings
@@ -2,18 +2,26 @@ from email.mime.multipart import MIMEMultipart
 from email.mime.text import MIMEText
 from email.mime.base import MIMEBase
 from email import encoders
+from email.utils import parsedate_to_datetime
 import mimetypes
 
 from io import BytesIO
 from os.path import exists
 from base64 import urlsafe_b64encode
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta, timezone
 from enum import Enum
+from functools import partial
+from threading import Lock, local
+from time import monotonic
 from typing import IO
-import requests
+import asyncio
 
 from fastapi import APIRouter, Depends, HTTPException, UploadFile, File
+from fastapi.concurrency import run_in_threadpool
 
 from telegram import Bot
+from telegram.request import HTTPXRequest
 import telegram.error
 
 from google.auth.exceptions import RefreshError, DefaultCredentialsError
@@ -21,21 +29,43 @@ from google.auth.transport.requests import Request
 from google.oauth2.credentials import Credentials
 from google_auth_oauthlib.flow import InstalledAppFlow
 from googleapiclient.discovery import build
+from googleapiclient.http import build_http
 from googleapiclient.errors import HttpError
+from google_auth_httplib2 import AuthorizedHttp
 
 from application.config import settings
 from application.models.api_models import (TelegramNotification, GmailNotification, ServiceInfoResponseModel,
-                                           TelegramNotificationResponseModel, GmailNotificationResponseModel)
+                                           TelegramNotificationResponseModel, GmailNotificationResponseModel,
+                                           NotificationOutboxResponseModel, MaintenanceActionResponseModel,
+                                           NotificationRateLimitResponseModel)
+from application.notification_outbox import get_notification_outbox_statistics, requeue_dead_notifications
 from application.services.authentication_service import get_current_admin_user
 from application.services.logging_service import create_log_record
+from application.telegram_chat_store import load_telegram_chats, save_telegram_chats
 
 router = APIRouter(prefix="/notification", tags=["Notification Service"],
                    dependencies=[Depends(get_current_admin_user)])
 
-telegram_bot = Bot(token=settings.telegram_bot_token)
+TELEGRAM_CONNECTION_POOL_SIZE = 8
+TELEGRAM_CHATS_DISCOVERY_INTERVAL_SECONDS = 60
+
+# One pooled http-client with keep-alive connections for all Bot API calls (including chats discovery)
+telegram_request = HTTPXRequest(connection_pool_size=TELEGRAM_CONNECTION_POOL_SIZE)
+telegram_bot = Bot(token=settings.telegram_bot_token, base_url=settings.telegram_api_base_url,
+                   request=telegram_request, get_updates_request=telegram_request)
+telegram_chats_lock = asyncio.Lock()
+telegram_chats = None  # pylint: disable=C0103
+last_telegram_chats_discovery_time = float("-inf")
 
 GOOGLE_CLIENT_SECRET_FILE = "client_secret.json"
+GOOGLE_TOKEN_FILE = "token.json"
 GOOGLE_SCOPES = ["https://www.googleapis.com/auth/gmail.send"]
+GMAIL_CREDENTIALS_REFRESH_MARGIN_SECONDS = 300
+GMAIL_CREDENTIALS_CHECK_INTERVAL_SECONDS = 600
+GMAIL_SENDING_THREADS = 4
+# Gmail API doesn't always tell how long to wait after exceeding the quota
+GMAIL_DEFAULT_RETRY_AFTER_SECONDS = 60
+RATE_LIMITED_SENDING_ATTEMPTS = 3
 
 
 class NotificationSendingErrorType(Enum):
@@ -48,6 +78,7 @@ class NotificationSendingErrorType(Enum):
     HTTP_ERROR = "Some http-error while sending notification by Gmail"
     INCORRECT_CREDENTIALS = "Credentials not found or incorrect"
     INVALID_MESSAGE_FORMAT = "Invalid message format"
+    RATE_LIMIT_EXCEEDED = "Sending quota of the notification provider is exceeded, try again later"
 
 
 notification_error_codes = {
@@ -58,10 +89,112 @@ notification_error_codes = {
     NotificationSendingErrorType.GMAIL_CLIENT_SECRET_FILE_ABSENCE: 403,
     NotificationSendingErrorType.HTTP_ERROR: 403,
     NotificationSendingErrorType.INCORRECT_CREDENTIALS: 403,
-    NotificationSendingErrorType.INVALID_MESSAGE_FORMAT: 500
+    NotificationSendingErrorType.INVALID_MESSAGE_FORMAT: 500,
+    NotificationSendingErrorType.RATE_LIMIT_EXCEEDED: 429
 }
 
 
+class TokenBucket:
+    """
+    Token bucket with the given rate and capacity (burst size) in the form of the "virtual scheduling": instead of
+    the count of tokens the theoretical time of the next sending is stored, so a sending beyond the quota gets the
+    time to wait and the waiting sendings are served in the order of the arrival
+    """
+
+    def __init__(self, rate: float, capacity: float = 1):
+        self.interval = 1 / rate
+        self.tolerance = (max(1.0, capacity) - 1) * self.interval
+        self.theoretical_time = float("-inf")
+
+    def reserve(self, now: float):
+        """
+        Take a token and return the time when it is available
+        """
+        theoretical_time = max(self.theoretical_time, now)
+        start_time = max(theoretical_time - self.tolerance, now)
+        self.theoretical_time = theoretical_time + self.interval
+        return start_time
+
+    def block_until(self, until: float):
+        self.theoretical_time = max(self.theoretical_time, until + self.tolerance)
+
+    def get_wait_time(self, now: float):
+        return max(0.0, self.theoretical_time - self.tolerance - now)
+
+
+class NotificationRateLimiter:
+    """
+    Per-channel and per-recipient quotas of the notification sending. Sendings beyond the quota wait for their turn
+    instead of failing on the provider side. The sendings are spread evenly without bursts, because the providers
+    count the quotas in sliding windows. The limiter is thread-safe because Gmail sending runs in threads
+    """
+
+    def __init__(self, channel_rates: dict[str, float], recipient_rates: dict[str, float]):
+        self.channel_rates = channel_rates
+        self.recipient_rates = recipient_rates
+        self._channel_buckets = {}
+        self._recipient_buckets = {}
+        self._lock = Lock()
+
+    def _get_bucket(self, channel: str, recipient: str | None):
+        """
+        Bucket of the recipient or of the whole channel if the recipient isn't given (None if there is no quota)
+        """
+        rates, buckets, key = ((self.channel_rates, self._channel_buckets, channel) if recipient is None else
+                               (self.recipient_rates, self._recipient_buckets, (channel, recipient)))
+        if rates.get(channel, 0) <= 0:
+            return None
+        if key not in buckets:
+            buckets[key] = TokenBucket(rates[channel])
+        return buckets[key]
+
+    def reserve(self, channel: str, recipient: str | None = None, now: float | None = None):
+        """
+        Returns the time to wait before the sending
+        """
+        now = monotonic() if now is None else now
+        with self._lock:
+            bucket = self._get_bucket(channel, recipient)
+            return bucket.reserve(now) - now if bucket else 0.0
+
+    async def acquire(self, channel: str, recipient: str):
+        # The quota of the channel is taken only when the turn of the recipient has come, so the recipients
+        # waiting for their own quota don't hold the quota of the channel
+        for bucket_recipient in (recipient, None):
+            wait_time = self.reserve(channel, bucket_recipient)
+            if wait_time > 0:
+                await asyncio.sleep(wait_time)
+
+    def block(self, channel: str, recipient: str | None, seconds: float, now: float | None = None):
+        """
+        Pause the sending to the recipient (or through the whole channel) when the provider has asked to retry
+        after the given time
+        """
+        now = monotonic() if now is None else now
+        with self._lock:
+            bucket = self._get_bucket(channel, recipient)
+            if bucket:
+                bucket.block_until(now + seconds)
+
+    def get_wait_times(self, now: float | None = None):
+        now = monotonic() if now is None else now
+        with self._lock:
+            return [NotificationRateLimitResponseModel(
+                channel=channel,
+                wait_seconds=max([bucket.get_wait_time(now) for (bucket_channel, _), bucket
+                                  in self._recipient_buckets.items() if bucket_channel == channel] +
+                                 [self._channel_buckets[channel].get_wait_time(now)
+                                  if channel in self._channel_buckets else 0.0]),
+                recipients_wait_seconds={recipient: bucket.get_wait_time(now) for (bucket_channel, recipient), bucket
+                                         in self._recipient_buckets.items()
+                                         if bucket_channel == channel and bucket.get_wait_time(now) > 0}
+            ) for channel in ("Telegram", "Gmail")]
+
+
+notification_rate_limiter = NotificationRateLimiter(channel_rates=settings.notification_channel_rate_limits,
+                                                    recipient_rates=settings.notification_recipient_rate_limits)
+
+
 def _form_io_file_from_file_on_server(filename: str | None = None):
     io_file = None
     if filename:
@@ -81,71 +214,136 @@ async def _form_io_file_from_attached_file(attached_file: UploadFile | None = Fi
     return io_file
 
 
-def write_telegram_user_name_and_chat_id_to_env_file(user_name, user_chat_id):
-    settings.telegram_user_name = user_name
-    settings.telegram_user_chat_id = user_chat_id
-
-    settings_dump = settings.model_dump()
-    settings_to_text = "\n".join(
-        [f"{param_name} = \"{param_value}\"" for param_name, param_value in settings_dump.items()])
-
-    with open(".env", "w", encoding="utf-8") as env:
-        env.write(settings_to_text)
-
-
-def get_user_chat_id_in_telegram():
+async def get_telegram_recipients():
     """
-    Returns a tuple (<id>, <username>, <error_message>), where <id> is the id of the Telegram chat with the user
-    (if the user has once sent a message to the bot), <username> is unique user nick seems like "@test_user",
-    <error_message> gives information in the case of emergency situation.
+    Returns a tuple (<recipients>, <error_type>), where <recipients> is the dictionary {<chat id>: <username>} of the
+    users who have once sent a message to the bot, <username> is unique user nick seems like "@test_user",
+    <error_type> gives information in the case of emergency situation.
+    New chats are discovered from the bot updates not more often than once in the discovery interval.
     """
-    if settings.telegram_user_name != "" and settings.telegram_user_chat_id != "":
-        return settings.telegram_user_chat_id, settings.telegram_user_name, None
-
-    url = f"https://api.telegram.org/bot{settings.telegram_bot_token}/getUpdates"
-    response = requests.get(url, timeout=3)
-    updates = response.json()
-    if not updates["ok"]:
-        return None, None, NotificationSendingErrorType.INVALID_BOT_TOKEN
-    if len(updates["result"]) > 0:
-        user_chat_id = updates["result"][-1]["message"]["chat"]["id"]
-        user_name = '@' + updates["result"][-1]["message"]["chat"]["username"]
-        write_telegram_user_name_and_chat_id_to_env_file(user_name, user_chat_id)
-        return user_chat_id, user_name, None
-    return None, None, NotificationSendingErrorType.CHAT_WITH_USER_IS_NOT_REGISTERED
+    global telegram_chats, last_telegram_chats_discovery_time  # pylint: disable=W0603
+
+    async with telegram_chats_lock:
+        if telegram_chats is None:
+            telegram_chats = load_telegram_chats()
+        recipients = dict(telegram_chats["chats"])
+        if settings.telegram_user_chat_id != "":
+            recipients.setdefault(str(settings.telegram_user_chat_id), settings.telegram_user_name)
+        if recipients and monotonic() - last_telegram_chats_discovery_time < TELEGRAM_CHATS_DISCOVERY_INTERVAL_SECONDS:
+            return recipients, None
+
+        last_telegram_chats_discovery_time = monotonic()
+        last_update_id = telegram_chats["last_update_id"]
+        try:
+            updates = await telegram_bot.get_updates(offset=last_update_id + 1 if last_update_id is not None else None,
+                                                     timeout=0, allowed_updates=["message"])
+        except telegram.error.InvalidToken:
+            return recipients, None if recipients else NotificationSendingErrorType.INVALID_BOT_TOKEN
+        except telegram.error.TelegramError:
+            return recipients, None if recipients else NotificationSendingErrorType.TELEGRAM_ERROR
+
+        if updates:
+            for update in updates:
+                chat = update.effective_chat
+                if chat and chat.type == chat.PRIVATE:
+                    telegram_chats["chats"][str(chat.id)] = f"@{chat.username}" if chat.username else chat.full_name
+            telegram_chats["last_update_id"] = updates[-1].update_id
+            save_telegram_chats(telegram_chats)
+            recipients.update(telegram_chats["chats"])
+
+        if not recipients:
+            return recipients, NotificationSendingErrorType.CHAT_WITH_USER_IS_NOT_REGISTERED
+        return recipients, None
+
+
+async def _send_data_to_telegram_chat(chat_id: str, message: str, document: bytes | None = None,
+                                      filename: str | None = None):
+    for _ in range(RATE_LIMITED_SENDING_ATTEMPTS):
+        await notification_rate_limiter.acquire("Telegram", chat_id)
+        try:
+            if document is None:
+                await telegram_bot.send_message(chat_id=chat_id, text=message)
+            else:
+                await telegram_bot.send_document(chat_id=chat_id, document=document, filename=filename,
+                                                 caption=message)
+        except telegram.error.RetryAfter as e:
+            retry_after = e.retry_after
+            if isinstance(retry_after, timedelta):
+                retry_after = retry_after.total_seconds()
+            notification_rate_limiter.block("Telegram", chat_id, retry_after)
+            continue
+        except telegram.error.InvalidToken:
+            return NotificationSendingErrorType.INVALID_BOT_TOKEN
+        except telegram.error.TelegramError:
+            return NotificationSendingErrorType.TELEGRAM_ERROR
+        return None
+    return NotificationSendingErrorType.RATE_LIMIT_EXCEEDED
 
 
 async def _send_data_by_telegram(message: str, attached_file: IO | None = None):
-    user_chat_id, username, error_type = get_user_chat_id_in_telegram()
+    """
+    Send the message to all registered recipients concurrently. Returns a tuple (<usernames>, <error_type>), where
+    <error_type> is not None only if no recipient has received the message
+    """
+    recipients, error_type = await get_telegram_recipients()
 
-    if user_chat_id is None:
+    if not recipients:
         # Action logging
-        create_log_record("error", "Error has occurred while sending notification via Telegram. "
-                                   f"Error info: \"{error_type.value}\"")
-        return username, error_type
-
-    error_type = None
-    try:
-        if attached_file is None:
-            await telegram_bot.send_message(chat_id=user_chat_id, text=message)
+        await run_in_threadpool(create_log_record, "error", "Error has occurred while sending notification via "
+                                                            f"Telegram. Error info: \"{error_type.value}\"")
+        return None, error_type
+
+    # The file is read once because the same content is sent to every recipient
+    document, filename = None, None
+    if attached_file is not None:
+        document = attached_file.read()
+        filename = getattr(attached_file, "name", None)
+
+    chat_ids = list(recipients)
+    errors = await asyncio.gather(*(_send_data_to_telegram_chat(chat_id, message, document, filename)
+                                    for chat_id in chat_ids))
+    delivered_to = []
+    for chat_id, error_type in zip(chat_ids, errors):
+        if error_type is None:
+            delivered_to.append(recipients[chat_id])
         else:
-            await telegram_bot.send_document(chat_id=user_chat_id, document=attached_file, caption=message)
-    except telegram.error.InvalidToken:
-        error_type = NotificationSendingErrorType.INVALID_BOT_TOKEN
-        # Action logging
-        create_log_record("error", "Error has occurred while sending notification via Telegram. "
-                                   f"Error info: \"{error_type.value}\"")
-        return username, error_type
-    except telegram.error.TelegramError:
-        error_type = NotificationSendingErrorType.TELEGRAM_ERROR
+            # Action logging
+            await run_in_threadpool(create_log_record, "error", "Error has occurred while sending notification via "
+                                                                f"Telegram to {recipients[chat_id]}. "
+                                                                f"Error info: \"{error_type.value}\"")
+
+    usernames = ", ".join(delivered_to)
+    if not delivered_to:
+        return usernames, next(error_type for error_type in errors if error_type is not None)
+
+    # Action logging
+    await run_in_threadpool(create_log_record, "message", f"Notification \"{message}\" sent to {usernames} "
+                                                          f"via Telegram")
+    return usernames, None
+
+
+async def send_telegram_notification_to_chat_from_server(chat_id: str, message: str, io_file: IO | None = None):
+    """
+    Send the message to one recipient (the outbox workers deliver notifications to every chat separately, so that
+    only the chats which haven't received the message are retried)
+    """
+    document, filename = None, None
+    if io_file is not None:
+        document = io_file.read()
+        filename = getattr(io_file, "name", None)
+
+    error_type = await _send_data_to_telegram_chat(chat_id, message, document, filename)
+    if error_type:
         # Action logging
-        create_log_record("error", "Error has occurred while sending notification via Telegram. "
-                                   f"Error info: \"{error_type.value}\"")
-        return username, error_type
+        await run_in_threadpool(create_log_record, "error", "Error has occurred while sending notification via "
+                                                            f"Telegram to the chat with id={chat_id}. "
+                                                            f"Error info: \"{error_type.value}\"")
+        return notification_error_codes[error_type], error_type.value
 
     # Action logging
-    create_log_record("message", f"Notification \"{message}\" sent to {username} via Telegram")
-    return username, error_type
+    await run_in_threadpool(create_log_record, "message", f"Notification \"{message}\" sent to the chat with "
+                                                          f"id={chat_id} via Telegram")
+    return None, None
 
 
 async def send_telegram_notification_from_server(message: str, io_file: IO | None = None,
@@ -174,36 +372,156 @@ def authenticate():
     return credentials, None
 
 
-def get_credentials():
+class GmailClientManager:
     """
-    Retrieve credentials from "token.json" (a token expires in one hour) or create new token with credentials
+    Long-lived Gmail client: credentials and the built service are cached in memory, credentials are refreshed
+    in the background shortly before expiry and "token.json" is rewritten only when the token has changed
     """
-    credentials = None
-    error_message = None
 
-    if exists("token.json"):
-        try:
-            credentials = Credentials.from_authorized_user_file(filename="token.json", scopes=GOOGLE_SCOPES)
-        except ValueError:
-            # The corrupted token has to be regenerated
-            credentials, error_message = authenticate()
-        if credentials.expired:
-            if credentials.refresh_token:
+    def __init__(self):
+        self._lock = Lock()
+        self._credentials = None
+        self._service = None
+        self._saved_token = None
+        # httplib2 is not thread-safe, so every sending thread has its own authorized http-client
+        self._thread_local = local()
+
+    def _save_token_if_changed(self):
+        token = self._credentials.to_json()
+        if token != self._saved_token:
+            with open(GOOGLE_TOKEN_FILE, "w", encoding="utf-8") as token_file:
+                token_file.write(token)
+            self._saved_token = token
+
+    def get_credentials(self):
+        """
+        Retrieve credentials from memory or "token.json" (a token expires in one hour), refresh them if they expire
+        soon or create new token with credentials
+        """
+        with self._lock:
+            error_message = None
+            if self._credentials is None:
+                if exists(GOOGLE_TOKEN_FILE):
+                    try:
+                        self._credentials = Credentials.from_authorized_user_file(filename=GOOGLE_TOKEN_FILE,
+                                                                                  scopes=GOOGLE_SCOPES)
+                        self._saved_token = self._credentials.to_json()
+                    except ValueError:
+                        # The corrupted token has to be regenerated
+                        self._credentials, error_message = authenticate()
+                else:
+                    self._credentials, error_message = authenticate()
+
+            # Property "expired" is true a few minutes before the real expiration
+            if self._credentials and self._credentials.expired:
+                if self._credentials.refresh_token:
+                    try:
+                        self._credentials.refresh(Request())
+                    except RefreshError:
+                        # RefreshError means that the refresh_token has expired and the usual token has to be
+                        # regenerated
+                        self._credentials, error_message = authenticate()
+                else:
+                    self._credentials, error_message = authenticate()
+
+            if self._credentials is None:
+                self._service = None
+                return None, error_message
+            self._save_token_if_changed()
+            return self._credentials, None
+
+    def get_service(self):
+        """
+        Returns a tuple (<service>, <http-client of the current thread>, <error_type>)
+        """
+        credentials, error_type = self.get_credentials()
+        if credentials is None:
+            return None, None, error_type
+
+        with self._lock:
+            if self._service is None:
+                self._service = build(serviceName="gmail", version="v1", credentials=credentials,
+                                      client_options={"api_endpoint": settings.gmail_api_base_url})
+            service = self._service
+        if getattr(self._thread_local, "credentials", None) is not credentials:
+            self._thread_local.credentials = credentials
+            self._thread_local.http = AuthorizedHttp(credentials, http=build_http())
+        return service, self._thread_local.http, None
+
+    def set_credentials(self, credentials: Credentials):
+        """
+        Use the given credentials without saving them to "token.json" (e.g. for the local stand-in of Gmail API)
+        """
+        with self._lock:
+            self._credentials = credentials
+            self._saved_token = credentials.to_json()
+            self._service = None
+
+    def seconds_until_refresh(self):
+        with self._lock:
+            if self._credentials is None or self._credentials.expiry is None:
+                return GMAIL_CREDENTIALS_CHECK_INTERVAL_SECONDS
+            expiry = self._credentials.expiry.replace(tzinfo=timezone.utc)
+        seconds = (expiry - datetime.now(timezone.utc)).total_seconds() - GMAIL_CREDENTIALS_REFRESH_MARGIN_SECONDS
+        # Lower bound prevents busy looping when the refresh has failed
+        return min(max(seconds, 30), GMAIL_CREDENTIALS_CHECK_INTERVAL_SECONDS)
+
+    async def refresh_credentials_periodically(self):
+        """
+        Background task refreshing credentials before expiry, so that sending doesn't wait for the refresh
+        """
+        while True:
+            await asyncio.sleep(self.seconds_until_refresh())
+            # Interactive authentication can't be performed in the background, so only loaded token is refreshed
+            await _run_in_gmail_executor(self._refresh_before_expiry)
+
+    def _refresh_before_expiry(self):
+        with self._lock:
+            if self._credentials and self._credentials.refresh_token and self._credentials.expiry and \
+                    self._credentials.expiry - datetime.now(timezone.utc).replace(tzinfo=None) < \
+                    timedelta(seconds=GMAIL_CREDENTIALS_REFRESH_MARGIN_SECONDS):
                 try:
-                    credentials.refresh(Request())
+                    self._credentials.refresh(Request())
                 except RefreshError:
-                    # RefreshError means that the refresh_token has expired and the usual token has to be regenerated
-                    credentials, error_message = authenticate()
-            else:
-                credentials, error_message = authenticate()
-    else:
-        credentials, error_message = authenticate()
+                    # Interactive authentication will be performed on the next sending
+                    return
+                self._save_token_if_changed()
 
-    if credentials:
-        with open("token.json", "w", encoding="utf-8") as token:
-            token.write(credentials.to_json())
 
-    return credentials, error_message
+gmail_client_manager = GmailClientManager()
+gmail_executor = ThreadPoolExecutor(max_workers=GMAIL_SENDING_THREADS, thread_name_prefix="gmail_sending")
+
+
+def parse_retry_after(value: str | None):
+    """
+    Retry-After header contains either the count of seconds or the HTTP-date. Returns the count of seconds to wait
+    (GMAIL_DEFAULT_RETRY_AFTER_SECONDS if the header is missing or malformed)
+    """
+    if value is None:
+        return GMAIL_DEFAULT_RETRY_AFTER_SECONDS
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        retry_time = parsedate_to_datetime(value)
+    except (TypeError, ValueError):
+        return GMAIL_DEFAULT_RETRY_AFTER_SECONDS
+    if retry_time.tzinfo is None:
+        retry_time = retry_time.replace(tzinfo=timezone.utc)
+    return max(0.0, (retry_time - datetime.now(timezone.utc)).total_seconds())
+
+
+async def _run_in_gmail_executor(function, *args, **kwargs):
+    """
+    Gmail API client is synchronous, so sending runs in the thread pool and doesn't block the event loop
+    """
+    return await asyncio.get_running_loop().run_in_executor(gmail_executor, partial(function, *args, **kwargs))
+
+
+async def _send_data_by_gmail_within_quota(subject: str, text: str, attached_file: IO | None = None):
+    await notification_rate_limiter.acquire("Gmail", settings.gmail_address)
+    return await _run_in_gmail_executor(_send_data_by_gmail, subject=subject, text=text, attached_file=attached_file)
 
 
 def _send_data_by_gmail(subject: str, text: str, attached_file: IO | None = None):
@@ -233,27 +551,29 @@ def _send_data_by_gmail(subject: str, text: str, attached_file: IO | None = None
 
     formatted_message = {'raw': urlsafe_b64encode(message.as_bytes()).decode()}
 
-    credentials, error_type = get_credentials()
-    if credentials is None:
-        # Action logging
-        create_log_record("error", "Error has occurred while sending notification via Gmail. "
-                                   f"Error info: \"{error_type.value}\"")
-        return error_type
-
     try:
-        gmail_service = build(serviceName="gmail", version="v1", credentials=credentials)
+        gmail_service, http, error_type = gmail_client_manager.get_service()
     except DefaultCredentialsError:
         error_type = NotificationSendingErrorType.INCORRECT_CREDENTIALS
         # Action logging
         create_log_record("error", "Error has occurred while sending notification via Gmail. "
                                    f"Error info: {error_type.value}")
         return error_type
+    if gmail_service is None:
+        # Action logging
+        create_log_record("error", "Error has occurred while sending notification via Gmail. "
+                                   f"Error info: \"{error_type.value}\"")
+        return error_type
 
     try:
         # pylint: disable=E1101
-        gmail_service.users().messages().send(userId="me", body=formatted_message).execute()
-    except HttpError:
+        gmail_service.users().messages().send(userId="me", body=formatted_message).execute(http=http)
+    except HttpError as e:
         error_type = NotificationSendingErrorType.HTTP_ERROR
+        if e.status_code == 429 or (e.status_code == 403 and "rateLimitExceeded" in str(e.error_details)):
+            error_type = NotificationSendingErrorType.RATE_LIMIT_EXCEEDED
+            notification_rate_limiter.block("Gmail", settings.gmail_address,
+                                            parse_retry_after(e.resp.get("retry-after")))
         # Action logging
         create_log_record("error", "Error has occurred while sending notification via Gmail. "
                                    f"Error info: {error_type.value}")
@@ -272,12 +592,12 @@ def _send_data_by_gmail(subject: str, text: str, attached_file: IO | None = None
     return None
 
 
-def send_gmail_notification_from_server(subject: str, text: str, io_file: IO | None = None,
+async def send_gmail_notification_from_server(subject: str, text: str, io_file: IO | None = None,
                                               filename: str | None = None):
     if io_file is None:
         io_file = _form_io_file_from_file_on_server(filename)
 
-    error_type = _send_data_by_gmail(subject=subject, text=text, attached_file=io_file)
+    error_type = await _send_data_by_gmail_within_quota(subject=subject, text=text, attached_file=io_file)
     if error_type:
         return notification_error_codes[error_type], error_type.value
     return None, None
@@ -312,7 +632,8 @@ async def send_gmail_notification(notification: GmailNotification = Depends(),
                                   attached_file: UploadFile | None = File(None)):
     io_file = await _form_io_file_from_attached_file(attached_file)
 
-    error_type = _send_data_by_gmail(subject=notification.subject, text=notification.text, attached_file=io_file)
+    error_type = await _send_data_by_gmail_within_quota(subject=notification.subject, text=notification.text,
+                                                        attached_file=io_file)
     if error_type:
         raise HTTPException(status_code=notification_error_codes[error_type], detail=error_type.value)
 
@@ -323,3 +644,25 @@ async def send_gmail_notification(notification: GmailNotification = Depends(),
         sent_text=notification.text,
         attached_file=attached_file.filename if attached_file else None
     )
+
+
+@router.get("/outbox", response_model=NotificationOutboxResponseModel)
+def get_statistics_of_notification_outbox():
+    return get_notification_outbox_statistics()
+
+
+@router.get("/rate_limits", response_model=list[NotificationRateLimitResponseModel])
+def get_current_wait_times_of_notification_sending():
+    return notification_rate_limiter.get_wait_times()
+
+
+@router.post("/outbox/requeue_dead", response_model=MaintenanceActionResponseModel)
+def requeue_dead_notifications_in_outbox():
+    count_of_requeued = requeue_dead_notifications()
+
+    # Action logging
+    create_log_record("action_info", f"{count_of_requeued} undelivered notifications were returned to the outbox")
+
+    return MaintenanceActionResponseModel(
+        maintenance_info=f"{count_of_requeued} undelivered notifications were returned to the outbox"
+    )
@@ -1,418 +1,360 @@
-import base64
+import asyncio
+from concurrent.futures.process import BrokenProcessPool
 from datetime import datetime
 from io import BytesIO
-import binascii
 
-import PIL
-
-from fastapi import APIRouter, Depends, HTTPException
-from reportlab.lib.colors import Color
-from reportlab.lib.pagesizes import A4, landscape
-from reportlab.platypus import SimpleDocTemplate, Table, TableStyle, Paragraph, Image, ListFlowable, Spacer
-from reportlab.lib import colors
-from reportlab.lib.styles import getSampleStyleSheet, ParagraphStyle
+from fastapi import APIRouter, Depends, HTTPException, BackgroundTasks
+from fastapi.concurrency import run_in_threadpool
+from fastapi.responses import StreamingResponse
+from sqlmodel import Session, select, func, text
 
+from application.config import settings
+from application.db_connection import engine
 from application.user_settings import load_user_settings
-from application.models.api_models import (ServiceInfoResponseModel, DefectResponseModel, AllDefectsReportResponseModel,
-                                           OneDefectReportResponseModel, ConveyorInfoReportResponseModel)
+from application.report_building import (ReportBuildingError, build_pdf_report_of_all_defects,
+                                         build_pdf_report_of_defect, build_pdf_report_of_conveyor,
+                                         build_csv_report_of_all_defects, build_csv_report_of_defect,
+                                         build_csv_report_of_conveyor)
+from application.report_jobs import (report_build_semaphore, get_report_process_pool, reset_report_process_pool,
+                                     get_report_path, save_report, iterate_report, create_report_job, get_report_job,
+                                     update_report_job)
+from application.report_cache import report_cache, get_report_cache_key
+from application.defect_changes import get_version_of_defects
+from application.denormalized_timestamps import are_denormalized_timestamps_used
+from application.models.db_models import (ReportJob, Object, DefectType, Defect, Photo, ConveyorParameters,
+                                          ConveyorStatus)
+from application.models.api_models import (ServiceInfoResponseModel, AllDefectsReportResponseModel,
+                                           OneDefectReportResponseModel, ConveyorInfoReportResponseModel,
+                                           ReportJobResponseModel, DefectReportModel, DefectResponseModel)
 from application.services.authentication_service import get_current_admin_user
 from application.services.notification_service import (send_telegram_notification_from_server,
                                                        send_gmail_notification_from_server)
 from application.services.defect_info_service import (get_count_of_all_and_extreme_and_critical_defects,
-                                                      get_all_defects, get_defect_by_id, get_critical_defects,
-                                                      get_extreme_defects)
+                                                      determine_defect_criticality)
 from application.services.conveyor_info_service import get_base_conveyor_parameters, get_general_status_of_conveyor
 from application.services.logging_service import create_log_record
 
 router = APIRouter(prefix="/report", tags=["Reports Generation Service"],
                    dependencies=[Depends(get_current_admin_user)])
 
+# (<report>, <document type>) -> function building the report in the pool of processes
+REPORT_BUILDERS = {
+    ("all_defects", "pdf"): build_pdf_report_of_all_defects,
+    ("defect", "pdf"): build_pdf_report_of_defect,
+    ("conveyor", "pdf"): build_pdf_report_of_conveyor,
+    ("all_defects", "csv"): build_csv_report_of_all_defects,
+    ("defect", "csv"): build_csv_report_of_defect,
+    ("conveyor", "csv"): build_csv_report_of_conveyor,
+}
+MEDIA_TYPES = {"pdf": "application/pdf", "csv": "text/csv"}
+
 
-def format_defects_to_display_in_table(defects: list[DefectResponseModel], photo_size: (int, int)):
+def describe_report(job: ReportJob):
+    """
+    Returns (<filename>, <description for the logs>, <caption of the notification>)
     """
-    Parse array of json-defects into list of lists with values only.
-    Also format timestamp value to readable format and replace base64-string with real photo in DefectResponseModel obj
+    doc_type = job.doc_type
+    if job.report == "all_defects":
+        return f"report_of_all_defects.{doc_type}", "the all defects", f"{doc_type.upper()}-report of all defects"
+    if job.report == "defect":
+        defect_id = job.parameters["defect_id"]
+        return (f"report_of_defect_id_{defect_id}.{doc_type}", f"the defect with id={defect_id}",
+                f"{doc_type.upper()}-report of defect with id={defect_id}")
+    return (f"report_of_conveyor_info.{doc_type}", "the conveyor parameters and status",
+            f"{doc_type.upper()}-report of conveyor parameters and status")
+
+
+def get_defects_for_report(include_photos: bool, defect_id: int | None = None):
     """
-    table_values = [list(defect.model_dump().values()) for defect in defects]
-    for defect_values in table_values:
-        timestamp = datetime.fromisoformat(str(defect_values[1]))
-        defect_values[1] = timestamp.strftime("%d.%m.%Y\n%H:%M:%S")
-        base64_photo = defect_values[-1]
-        image_raw_data = None
-        try:
-            image_raw_data = base64.b64decode(base64_photo)
-        except (binascii.Error, TypeError) as e:
-            error_type = "Decoding error"
-            error_text = "incorrect base64-encoded representation of the photo"
-            # Action logging
-            create_log_record("error", "Failed to generate table of the defects in pdf-report: "
-                                       f"{error_text}")
-            raise HTTPException(status_code=500, detail=f"{error_type}: {error_text}") from e
-        try:
-            image_buffer = BytesIO(image_raw_data)
-            image = Image(image_buffer, width=photo_size[0], height=photo_size[1])
-        except (PIL.UnidentifiedImageError, TypeError) as e:
-            error_type = "Unidentified image error"
-            error_text = "raw representation of the photo is not bytes or has corrupted bytes sequence"
-            # Action logging
-            create_log_record("error", "Failed to generate table of the defects in pdf-report: "
-                                       f"{error_text}")
-            raise HTTPException(status_code=500, detail=f"{error_type}: {error_text}") from e
-        defect_values[-1] = image
-    return table_values
-
-
-def render_table_of_defects(table: Table, table_data: list):
+    One query of the columns shown in the reports (the raw photos are selected only if they are needed), the counts of
+    extreme and critical defects are computed while the rows are read.
+    Returns (<defects>, <count of extreme>, <count of critical>)
     """
-    Render base table style using TableStyle object.
-    Also apply TableStyle object to table lines with extreme and critical defects
+    # Base objects are joined only if the time isn't denormalized (the join by id checks every partition of "objects")
+    timestamp = Defect.time if are_denormalized_timestamps_used() else func.coalesce(Defect.time, Object.time)
+    columns = [Defect.id, timestamp.label("timestamp"), DefectType.name, DefectType.is_belt, Defect.box_width,
+               Defect.box_length, Defect.location_length_in_conv, Defect.location_width_in_conv, Defect.probability,
+               Defect.is_critical, Defect.is_extreme]
+    statement = select(*columns).join(DefectType, DefectType.id == Defect.type)
+    if not are_denormalized_timestamps_used():
+        statement = statement.join(Object, Object.id == Defect.obj_id)
+    if include_photos:
+        statement = statement.add_columns(Photo.image).join(Photo, Photo.id == Defect.photo_id)
+    if defect_id is not None:
+        statement = statement.where(Defect.id == defect_id)
+
+    defects, extreme_count, critical_count = [], 0, 0
+    with Session(engine) as session:
+        for row in session.exec(statement.order_by(Defect.id)):
+            extreme_count += row.is_extreme
+            critical_count += row.is_critical
+            defects.append(DefectReportModel(
+                id=row.id,
+                timestamp=row.timestamp,
+                type=row.name,
+                is_on_belt=row.is_belt,
+                box_width_in_mm=row.box_width,
+                box_length_in_mm=row.box_length,
+                longitudinal_position=row.location_length_in_conv,
+                transverse_position=row.location_width_in_conv,
+                probability=row.probability,
+                criticality=determine_defect_criticality(row),
+                photo=row.image if include_photos else None
+            ))
+    return defects, extreme_count, critical_count
+
+
+def gather_report_data(job: ReportJob):
+    """
+    Returns (<arguments of the report builder>, <response model of the report>). Raises HTTPException
+    if the defect is not found
+    """
+    if job.report == "all_defects":
+        all_defects, extreme_count, critical_count = get_defects_for_report(include_photos=job.doc_type == "pdf")
+        result = AllDefectsReportResponseModel(doc_type=job.doc_type, timestamp=datetime.now(),
+                                               total_count=len(all_defects), extreme_count=extreme_count,
+                                               critical_count=critical_count)
+        if job.doc_type == "pdf":
+            return (all_defects, extreme_count, critical_count), result
+        return (all_defects,), result
+
+    if job.report == "defect":
+        defect_id = job.parameters["defect_id"]
+        defects, _, _ = get_defects_for_report(include_photos=job.doc_type == "pdf", defect_id=defect_id)
+        if not defects:
+            raise HTTPException(status_code=404, detail=f"There is no defect with id={defect_id}")
+        # Photo isn't returned in the result of the job
+        defect = DefectResponseModel(**defects[0].model_dump(exclude={"photo"}), base64_photo="")
+        return (defects[0],), OneDefectReportResponseModel(doc_type=job.doc_type, timestamp=datetime.now(),
+                                                           defect=defect)
+
+    parameters = get_base_conveyor_parameters()
+    status_response = get_general_status_of_conveyor()
+    defects_count = get_count_of_all_and_extreme_and_critical_defects()
+    return ((parameters, status_response, defects_count),
+            ConveyorInfoReportResponseModel(doc_type=job.doc_type, timestamp=datetime.now(),
+                                            status=status_response.status))
+
+
+async def send_report_as_notification(io_file: BytesIO, caption: str):
+    """
+    The same buffer of the report is sent via both services (it is rewound before every sending)
     """
-    table.setStyle(TableStyle([
-        ('BACKGROUND', (0, 0), (-1, 0), colors.grey),
-        ('BACKGROUND', (0, 1), (-1, -1), colors.white),
-        ('TEXTCOLOR', (0, 0), (-1, 0), colors.black),
-        ('ALIGN', (0, 0), (-1, -1), 'CENTER'),
-        ('VALIGN', (0, 0), (-1, -1), 'MIDDLE'),
-        ('GRID', (0, 0), (-1, -1), 1, colors.black)
-    ]))
-
-    for i, _ in enumerate(table_data):
-        if table_data[i][9] == "extreme":
-            table.setStyle(TableStyle([
-                ('BACKGROUND', (0, i), (-1, i), colors.orange),
-            ]))
-        elif table_data[i][9] == "critical":
-            table.setStyle(TableStyle([
-                ('BACKGROUND', (0, i), (-1, i), colors.red),
-            ]))
-
-
-def convert_color_to_hex(color: Color):
-    r = int(color.red * 255)
-    g = int(color.green * 255)
-    b = int(color.blue * 255)
-    return f"#{r:02X}{g:02X}{b:02X}"
-
-
-async def send_report_as_notification(filename: str, caption: str):
     error_status_code, details = None, None
+    user_settings = load_user_settings()
 
     # Sending generated report via Telegram
-    if not load_user_settings() or "Telegram" in load_user_settings()["report_sending_scope"]:
-        error_status_code, details = await send_telegram_notification_from_server(message=caption,
-                                                                                  filename=filename)
+    if not user_settings or "Telegram" in user_settings["report_sending_scope"]:
+        io_file.seek(0)
+        error_status_code, details = await send_telegram_notification_from_server(message=caption, io_file=io_file)
     # Sending generated report via Gmail
-    if not load_user_settings() or "Gmail" in load_user_settings()["report_sending_scope"]:
-        error_status_code, details = send_gmail_notification_from_server(subject=caption, text="",
-                                                                               filename=filename)
+    if not user_settings or "Gmail" in user_settings["report_sending_scope"]:
+        io_file.seek(0)
+        error_status_code, details = await send_gmail_notification_from_server(subject=caption, text="",
+                                                                               io_file=io_file)
 
     return error_status_code, details
 
 
-@router.get(path="/", response_model=ServiceInfoResponseModel)
-def get_service_info():
-    return ServiceInfoResponseModel(
-        info="Service for generating reports on defects and conveyor status in .pdf or .csv format"
-    )
+# Versions of the rows read by the reports together with the defects: the id of the transaction which has written
+# the row (xmin) changes after every update, so the sum changes after renaming of the defect type or changing of its
+# thresholds (and so the criticality of the defects) and after replacing of the photo
+VERSION_OF_DEFECT_TYPES_AND_PHOTOS_QUERY = \
+    """
+    SELECT (SELECT COUNT(*) || ':' || COALESCE(SUM(xmin::TEXT::BIGINT), 0) FROM defect_type) || ':' ||
+           (SELECT COUNT(*) || ':' || COALESCE(SUM(xmin::TEXT::BIGINT), 0) FROM photo)
+    """
+# Time of the defects is taken from their base objects if it isn't denormalized (the denormalized time is copied into
+# the defects by the trigger, so the change of the time changes the version of the defects)
+VERSION_OF_BASE_OBJECTS_QUERY = \
+    """
+    SELECT COALESCE(SUM(objects.xmin::TEXT::BIGINT), 0) FROM objects JOIN defects ON objects.id = defects.obj_id
+    """
 
 
-@router.post(path="/all/pdf", response_model=AllDefectsReportResponseModel)
-async def upload_report_of_all_defects_in_pdf_format():
-    # pylint: disable=R0914
-    filename = "report_of_all_defects.pdf"
-    report_doc = SimpleDocTemplate(filename, pagesize=landscape(A4))
-    all_defects = get_all_defects()
-
-    # Paragraph style for header text line break
-    header_style = getSampleStyleSheet()["Normal"]
-    table_headers = ["ID", "Timestamp", "Type", Paragraph("Is on belt", header_style),
-                     Paragraph("Box width (mm)", header_style), Paragraph("Box length (mm)", header_style),
-                     Paragraph("Longitudinal position (mm)", header_style),
-                     Paragraph("Transverse position (mm)", header_style), "Probability", "Criticality", "Photo"]
-    table_values = format_defects_to_display_in_table(all_defects, (133, 100))
-    table_data = [table_headers] + table_values
-    table = Table(table_data, colWidths=[20, 75, 75, 40, 75, 75, 75, 75, 50, 50, 133],
-                  rowHeights=[30] + [100] * len(table_values))
-    render_table_of_defects(table, table_data)
-
-    title_style = getSampleStyleSheet()["Title"]
-    title_style.fontSize = 24
-    title_style.alignment = 1
-    title_style.spaceAfter = 16
-    title = Paragraph(f"REPORT ABOUT DEFECTS ({datetime.now().strftime("%d.%m.%Y - %H:%M")})", title_style)
-
-    extreme_defects = get_extreme_defects()
-    critical_defects = get_critical_defects()
-
-    statistics_style = getSampleStyleSheet()["Normal"]
-    general_statistics = ListFlowable(
-        [
-            Paragraph(f"Total count of defects: {len(all_defects)}", statistics_style),
-            Paragraph(f"Count of extreme: {len(extreme_defects)}", statistics_style),
-            Paragraph(f"Count of critical: {len(critical_defects)}", statistics_style),
-        ],
-        bulletType="bullet"
-    )
+def get_data_version_of_report(report: str):
+    """
+    Reports of the defects depend on the defects, their types, photos and base objects, the report of the conveyor
+    also on its parameters and status
+    """
+    with Session(engine) as session:
+        version = get_version_of_defects(session)
+        version += f":{session.connection().execute(text(VERSION_OF_DEFECT_TYPES_AND_PHOTOS_QUERY)).scalar_one()}"
+        if not are_denormalized_timestamps_used():
+            version += f":{session.connection().execute(text(VERSION_OF_BASE_OBJECTS_QUERY)).scalar_one()}"
+        if report == "conveyor":
+            parameters = session.exec(select(ConveyorParameters).where(ConveyorParameters.id == 1)).first()
+            last_status_id = session.exec(select(func.max(ConveyorStatus.id))).one()  # pylint: disable=E1102
+            if parameters:
+                version += f":{parameters.belt_length}:{parameters.belt_width}:{parameters.belt_thickness}"
+            version += f":{last_status_id}"
+        return version
+
+
+def create_report_job_from_cache(report: str, doc_type: str, parameters: dict | None, cache_key: str, content: bytes,
+                                 result: dict):
+    """
+    The report of the job is the hard link to the cached report, so it isn't written again (and stays downloadable
+    after the removal from the cache). It's saved as usual only if the link can't be created
+    """
+    # pylint: disable=R0913,R0917
+    job = create_report_job(report, doc_type, parameters, status="done", result=result)
+    if not report_cache.link(cache_key, get_report_path(job.id)):
+        save_report(job.id, content)
+    return job
 
-    elements = [title, general_statistics, Spacer(1, 25), table]
-    report_doc.build(elements)
 
+async def send_report_of_job(job: ReportJob, content: bytes, is_cached: bool = False):
+    """
+    The job is already done, so the report can be downloaded while it is being sent
+    """
+    filename, description, caption = describe_report(job)
+    source = "been taken from the cache" if is_cached else "successfully generated"
     # Action logging
-    create_log_record("report_info", "Report of the all defects in .pdf format has "
-                                     "successfully generated")
+    await run_in_threadpool(create_log_record, "report_info", f"Report of {description} in .{job.doc_type} format "
+                                                              f"has {source}")
 
     # Report sending via Telegram and Gmail
-    error_status_code, details = await send_report_as_notification(filename=filename,
-                                                                   caption="PDF-report of all defects")
+    io_file = BytesIO(content)
+    io_file.name = filename
+    error_status_code, details = await send_report_as_notification(io_file, caption)
     if error_status_code:
-        raise HTTPException(status_code=error_status_code, detail="Report was successfully generated, but there was "
-                                                                  f"error during notification sending: {details}")
-
-    response = AllDefectsReportResponseModel(
-        doc_type="pdf",
-        timestamp=datetime.now(),
-        total_count=len(all_defects),
-        extreme_count=len(extreme_defects),
-        critical_count=len(critical_defects)
-    )
-    return response
+        await run_in_threadpool(update_report_job, job.id,
+                                error=f"Report was successfully generated, but there was error during notification "
+                                      f"sending: {details}")
 
 
-@router.post(path="/id={defect_id}/pdf", response_model=OneDefectReportResponseModel)
-async def upload_report_of_defect_by_id_in_pdf_format(defect_id: int):
-    # pylint: disable=R0914
-    filename = f"report_of_defect_id_{defect_id}.pdf"
-    report_doc = SimpleDocTemplate(filename, pagesize=A4)
+async def run_report_job(job: ReportJob, cache_key: str):
+    """
+    Data is gathered in the thread and the report is built in the pool of processes, so the event loop isn't blocked
+    """
+    description = describe_report(job)[1]
     try:
-        defect = get_defect_by_id(defect_id)
-    except HTTPException as e:
+        arguments, result = await run_in_threadpool(gather_report_data, job)
+        async with report_build_semaphore:
+            await run_in_threadpool(update_report_job, job.id, status="running")
+            pool = get_report_process_pool()
+            try:
+                content = await asyncio.wait_for(
+                    asyncio.get_running_loop().run_in_executor(pool, REPORT_BUILDERS[(job.report, job.doc_type)],
+                                                               *arguments),
+                    timeout=settings.report_build_timeout_seconds)
+            except (BrokenProcessPool, TimeoutError):
+                reset_report_process_pool(pool)
+                raise
+        # Saved only for the downloading from any process of the server
+        await run_in_threadpool(save_report, job.id, content)
+    except Exception as e:  # pylint: disable=W0718
+        if isinstance(e, HTTPException):
+            error = e.detail
+        elif isinstance(e, ReportBuildingError):
+            error = str(e)
+        elif isinstance(e, BrokenProcessPool):
+            error = "Process building the report was terminated"
+        elif isinstance(e, TimeoutError):
+            error = f"Report wasn't built in {settings.report_build_timeout_seconds:g} seconds"
+        else:
+            error = f"Unexpected error: {e!r}"
         # Action logging
-        create_log_record("error", f"Failed to generate pdf-report of the defect with id={defect_id}: "
-                                   f"{e.detail}")
-        raise HTTPException(status_code=e.status_code, detail=e.detail) from e
-
-    # Paragraph style for header text line break
-    header_style = getSampleStyleSheet()["Normal"]
-    # Headers without photo!
-    table_headers = ["ID", "Timestamp", "Type", Paragraph("Is on belt", header_style),
-                     Paragraph("Box width (mm)", header_style), Paragraph("Box length (mm)", header_style),
-                     Paragraph("Longitudinal pos. (mm)", header_style),
-                     Paragraph("Transverse pos. (mm)", header_style), "Probability", "Criticality"]
-    table_values = format_defects_to_display_in_table([defect], (575, 430))
-    defect_photo = table_values[0].pop()
-    table_data = [table_headers] + table_values
-    table = Table(table_data, colWidths=[25, 75, 75, 40, 60, 60, 70, 70, 50, 50],
-                  rowHeights=[30, 50])
-    render_table_of_defects(table, table_data)
-
-    title_style = getSampleStyleSheet()["Title"]
-    title_style.fontSize = 24
-    title_style.alignment = 1
-    title_style.spaceAfter = 50
-    title = Paragraph(f"REPORT ABOUT DEFECT WITH ID={defect_id} ({datetime.now().strftime("%d.%m.%Y - %H:%M")})",
-                      title_style)
-
-    elements = [title, table, Spacer(1, 25), defect_photo]
-    report_doc.build(elements)
-
-    # Action logging
-    create_log_record("report_info", f"Report of the defect with id={defect_id} in .pdf format "
-                                     "has successfully generated")
-
-    # Report sending via Telegram and Gmail
-    error_status_code, details = await send_report_as_notification(filename=filename, caption=f"PDF-report of defect with "
-                                                                                        f"id={defect_id}")
-    if error_status_code:
-        raise HTTPException(status_code=error_status_code, detail="Report was successfully generated, but there was "
-                                                                  f"error during notification sending: {details}")
-
-    response = OneDefectReportResponseModel(
-        doc_type="pdf",
-        timestamp=datetime.now(),
-        defect=defect
+        await run_in_threadpool(create_log_record, "error", f"Failed to generate {job.doc_type}-report of "
+                                                            f"{description}: {error}")
+        await run_in_threadpool(update_report_job, job.id, status="failed", error=error)
+        return
+
+    result = result.model_dump(mode="json")
+    await run_in_threadpool(report_cache.put, cache_key, content, result)
+    await run_in_threadpool(update_report_job, job.id, status="done", result=result)
+    await send_report_of_job(job, content)
+
+
+def form_response_model_from_report_job(job: ReportJob):
+    return ReportJobResponseModel(
+        job_id=job.id,
+        report=job.report,
+        doc_type=job.doc_type,
+        parameters=job.parameters,
+        status=job.status,
+        error=job.error,
+        result=job.result,
+        created_at=job.created_at,
+        finished_at=job.finished_at
     )
-    return response
-
-
-@router.post(path="/conveyor/pdf", response_model=ConveyorInfoReportResponseModel)
-async def upload_report_of_conveyor_parameters_and_status_in_pdf_format():
-    filename = "report_of_conveyor_info.pdf"
-    report_doc = SimpleDocTemplate(filename, pagesize=A4)
 
-    title_style = getSampleStyleSheet()["Title"]
-    title_style.fontSize = 24
-    title_style.alignment = 1
-    title_style.spaceAfter = 32
-    title = Paragraph(f"REPORT ABOUT CONVEYOR INFO ({datetime.now().strftime("%d.%m.%Y - %H:%M")})", title_style)
 
-    parameters = get_base_conveyor_parameters()
-    status_response = get_general_status_of_conveyor()
-    status_text_color = None
-    if status_response.status == "normal":
-        status_text_color = colors.green
-    elif status_response.status == "extreme":
-        status_text_color = colors.orange
-    elif status_response.status == "critical":
-        status_text_color = colors.red
-
-    defects_count = get_count_of_all_and_extreme_and_critical_defects()
-
-    info_list_style = ParagraphStyle(
-        name="InfoListStyle",
-        parent=getSampleStyleSheet()["Normal"],
-        fontSize=16,
-        leading=20,
-    )
-
-    parameters_and_status = ListFlowable(
-        [
-            Paragraph(f"Belt length: <b>{parameters.belt_length / 1000000} km</b>", info_list_style),
-            Paragraph(f"Belt width: <b>{parameters.belt_width / 1000} m</b>", info_list_style),
-            Paragraph(f"Belt thickness: <b>{parameters.belt_thickness} mm</b>", info_list_style),
-            Paragraph(f"General status: <b><font color=\"{convert_color_to_hex(status_text_color)}\">"
-                      f"{status_response.status.upper()}</font></b>", info_list_style),
-        ],
-        bulletType="bullet"
-    )
-
-    defects_count_info = ListFlowable(
-        [
-            Paragraph(f"Total count of defects: <b>{defects_count.total}</b>", info_list_style),
-            Paragraph(f"Count of extreme-level defects: <b>{defects_count.extreme}</b>", info_list_style),
-            Paragraph(f"Count of critical-level defects: <b>{defects_count.critical}</b>", info_list_style)
-        ],
-        bulletType="bullet"
-    )
-
-    elements = [title, parameters_and_status, Spacer(1, 32), defects_count_info]
-    report_doc.build(elements)
-
-    # Action logging
-    create_log_record("report_info", "Report of the conveyor parameters and status in .pdf format "
-                                     "has successfully generated")
+async def start_report_job(background_tasks: BackgroundTasks, report: str, doc_type: str,
+                           parameters: dict | None = None):
+    """
+    The report is generated after the response with the id of the job. If the same report has been generated for
+    the current data, the job is done at once with the cached report
+    """
+    data_version = await run_in_threadpool(get_data_version_of_report, report)
+    cache_key = get_report_cache_key(report, doc_type, parameters or {}, data_version)
+    cached_report = await run_in_threadpool(report_cache.get, cache_key)
+    if cached_report is None:
+        job = await run_in_threadpool(create_report_job, report, doc_type, parameters)
+        background_tasks.add_task(run_report_job, job, cache_key)
+    else:
+        content, result = cached_report
+        job = await run_in_threadpool(create_report_job_from_cache, report, doc_type, parameters, cache_key, content,
+                                      result)
+        background_tasks.add_task(send_report_of_job, job, content, is_cached=True)
+    return form_response_model_from_report_job(job)
 
-    # Report sending via Telegram and Gmail
-    error_status_code, details = await send_report_as_notification(filename=filename, caption="PDF-report of conveyor "
-                                                                                        "parameters and status")
-    if error_status_code:
-        raise HTTPException(status_code=error_status_code, detail="Report was successfully generated, but there was "
-                                                                  f"error during notification sending: {details}")
 
-    response = ConveyorInfoReportResponseModel(
-        doc_type="pdf",
-        timestamp=datetime.now(),
-        status=status_response.status
+@router.get(path="/", response_model=ServiceInfoResponseModel)
+def get_service_info():
+    return ServiceInfoResponseModel(
+        info="Service for generating reports on defects and conveyor status in .pdf or .csv format"
     )
-    return response
-
 
-@router.post(path="/all/csv", response_model=AllDefectsReportResponseModel)
-async def upload_report_of_all_defects_in_csv_format():
-    all_defects = get_all_defects()
-    extreme_defects = get_extreme_defects()
-    critical_defects = get_critical_defects()
 
-    # Parameter "base64_photo" excluded from header and lines because base64-representation of defect's photo is large
-    csv_table_headers = (",".join([str(key) for key in all_defects[0].model_dump().keys() if key != "base64_photo"]) +
-                         "\n")
-    csv_table_lines = [",".join([str(value) for key, value in defect.model_dump().items() if key != "base64_photo"]) +
-                       "\n" for defect in all_defects]
+@router.post(path="/all/pdf", response_model=ReportJobResponseModel, status_code=202)
+async def upload_report_of_all_defects_in_pdf_format(background_tasks: BackgroundTasks):
+    return await start_report_job(background_tasks, "all_defects", "pdf")
 
-    filename = "report_of_all_defects.csv"
-    with open(filename, "w", encoding="utf-8") as output_file:
-        output_file.write(csv_table_headers)
-        output_file.writelines(line for line in csv_table_lines)
 
-    # Action logging
-    create_log_record("report_info", "Report of the all defects in .csv format "
-                                     "has successfully generated")
-
-    # Report sending via Telegram and Gmail
-    error_status_code, details = await send_report_as_notification(filename=filename, caption="CSV-report of all defects")
-    if error_status_code:
-        raise HTTPException(status_code=error_status_code, detail="Report was successfully generated, but there was "
-                                                                  f"error during notification sending: {details}")
-
-    response = AllDefectsReportResponseModel(
-        doc_type="csv",
-        timestamp=datetime.now(),
-        total_count=len(all_defects),
-        extreme_count=len(extreme_defects),
-        critical_count=len(critical_defects)
-    )
-    return response
+@router.post(path="/id={defect_id}/pdf", response_model=ReportJobResponseModel, status_code=202)
+async def upload_report_of_defect_by_id_in_pdf_format(defect_id: int, background_tasks: BackgroundTasks):
+    return await start_report_job(background_tasks, "defect", "pdf", {"defect_id": defect_id})
 
 
-@router.post(path="/id={defect_id}/csv", response_model=OneDefectReportResponseModel)
-async def upload_report_of_defect_by_id_in_csv_format(defect_id: int):
-    try:
-        defect = get_defect_by_id(defect_id)
-    except HTTPException as e:
-        # Action logging
-        create_log_record("error", f"Failed to generate csv-report of the defect with id={defect_id}: "
-                                   f"{e.detail}")
-        raise HTTPException(status_code=e.status_code, detail=e.detail) from e
-
-    # Parameter "base64_photo" excluded from header and lines because base64-representation of defect's photo is large
-    csv_headers = ",".join([str(key) for key in defect.model_dump().keys() if key != "base64_photo"]) + "\n"
-    csv_defect_info = (",".join([str(value) for key, value in defect.model_dump().items() if key != "base64_photo"]) +
-                       "\n")
+@router.post(path="/conveyor/pdf", response_model=ReportJobResponseModel, status_code=202)
+async def upload_report_of_conveyor_parameters_and_status_in_pdf_format(background_tasks: BackgroundTasks):
+    return await start_report_job(background_tasks, "conveyor", "pdf")
 
-    filename = f"report_of_defect_id_{defect_id}.csv"
-    with open(filename, "w", encoding="utf-8") as output_file:
-        output_file.write(csv_headers)
-        output_file.write(csv_defect_info)
-
-    # Action logging
-    create_log_record("report_info", f"Report of the defect with id={defect_id} in .csv format "
-                                     f"has successfully generated")
 
-    # Report sending via Telegram and Gmail
-    error_status_code, details = await send_report_as_notification(filename=filename, caption=f"CSV-report of defect with "
-                                                                                        f"id={defect_id}")
-    if error_status_code:
-        raise HTTPException(status_code=error_status_code, detail="Report was successfully generated, but there was "
-                                                                  f"error during notification sending: {details}")
+@router.post(path="/all/csv", response_model=ReportJobResponseModel, status_code=202)
+async def upload_report_of_all_defects_in_csv_format(background_tasks: BackgroundTasks):
+    return await start_report_job(background_tasks, "all_defects", "csv")
 
-    response = OneDefectReportResponseModel(
-        doc_type="csv",
-        timestamp=datetime.now(),
-        defect=defect
-    )
-    return response
 
+@router.post(path="/id={defect_id}/csv", response_model=ReportJobResponseModel, status_code=202)
+async def upload_report_of_defect_by_id_in_csv_format(defect_id: int, background_tasks: BackgroundTasks):
+    return await start_report_job(background_tasks, "defect", "csv", {"defect_id": defect_id})
 
-@router.post(path="/conveyor/csv", response_model=ConveyorInfoReportResponseModel)
-async def upload_report_of_conveyor_parameters_and_status_in_csv_format():
-    parameters = get_base_conveyor_parameters()
-    status_response = get_general_status_of_conveyor()
-    defects_count = get_count_of_all_and_extreme_and_critical_defects()
 
-    csv_headers = ("belt_length,belt_width,belt_thickness,general_status,total_count_of_defects,count_of_extreme,"
-                   "count_of_critical\n")
-    csv_conveyor_info = (",".join([str(value) for value in parameters.model_dump().values()]) +
-                         f",{status_response.status}," +
-                         ",".join([str(value) for value in defects_count.model_dump().values()]) + "\n")
+@router.post(path="/conveyor/csv", response_model=ReportJobResponseModel, status_code=202)
+async def upload_report_of_conveyor_parameters_and_status_in_csv_format(background_tasks: BackgroundTasks):
+    return await start_report_job(background_tasks, "conveyor", "csv")
 
-    filename = "report_of_conveyor_info.csv"
-    with open("report_of_conveyor_info.csv", "w", encoding="utf-8") as output_file:
-        output_file.write(csv_headers)
-        output_file.write(csv_conveyor_info)
 
-    # Action logging
-    create_log_record("report_info", "Report of the conveyor parameters and status in .csv format "
-                                     "has successfully generated")
+@router.get(path="/jobs/{job_id}", response_model=ReportJobResponseModel)
+def get_status_of_report_job(job_id: str):
+    job = get_report_job(job_id)
+    if not job:
+        raise HTTPException(status_code=404, detail=f"There is no report job with id={job_id}")
+    return form_response_model_from_report_job(job)
 
-    # Report sending via Telegram and Gmail
-    error_status_code, details = await send_report_as_notification(filename=filename, caption="CSV-report of conveyor "
-                                                                                        "parameters and status")
-    if error_status_code:
-        raise HTTPException(status_code=error_status_code, detail="Report was successfully generated, but there was "
-                                                                  f"error during notification sending: {details}")
 
-    response = ConveyorInfoReportResponseModel(
-        doc_type="csv",
-        timestamp=datetime.now(),
-        status=status_response.status
-    )
-    return response
+@router.get(path="/jobs/{job_id}/download")
+def download_generated_report(job_id: str):
+    job = get_report_job(job_id)
+    if not job:
+        raise HTTPException(status_code=404, detail=f"There is no report job with id={job_id}")
+    if job.status != "done":
+        raise HTTPException(status_code=409, detail=f"Report is not generated, status of the job: {job.status}")
+    chunks = iterate_report(job_id)
+    if chunks is None:
+        raise HTTPException(status_code=404, detail="Report has been removed")
+    return StreamingResponse(chunks, media_type=MEDIA_TYPES[job.doc_type],
+                             headers={"Content-Disposition": f'attachment; filename="{describe_report(job)[0]}"'})
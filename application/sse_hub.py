@@ -0,0 +1,175 @@
+"""
+Broadcasting of the server-sent events to the connected clients. Every client has a bounded buffer of the events
+which haven't been sent yet: a slow client loses the oldest events or is disconnected (SSE_SLOW_CLIENT_POLICY), so it
+never makes the publisher wait or the memory grow. Idle clients don't wake up until an event or a heartbeat comment
+(the heartbeat keeps the connection open through the proxies and reveals the clients which have gone).
+The hub with the replay buffer numbers its events and sends the missed ones to the client reconnected with the
+"Last-Event-ID" header. If the missed events are not in the buffer any more (or the server has been restarted),
+the client gets the "resync" event and has to reload the data
+"""
+import asyncio
+from collections import deque
+from time import time_ns
+
+from .config import settings
+from .models.api_models import SSEHubMetricsResponseModel
+
+HEARTBEAT_MESSAGE = ": heartbeat\n\n"
+RESYNC_MESSAGE = "event: resync\ndata: {}\n\n"
+
+
+def format_server_sent_event(data: str, event: str | None = None, event_id: int | None = None):
+    lines = [f"id: {event_id}"] if event_id is not None else []
+    if event is not None:
+        lines.append(f"event: {event}")
+    lines += [f"data: {line}" for line in data.split("\n")]
+    return "\n".join(lines) + "\n\n"
+
+
+class SSEClient:
+    def __init__(self, buffer_size: int):
+        # Tuples (<event id or None>, <formatted event>)
+        self.buffer = deque(maxlen=buffer_size)
+        self.is_disconnected = False
+        self._is_woken = asyncio.Event()
+
+    def push(self, event_id: int | None, message: str):
+        """
+        Returns False if the buffer is full (the oldest event is dropped)
+        """
+        is_full = len(self.buffer) == self.buffer.maxlen
+        self.buffer.append((event_id, message))
+        self._is_woken.set()
+        return not is_full
+
+    def wake_up(self):
+        self._is_woken.set()
+
+    async def get_events(self):
+        """
+        Wait for the events and take all of them from the buffer (an empty list means that the heartbeat is due)
+        """
+        await self._is_woken.wait()
+        self._is_woken.clear()
+        events = list(self.buffer)
+        self.buffer.clear()
+        return events
+
+
+class SSEBroadcastHub:  # pylint: disable=R0902
+    def __init__(self, name: str, buffer_size: int, disconnect_slow_clients: bool, replay_size: int = 0):
+        self.name = name
+        self.buffer_size = buffer_size
+        self.disconnect_slow_clients = disconnect_slow_clients
+        self.clients = set()
+        self.count_of_published_events = 0
+        self.count_of_dropped_events = 0
+        self.count_of_disconnected_slow_clients = 0
+        # Ids of the events are the times of publishing in microseconds (increasing also after the restart of the
+        # server and comparable between the processes). Events before the creation of the hub or removed from
+        # the replay buffer can't be sent again
+        self.last_event_id = time_ns() // 1000
+        self.last_lost_event_id = self.last_event_id
+        self._replay_buffer = deque(maxlen=replay_size)
+
+    def generate_event_id(self):
+        self.last_event_id = max(time_ns() // 1000, self.last_event_id + 1)
+        return self.last_event_id
+
+    def subscribe(self, last_event_id: int | None = None):
+        """
+        Events published after the event with the given id are sent to the client first (if the hub has the replay
+        buffer)
+        """
+        client = SSEClient(self.buffer_size)
+        if last_event_id is not None and self._replay_buffer.maxlen:
+            missed_events = [(event_id, message) for event_id, message in self._replay_buffer
+                             if event_id > last_event_id]
+            if last_event_id < self.last_lost_event_id or len(missed_events) >= self.buffer_size:
+                # Some of the missed events can't be sent, only the newest ones fit into the buffer with the resync
+                client.push(None, RESYNC_MESSAGE)
+                missed_events = missed_events[len(missed_events) - self.buffer_size + 1:]
+            for event_id, message in missed_events:
+                client.push(event_id, message)
+        self.clients.add(client)
+        return client
+
+    def unsubscribe(self, client: SSEClient):
+        self.clients.discard(client)
+
+    def publish(self, data: str, event: str | None = None, event_id: int | None = None, is_replayed: bool = True):
+        """
+        Put the event into the buffers of all clients without waiting for them. Events of the hub with the replay
+        buffer get the id from the hub if it isn't given (e.g. by the process which has published the event).
+        Events which aren't replayed (e.g. the current state which is outdated soon) have no id
+        """
+        is_replayed = is_replayed and self._replay_buffer.maxlen > 0
+        if is_replayed:
+            if event_id is None:
+                event_id = self.generate_event_id()
+            self.last_event_id = max(self.last_event_id, event_id)
+        message = format_server_sent_event(data, event, event_id)
+        if is_replayed:
+            if len(self._replay_buffer) == self._replay_buffer.maxlen:
+                self.last_lost_event_id = max(self.last_lost_event_id, self._replay_buffer[0][0])
+            self._replay_buffer.append((event_id, message))
+
+        self.count_of_published_events += 1
+        for client in list(self.clients):
+            if client.push(event_id, message):
+                continue
+            self.count_of_dropped_events += 1
+            if self.disconnect_slow_clients:
+                client.is_disconnected = True
+                self.count_of_disconnected_slow_clients += 1
+                self.unsubscribe(client)
+
+    def send_heartbeats(self):
+        for client in list(self.clients):
+            client.wake_up()
+
+    async def stream(self, client: SSEClient):
+        """
+        Generator of the response body for the subscribed client, the client is unsubscribed when the connection
+        is closed
+        """
+        try:
+            while True:
+                events = await client.get_events()
+                if client.is_disconnected:
+                    break
+                yield "".join(message for _, message in events) if events else HEARTBEAT_MESSAGE
+        finally:
+            self.unsubscribe(client)
+
+    def get_metrics(self):
+        clients = list(self.clients)
+        return SSEHubMetricsResponseModel(
+            name=self.name,
+            connected_clients=len(clients),
+            max_lag_events=max((len(client.buffer) for client in clients), default=0),
+            published_events=self.count_of_published_events,
+            dropped_events=self.count_of_dropped_events,
+            disconnected_slow_clients=self.count_of_disconnected_slow_clients
+        )
+
+
+SSE_HUBS = []
+
+
+def create_sse_hub(name: str, replay_size: int = 0):
+    hub = SSEBroadcastHub(name, buffer_size=settings.sse_client_buffer_size,
+                          disconnect_slow_clients=settings.sse_slow_client_policy == "disconnect",
+                          replay_size=replay_size)
+    SSE_HUBS.append(hub)
+    return hub
+
+
+async def send_heartbeats_periodically():
+    """
+    One timer for all clients instead of the timer of every connection
+    """
+    while True:
+        await asyncio.sleep(settings.sse_heartbeat_interval_seconds)
+        for hub in SSE_HUBS:
+            hub.send_heartbeats()
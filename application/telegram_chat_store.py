@@ -0,0 +1,32 @@
+import json
+import os
+from pathlib import Path
+from tempfile import NamedTemporaryFile
+
+from .config import settings
+
+TELEGRAM_CHATS_FILE = Path(settings.telegram_chats_file)
+
+
+def load_telegram_chats():
+    """
+    Returns the dictionary {"last_update_id": <id of the last processed bot update>,
+    "chats": {<chat id>: <username>}} of the Telegram users registered as notification recipients
+    """
+    if TELEGRAM_CHATS_FILE.exists():
+        with TELEGRAM_CHATS_FILE.open(encoding="utf-8") as file:
+            return json.load(file)
+    return {"last_update_id": None, "chats": {}}
+
+
+def save_telegram_chats(data: dict):
+    # Writing to the unique temporary file with renaming, so that the file is never seen half-written and the
+    # concurrent saving from the other worker processes doesn't write to the same temporary file
+    with NamedTemporaryFile(mode="w", encoding="utf-8", dir=TELEGRAM_CHATS_FILE.parent,
+                            prefix=TELEGRAM_CHATS_FILE.name, suffix=".tmp", delete=False) as file:
+        json.dump(data, file, indent=2)
+    try:
+        os.replace(file.name, TELEGRAM_CHATS_FILE)
+    except OSError:
+        os.unlink(file.name)
+        raise
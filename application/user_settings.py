@@ -1,16 +1,92 @@
+"""
+In-memory store of the user settings from the JSON-file. The file is parsed again only when it has been changed
+(e.g. edited by hand), the settings are written atomically and the subscribers are notified about the changes
+"""
+import copy
 import json
+import os
 from pathlib import Path
+from tempfile import NamedTemporaryFile
+from threading import Lock
+from typing import Callable
 
 SETTINGS_FILE = Path("application/user_settings.json")
 
 
+class UserSettingsStore:
+    def __init__(self, settings_file: Path):
+        self.settings_file = settings_file
+        self._settings = {}
+        # (<inode>, <modification time>, <size>) of the loaded file, None if there is no file
+        self._file_state = None
+        self._is_loaded = False
+        self._subscribers = []
+        self._lock = Lock()
+
+    def _get_file_state(self):
+        try:
+            file_stat = self.settings_file.stat()
+        except FileNotFoundError:
+            return None
+        return file_stat.st_ino, file_stat.st_mtime_ns, file_stat.st_size
+
+    def load(self):
+        """
+        Returns the copy of the settings ({} if there is no settings file). Raises json.JSONDecodeError if the file
+        is invalid
+        """
+        file_state = self._get_file_state()
+        with self._lock:
+            if self._is_loaded and file_state == self._file_state:
+                return copy.deepcopy(self._settings)
+            new_settings = {}
+            if file_state is not None:
+                with self.settings_file.open(encoding="utf-8") as file:
+                    new_settings = json.load(file)
+            is_changed = self._is_loaded and new_settings != self._settings
+            self._settings, self._file_state, self._is_loaded = new_settings, file_state, True
+        if is_changed:
+            self._notify_subscribers(new_settings)
+        return copy.deepcopy(new_settings)
+
+    def save(self, data: dict):
+        """
+        Returns True if the settings were changed
+        """
+        # Writing to the unique temporary file with renaming, so that the file is never seen half-written and the
+        # concurrent saving from the other worker processes doesn't write to the same temporary file
+        with self._lock:
+            with NamedTemporaryFile(mode="w", encoding="utf-8", dir=self.settings_file.parent,
+                                    prefix=self.settings_file.name, suffix=".tmp", delete=False) as file:
+                json.dump(data, file, indent=2)
+            try:
+                os.replace(file.name, self.settings_file)
+            except OSError:
+                os.unlink(file.name)
+                raise
+            is_changed = data != self._settings
+            self._settings, self._file_state, self._is_loaded = copy.deepcopy(data), self._get_file_state(), True
+        if is_changed:
+            self._notify_subscribers(data)
+        return is_changed
+
+    def subscribe(self, callback: Callable[[dict], None]):
+        """
+        Callback is called with the new settings after every change
+        """
+        self._subscribers.append(callback)
+
+    def _notify_subscribers(self, new_settings: dict):
+        for callback in list(self._subscribers):
+            callback(copy.deepcopy(new_settings))
+
+
+user_settings_store = UserSettingsStore(SETTINGS_FILE)
+
+
 def load_user_settings():
-    if SETTINGS_FILE.exists():
-        with SETTINGS_FILE.open(encoding="utf-8") as file:
-            return json.load(file)
-    return {}
+    return user_settings_store.load()
 
 
 def save_user_settings(data: dict):
-    with SETTINGS_FILE.open(mode="w", encoding="utf-8") as file:
-        json.dump(data, file, indent=2)
+    return user_settings_store.save(data)
@@ -0,0 +1,162 @@
+"""
+Local stand-ins of the notification providers for the load tests and benchmarks. They answer like the real APIs,
+enforce the sending quotas and can add latency and random errors, so the behavior of the application can be
+checked offline (set TELEGRAM_API_BASE_URL and GMAIL_API_BASE_URL to their addresses)
+"""
+import asyncio
+import base64
+import random
+from collections import deque
+from contextlib import asynccontextmanager
+from email import message_from_bytes
+from math import ceil
+from time import monotonic, time
+
+import uvicorn
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse
+
+# Quotas of Telegram Bot API: about one message per second to one chat and 30 messages per second in total
+TELEGRAM_CHAT_MESSAGES_PER_SECOND = 1
+TELEGRAM_TOTAL_MESSAGES_PER_SECOND = 30
+
+
+class SlidingWindowQuota:
+    def __init__(self, limit: int, window_seconds: float = 1):
+        self.limit = limit
+        self.window_seconds = window_seconds
+        self.sending_times = deque()
+
+    def try_send(self, now: float):
+        """
+        Returns 0 if the sending is within the quota or the count of seconds to retry after
+        """
+        while self.sending_times and now - self.sending_times[0] >= self.window_seconds:
+            self.sending_times.popleft()
+        if len(self.sending_times) >= self.limit:
+            return max(1, ceil(self.sending_times[0] + self.window_seconds - now))
+        self.sending_times.append(now)
+        return 0
+
+
+class FakeProvider:
+    """
+    Common part of the stand-ins: latency of every request, random failures and the log of the delivered messages
+    """
+
+    def __init__(self, latency_seconds: float = 0, error_rate: float = 0):
+        self.latency_seconds = latency_seconds
+        self.error_rate = error_rate
+        # List of tuples (<recipient>, <text of the message>, <unix time of the delivery>)
+        self.delivered = []
+        self.count_of_rejected = 0
+        self.count_of_failed = 0
+        self.app = FastAPI()
+
+    async def simulate_request(self):
+        """
+        Returns True if the request has to fail
+        """
+        if self.latency_seconds:
+            await asyncio.sleep(self.latency_seconds)
+        if random.random() < self.error_rate:
+            self.count_of_failed += 1
+            return True
+        return False
+
+
+class FakeTelegramBotAPI(FakeProvider):
+    def __init__(self, latency_seconds: float = 0, error_rate: float = 0,
+                 chat_limit: int | None = TELEGRAM_CHAT_MESSAGES_PER_SECOND,
+                 total_limit: int | None = TELEGRAM_TOTAL_MESSAGES_PER_SECOND, chat_ids: tuple[int, ...] = (1,)):
+        # pylint: disable=R0913,R0917
+        super().__init__(latency_seconds, error_rate)
+        self.chat_limit = chat_limit
+        self.total_quota = SlidingWindowQuota(total_limit) if total_limit else None
+        self.chat_quotas = {}
+        self.chat_ids = chat_ids
+        self.app.post("/bot{_token}/{method}")(self.handle_method)
+
+    def get_updates(self):
+        """
+        Every chat has sent one message to the bot, so the application discovers the chats
+        """
+        return [{"update_id": index, "message": {
+            "message_id": index, "date": int(time()), "text": "/start",
+            "chat": {"id": chat_id, "type": "private", "username": f"benchmark_user_{chat_id}"}}}
+            for index, chat_id in enumerate(self.chat_ids, start=1)]
+
+    def check_quotas(self, chat_id: int):
+        now = monotonic()
+        retry_after = 0
+        if self.chat_limit:
+            chat_quota = self.chat_quotas.setdefault(chat_id, SlidingWindowQuota(self.chat_limit))
+            retry_after = chat_quota.try_send(now)
+        if not retry_after and self.total_quota:
+            retry_after = self.total_quota.try_send(now)
+        return retry_after
+
+    async def handle_method(self, _token: str, method: str, request: Request):
+        parameters = dict(await request.form())
+        if method == "getUpdates":
+            offset = int(parameters.get("offset") or 0)
+            return {"ok": True, "result": [update for update in self.get_updates() if update["update_id"] >= offset]}
+        if method not in ("sendMessage", "sendDocument"):
+            return {"ok": True, "result": True}
+
+        if await self.simulate_request():
+            return JSONResponse(status_code=500, content={
+                "ok": False, "error_code": 500, "description": "Internal Server Error"})
+
+        chat_id = int(parameters["chat_id"])
+        retry_after = self.check_quotas(chat_id)
+        if retry_after:
+            self.count_of_rejected += 1
+            return JSONResponse(status_code=429, content={
+                "ok": False, "error_code": 429, "description": f"Too Many Requests: retry after {retry_after}",
+                "parameters": {"retry_after": retry_after}})
+
+        text = parameters.get("text" if method == "sendMessage" else "caption", "")
+        self.delivered.append((chat_id, text, time()))
+        message = {"message_id": len(self.delivered), "date": int(time()),
+                   "chat": {"id": chat_id, "type": "private"}}
+        if method == "sendMessage":
+            message["text"] = text
+        else:
+            message["caption"] = text
+            message["document"] = {"file_id": str(len(self.delivered)), "file_unique_id": str(len(self.delivered))}
+        return {"ok": True, "result": message}
+
+
+class FakeGmailAPI(FakeProvider):
+    def __init__(self, latency_seconds: float = 0, error_rate: float = 0):
+        super().__init__(latency_seconds, error_rate)
+        self.app.post("/gmail/v1/users/{user_id}/messages/send")(self.send_message)
+
+    async def send_message(self, user_id: str, request: Request):
+        if await self.simulate_request():
+            return JSONResponse(status_code=500, content={"error": {
+                "code": 500, "message": "Backend Error", "errors": [{"reason": "backendError"}]}})
+
+        message = message_from_bytes(base64.urlsafe_b64decode((await request.json())["raw"]))
+        text_part = next(part for part in message.walk() if part.get_content_type() == "text/plain")
+        text = f"{message["subject"]}\n{text_part.get_payload(decode=True).decode()}"
+        self.delivered.append((message["to"], text, time()))
+        return {"id": str(len(self.delivered)), "threadId": str(len(self.delivered)), "labelIds": ["SENT"],
+                "userId": user_id}
+
+
+@asynccontextmanager
+async def run_fake_provider(app: FastAPI, port: int):
+    """
+    Serve the fake provider in the current event loop while the context is active
+    """
+    server = uvicorn.Server(uvicorn.Config(app, host="127.0.0.1", port=port, log_level="warning"))
+    task = asyncio.create_task(server.serve())
+    while not server.started:
+        await asyncio.sleep(0.01)
+    try:
+        yield f"http://127.0.0.1:{port}"
+    finally:
+        server.should_exit = True
+        await task
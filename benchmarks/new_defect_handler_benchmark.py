@@ -0,0 +1,69 @@
+"""
+Benchmark of the new defect handling: defects are inserted into the test database and handled one by one and in
+batches (as the handlers take the defects waiting in the queue), the handling latency and the count of the database
+queries per defect are measured. Notifications are only put into the outbox (the workers aren't started).
+
+The tables are recreated, so only the test database (named "test_db") can be used. Usage from the root of the project:
+    python -m benchmarks.new_defect_handler_benchmark --defects 200 --batch-size 20
+"""
+# pylint: disable=C0415
+import argparse
+import asyncio
+import json
+import statistics
+from time import perf_counter
+
+from .notification_throughput_benchmark import prepare_database, insert_defects
+
+
+def print_report(mode: str, latencies: list[float], count_of_queries: int):
+    latencies = sorted(latencies)
+    print(f"{mode}: {len(latencies)} defects, latency per defect mean={statistics.mean(latencies) * 1000:.1f} ms, "
+          f"p50={statistics.median(latencies) * 1000:.1f} ms, "
+          f"p95={latencies[int(0.95 * (len(latencies) - 1))] * 1000:.1f} ms; "
+          f"{count_of_queries / len(latencies):.1f} queries per defect")
+
+
+async def run_benchmark(arguments: argparse.Namespace):
+    from sqlalchemy import event
+    from application.db_connection import engine
+    from application.db_listener import handle_new_defects
+
+    await asyncio.to_thread(prepare_database)
+    defect_ids = list(await asyncio.to_thread(insert_defects, arguments.defects, 0))
+    single_defect_ids, batched_defect_ids = defect_ids[:len(defect_ids) // 2], defect_ids[len(defect_ids) // 2:]
+
+    count_of_queries = {"value": 0}
+
+    def count_query(*_args):
+        count_of_queries["value"] += 1
+
+    event.listen(engine, "before_cursor_execute", count_query)
+
+    latencies = []
+    for defect_id in single_defect_ids:
+        start_time = perf_counter()
+        await handle_new_defects([json.dumps({"id": defect_id})])
+        latencies.append(perf_counter() - start_time)
+    print_report("One by one", latencies, count_of_queries["value"])
+
+    count_of_queries["value"], latencies = 0, []
+    for index in range(0, len(batched_defect_ids), arguments.batch_size):
+        batch = batched_defect_ids[index:index + arguments.batch_size]
+        start_time = perf_counter()
+        await handle_new_defects([json.dumps({"id": defect_id}) for defect_id in batch])
+        latencies += [(perf_counter() - start_time) / len(batch)] * len(batch)
+    print_report(f"Batches of {arguments.batch_size}", latencies, count_of_queries["value"])
+
+    event.remove(engine, "before_cursor_execute", count_query)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--defects", type=int, default=200)
+    parser.add_argument("--batch-size", type=int, default=20)
+    asyncio.run(run_benchmark(parser.parse_args()))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,59 @@
+"""
+Load test of the notification rate limiter against the local stand-in of Telegram Bot API.
+A burst of messages to several chats is sent with the configured quotas and without the limiter.
+
+Usage from the root of the project:
+    python -m benchmarks.notification_rate_limit_load_test --chats 10 --messages 5
+"""
+import argparse
+import asyncio
+from time import monotonic
+
+from telegram import Bot
+
+from application.config import settings
+from application.services import notification_service
+from application.services.notification_service import NotificationRateLimiter
+
+from .fake_providers import FakeTelegramBotAPI, run_fake_provider
+
+
+async def send_burst(base_url: str, chats: int, messages: int, limiter: NotificationRateLimiter):
+    provider_bot = Bot(token="123:fake", base_url=f"{base_url}/bot")
+    notification_service.telegram_bot = provider_bot
+    notification_service.notification_rate_limiter = limiter
+
+    start_time = monotonic()
+    errors = await asyncio.gather(*(
+        notification_service._send_data_to_telegram_chat(str(chat_id), f"Message {index}")  # pylint: disable=W0212
+        for index in range(messages) for chat_id in range(1, chats + 1)))
+    return monotonic() - start_time, errors
+
+
+async def run_load_test(chats: int, messages: int, port: int):
+    scenarios = {
+        "with rate limiter": NotificationRateLimiter(channel_rates=settings.notification_channel_rate_limits,
+                                                     recipient_rates=settings.notification_recipient_rate_limits),
+        "without rate limiter": NotificationRateLimiter(channel_rates={}, recipient_rates={}),
+    }
+    for name, limiter in scenarios.items():
+        provider = FakeTelegramBotAPI()
+        async with run_fake_provider(provider.app, port) as base_url:
+            elapsed, errors = await send_burst(base_url, chats, messages, limiter)
+        failed = sum(error is not None for error in errors)
+        print(f"{name}: {len(errors) - failed}/{len(errors)} delivered in {elapsed:.2f} s "
+              f"({len(provider.delivered) / elapsed:.1f} messages/s), {failed} failed, "
+              f"{provider.count_of_rejected} rejected by the provider with 429")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--chats", type=int, default=10)
+    parser.add_argument("--messages", type=int, default=5, help="count of messages to each chat")
+    parser.add_argument("--port", type=int, default=8765)
+    arguments = parser.parse_args()
+    asyncio.run(run_load_test(arguments.chats, arguments.messages, arguments.port))
+
+
+if __name__ == "__main__":
+    main()
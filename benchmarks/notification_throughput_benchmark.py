@@ -0,0 +1,169 @@
+"""
+End-to-end benchmark of the new defect notifications: defects are inserted into the database one per transaction,
+the trigger sends pg_notify, the listener enqueues the notifications and the workers deliver them to the local
+stand-ins of Telegram Bot API and Gmail API. Throughput (defects per second) and latency from the insert to the
+delivery are measured for every channel.
+
+The tables are recreated, so only the test database (named "test_db") can be used. Usage from the root of the project:
+    python -m benchmarks.notification_throughput_benchmark --defects 200 --latency 0.2 --error-rate 0.05
+"""
+# pylint: disable=C0415
+import argparse
+import asyncio
+import os
+import re
+import statistics
+import tempfile
+from datetime import datetime
+from time import monotonic, sleep, time
+
+from .fake_providers import FakeTelegramBotAPI, FakeGmailAPI, run_fake_provider
+
+DEFECT_ID_PATTERN = re.compile(r"\bid = (\d+)")
+DIGEST_DEFECT_IDS_PATTERN = re.compile(r"Defect ids: ([\d, ]+)")
+
+
+def configure_application(arguments: argparse.Namespace):
+    """
+    Settings of the application are read on import, so the environment is prepared before the application is imported
+    """
+    os.environ["TELEGRAM_API_BASE_URL"] = f"http://127.0.0.1:{arguments.telegram_port}/bot"
+    os.environ["GMAIL_API_BASE_URL"] = f"http://127.0.0.1:{arguments.gmail_port}/"
+    os.environ["TELEGRAM_CHATS_FILE"] = os.path.join(tempfile.mkdtemp(), "telegram_chats.json")
+    os.environ["TELEGRAM_USER_CHAT_ID"] = ""
+    os.environ["NOTIFICATION_COALESCING_WINDOW_SECONDS"] = str(arguments.coalescing_window)
+    if not arguments.rate_limits:
+        os.environ["NOTIFICATION_CHANNEL_RATE_LIMITS"] = "{}"
+        os.environ["NOTIFICATION_RECIPIENT_RATE_LIMITS"] = "{}"
+
+
+def prepare_database():
+    from application.config import settings
+    from application.services.maintenance_service import (create_or_recreate_all_database_tables,
+                                                          fill_database_with_required_and_test_data)
+
+    # Protection against changes to the production database
+    if settings.database_url.split("/")[-1] != "test_db":
+        raise ValueError("USING NON-TEST DATABASE CONNECTION PARAMETERS. CHANGE THE \"DATABASE_URL\" PARAMETER "
+                         "IN THE .env FILE")
+    create_or_recreate_all_database_tables(user_admin=None)
+    fill_database_with_required_and_test_data()
+
+
+def insert_defects(count: int, rate: float):
+    """
+    Returns the dictionary {<defect id>: <unix time of the insert>}
+    """
+    # pylint: disable=R0914
+    from sqlmodel import Session, select
+    from application.db_connection import engine
+    from application.models.db_models import Object, ObjectType, Photo, Defect, DefectType
+
+    with open("application/services/test_defect.jpg", "rb") as file:
+        image = file.read()
+
+    insert_times = {}
+    start_time = monotonic()
+    with Session(engine) as session:
+        object_type_for_defect = session.exec(select(ObjectType).where(ObjectType.name == "defect")).one()
+        object_type_for_photo = session.exec(select(ObjectType).where(ObjectType.name == "photo")).one()
+        defect_type = session.exec(select(DefectType).where(DefectType.name == "wear")).one()
+
+        for index in range(count):
+            if rate > 0:
+                sleep(max(0.0, start_time + index / rate - monotonic()))
+            photo = Photo(base_object=Object(type_object=object_type_for_photo, time=datetime.now()), image=image)
+            defect = Defect(base_object=Object(type_object=object_type_for_defect, time=datetime.now()),
+                            type_object=defect_type, box_width=200, box_length=200, location_width_in_frame=5,
+                            location_length_in_frame=5, location_width_in_conv=450,
+                            location_length_in_conv=1000 * index, photo_object=photo, probability=99,
+                            is_critical=False, is_extreme=False)
+            session.add(defect)
+            session.commit()
+            insert_times[defect.id] = time()
+    return insert_times
+
+
+def get_delivery_times(provider: FakeTelegramBotAPI | FakeGmailAPI):
+    """
+    Returns the dictionary {<defect id>: <unix time of the first delivery>} (digests deliver several defects at once)
+    """
+    delivery_times = {}
+    for _, text, delivery_time in provider.delivered:
+        defect_ids = DEFECT_ID_PATTERN.findall(text)
+        for digest_ids in DIGEST_DEFECT_IDS_PATTERN.findall(text):
+            defect_ids += [defect_id.strip() for defect_id in digest_ids.split(",") if defect_id.strip()]
+        for defect_id in defect_ids:
+            delivery_times.setdefault(int(defect_id), delivery_time)
+    return delivery_times
+
+
+def print_report(channel: str, provider: FakeTelegramBotAPI | FakeGmailAPI, insert_times: dict[int, float]):
+    delivery_times = get_delivery_times(provider)
+    latencies = sorted(delivery_times[defect_id] - insert_time for defect_id, insert_time in insert_times.items()
+                       if defect_id in delivery_times)
+    if not latencies:
+        print(f"{channel}: no defects delivered")
+        return
+    elapsed = max(delivery_times[defect_id] for defect_id in insert_times if defect_id in delivery_times) - \
+        min(insert_times.values())
+    print(f"{channel}: {len(latencies)}/{len(insert_times)} defects delivered in {len(provider.delivered)} messages, "
+          f"{len(latencies) / elapsed:.1f} defects/s; latency p50={statistics.median(latencies):.2f} s, "
+          f"p95={latencies[int(0.95 * (len(latencies) - 1))]:.2f} s, max={latencies[-1]:.2f} s; "
+          f"{provider.count_of_failed} injected errors, {provider.count_of_rejected} rejected by quota")
+
+
+async def run_benchmark(arguments: argparse.Namespace):
+    telegram_provider = FakeTelegramBotAPI(latency_seconds=arguments.latency, error_rate=arguments.error_rate,
+                                           chat_ids=tuple(range(1, arguments.chats + 1)))
+    gmail_provider = FakeGmailAPI(latency_seconds=arguments.latency, error_rate=arguments.error_rate)
+    if not arguments.rate_limits:
+        telegram_provider.chat_limit, telegram_provider.total_quota = None, None
+
+    configure_application(arguments)
+    from google.oauth2.credentials import Credentials
+    from application.db_listener import listen_for_new_defects
+    from application.notification_workers import run_notification_workers
+    from application.services.notification_service import gmail_client_manager
+
+    async with run_fake_provider(telegram_provider.app, arguments.telegram_port), \
+            run_fake_provider(gmail_provider.app, arguments.gmail_port):
+        await asyncio.to_thread(prepare_database)
+        gmail_client_manager.set_credentials(Credentials(token="benchmark"))
+        background_tasks = [asyncio.create_task(listen_for_new_defects()),
+                            asyncio.create_task(run_notification_workers())]
+        # Listener has to be subscribed before the first insert
+        await asyncio.sleep(1)
+
+        insert_times = await asyncio.to_thread(insert_defects, arguments.defects, arguments.rate)
+        deadline = monotonic() + arguments.timeout
+        while monotonic() < deadline and not all(
+                set(insert_times) <= set(get_delivery_times(provider))
+                for provider in (telegram_provider, gmail_provider)):
+            await asyncio.sleep(0.2)
+
+        for task in background_tasks:
+            task.cancel()
+
+    print_report("Telegram", telegram_provider, insert_times)
+    print_report("Gmail", gmail_provider, insert_times)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--defects", type=int, default=100)
+    parser.add_argument("--rate", type=float, default=0, help="defects inserted per second (0 - without pauses)")
+    parser.add_argument("--latency", type=float, default=0, help="latency of every provider request in seconds")
+    parser.add_argument("--error-rate", type=float, default=0, help="share of the provider requests failed with 500")
+    parser.add_argument("--chats", type=int, default=1, help="count of Telegram chats receiving notifications")
+    parser.add_argument("--coalescing-window", type=float, default=0)
+    parser.add_argument("--no-rate-limits", dest="rate_limits", action="store_false",
+                        help="disable quotas of the providers and the rate limiter of the application")
+    parser.add_argument("--timeout", type=float, default=300, help="maximum time of waiting for the deliveries")
+    parser.add_argument("--telegram-port", type=int, default=8765)
+    parser.add_argument("--gmail-port", type=int, default=8766)
+    asyncio.run(run_benchmark(parser.parse_args()))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,60 @@
+from application.services.logging_service import AuditLogLimiter
+
+
+def test_similar_records_are_suppressed_within_window():
+    limiter = AuditLogLimiter(window_seconds=60, limits={}, deduplicated_types={"error", "warning"})
+    assert limiter.register("warning", "Failed to remove defect with id=1: defect not found", now=0) == (True, [])
+    assert limiter.register("warning", "Failed to remove defect with id=2: defect not found", now=1) == (False, [])
+    assert limiter.register("warning", "Failed to remove defect with id=3: defect not found", now=2) == (False, [])
+    assert limiter.register("info", "Another record", now=3) == (True, [])
+
+
+def test_summary_of_suppressed_records_after_window():
+    limiter = AuditLogLimiter(window_seconds=60, limits={}, deduplicated_types={"error", "warning"})
+    limiter.register("error", "Telegram error", now=0)
+    limiter.register("error", "Telegram error", now=10)
+    limiter.register("error", "Telegram error", now=20)
+
+    is_allowed, summaries = limiter.register("info", "Another record", now=75)
+    assert is_allowed
+    assert len(summaries) == 1
+    assert summaries[0][0] == "error"
+    assert summaries[0][1].startswith("2 similar messages suppressed")
+
+    # After the window the same record can be written again
+    assert limiter.register("error", "Telegram error", now=80) == (True, [])
+
+
+def test_rate_limit_per_type():
+    limiter = AuditLogLimiter(window_seconds=60, limits={"error": 2}, deduplicated_types=set())
+    assert limiter.register("error", "First", now=0)[0]
+    assert limiter.register("error", "Second", now=1)[0]
+    assert not limiter.register("error", "Third", now=2)[0]
+    assert limiter.register("warning", "Not limited type", now=3)[0]
+    assert limiter.register("error", "Fourth", now=61)[0]
+
+
+def test_only_deduplicated_types_are_deduplicated():
+    limiter = AuditLogLimiter(window_seconds=60, limits={}, deduplicated_types={"error"})
+    for defect_id in range(1, 5):
+        assert limiter.register("critical_defect", f"New critical-level defect with id={defect_id} has appeared "
+                                                   "on the conveyor!", now=defect_id) == (True, [])
+
+
+def test_summaries_are_collected_without_new_records():
+    limiter = AuditLogLimiter(window_seconds=60, limits={}, deduplicated_types={"error"})
+    limiter.register("error", "Telegram error", now=0)
+    limiter.register("error", "Telegram error", now=10)
+    assert not limiter.collect_summaries(now=30)
+    assert limiter.collect_summaries(now=30, everything=True)[0][1].startswith("1 similar messages suppressed")
+    assert not limiter.collect_summaries(now=100)
+
+
+def test_records_about_new_defects_are_not_limited():
+    limiter = AuditLogLimiter(window_seconds=60, limits={"warning": 20}, deduplicated_types={"warning"})
+    for defect_id in range(1, 101):
+        assert limiter.register("warning", f"New normal-level defect with id={defect_id} has appeared on the conveyor!",
+                                now=defect_id / 10, is_limited=False) == (True, [])
+    # Records about new defects don't use up the limit of the other records of the type
+    assert limiter.register("warning", "Failed to remove defect with id=1: defect not found", now=11)[0]
+    assert not limiter.register("warning", "Failed to remove defect with id=2: defect not found", now=12)[0]
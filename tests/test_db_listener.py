@@ -0,0 +1,129 @@
+import asyncio
+import json
+
+from application import db_listener
+from application.db_listener import LISTENER_STATE, on_new_defect_notify_handler, catch_up_with_missed_defects
+
+
+def test_defects_dropped_by_full_queue_are_caught_up(monkeypatch):
+    async def run():
+        monkeypatch.setattr(db_listener, "new_defects_queue", asyncio.Queue(maxsize=2))
+        monkeypatch.setitem(LISTENER_STATE, "is_catching_up", False)
+        monkeypatch.setitem(LISTENER_STATE, "last_defect_id", 10)
+        monkeypatch.setitem(LISTENER_STATE, "last_notified_defect_id", None)
+        for defect_id in (11, 12, 13, 14):
+            on_new_defect_notify_handler(None, None, "new_defect", json.dumps({"id": defect_id}))
+        # Defects after the overflow aren't queued until the catch-up
+        assert LISTENER_STATE["is_catching_up"]
+        assert LISTENER_STATE["last_defect_id"] == 12
+
+        queued_payloads = [db_listener.new_defects_queue.get_nowait() for _ in range(2)]
+        monkeypatch.setattr(db_listener, "get_defect_ids_after",
+                            lambda defect_id, limit: list(range(defect_id + 1, 15))[:limit])
+        count_of_missed_defects = await catch_up_with_missed_defects()
+        while not db_listener.new_defects_queue.empty():
+            queued_payloads.append(db_listener.new_defects_queue.get_nowait())
+        return queued_payloads, count_of_missed_defects
+
+    queued_payloads, count_of_missed_defects = asyncio.run(run())
+    assert [json.loads(payload)["id"] for payload in queued_payloads] == [11, 12, 13, 14]
+    assert count_of_missed_defects == 2
+    assert not LISTENER_STATE["is_catching_up"]
+
+
+def test_defects_handled_together_are_fetched_at_once(monkeypatch):
+    fetched_defect_ids, loaded_user_settings, handled_defects = [], [], []
+
+    def get_new_defects_info(defect_ids):
+        fetched_defect_ids.append(defect_ids)
+        # Defect with id=2 has been deleted before the handling
+        return {defect_id: (None, "normal", b"photo") for defect_id in defect_ids if defect_id != 2}
+
+    def load_user_settings():
+        loaded_user_settings.append({"new_defect_notification_scope": ["Gmail"]})
+        return loaded_user_settings[-1]
+
+    async def handle_new_defect(defect_id, *_args, user_settings):
+        handled_defects.append((defect_id, user_settings))
+
+    monkeypatch.setattr(db_listener, "get_new_defects_info", get_new_defects_info)
+    monkeypatch.setattr(db_listener, "load_user_settings", load_user_settings)
+    monkeypatch.setattr(db_listener, "create_record_of_current_general_conveyor_status", lambda: None)
+    monkeypatch.setattr(db_listener, "handle_new_defect", handle_new_defect)
+    asyncio.run(db_listener.handle_new_defects([json.dumps({"id": defect_id}) for defect_id in (1, 2, 3)]))
+
+    assert fetched_defect_ids == [[1, 2, 3]]
+    assert len(loaded_user_settings) == 1
+    assert handled_defects == [(1, loaded_user_settings[0]), (3, loaded_user_settings[0])]
+
+
+def test_error_of_one_defect_does_not_stop_handling_of_batch(monkeypatch):
+    handled_defect_ids, log_records = [], []
+
+    async def handle_new_defect(defect_id, *_args, user_settings):
+        if defect_id == 1:
+            raise RuntimeError("Notification can't be enqueued")
+        handled_defect_ids.append(defect_id)
+
+    monkeypatch.setattr(db_listener, "get_new_defects_info",
+                        lambda defect_ids: {defect_id: (None, "normal", b"photo") for defect_id in defect_ids})
+    monkeypatch.setattr(db_listener, "load_user_settings", dict)
+    monkeypatch.setattr(db_listener, "create_record_of_current_general_conveyor_status", lambda: None)
+    monkeypatch.setattr(db_listener, "create_log_record", lambda *args: log_records.append(args))
+    monkeypatch.setattr(db_listener, "handle_new_defect", handle_new_defect)
+    asyncio.run(db_listener.handle_new_defects([json.dumps({"id": defect_id}) for defect_id in (1, 2, 3)]))
+
+    assert handled_defect_ids == [2, 3]
+    assert len(log_records) == 1 and "id=1" in log_records[0][1]
+
+
+def test_watermark_stops_before_unfinished_defects(monkeypatch):
+    saved_watermarks = []
+    monkeypatch.setattr(db_listener, "save_processed_defects_watermark", saved_watermarks.append)
+    monkeypatch.setattr(db_listener, "pending_defect_ids", set())
+    monkeypatch.setattr(db_listener, "new_defects_queue", asyncio.Queue(maxsize=10))
+    monkeypatch.setitem(LISTENER_STATE, "is_catching_up", False)
+    monkeypatch.setitem(LISTENER_STATE, "last_defect_id", 10)
+    monkeypatch.setitem(LISTENER_STATE, "saved_watermark", 10)
+    for defect_id in (11, 12, 13):
+        on_new_defect_notify_handler(None, None, "new_defect", json.dumps({"id": defect_id}))
+    assert db_listener.get_processed_defects_watermark() == 10
+
+    # Defect 12 is handled before defect 11, so the defects after 10 aren't processed yet
+    db_listener.pending_defect_ids.discard(12)
+    asyncio.run(db_listener.save_processed_defects_watermark_if_changed())
+    assert not saved_watermarks
+    db_listener.pending_defect_ids.discard(11)
+    asyncio.run(db_listener.save_processed_defects_watermark_if_changed())
+    db_listener.pending_defect_ids.discard(13)
+    asyncio.run(db_listener.save_processed_defects_watermark_if_changed())
+    assert saved_watermarks == [12, 13]
+
+
+def test_new_leader_continues_from_saved_watermark(monkeypatch):
+    class Connection:
+        async def add_listener(self, *_args):
+            pass
+
+        async def fetchval(self, _query):
+            raise OSError("Connection is lost")
+
+    monkeypatch.setattr(db_listener, "pending_defect_ids", set())
+    monkeypatch.setattr(db_listener, "new_defects_queue", asyncio.Queue(maxsize=10))
+    monkeypatch.setattr(db_listener, "load_processed_defects_watermark", lambda: 20)
+    monkeypatch.setattr(db_listener, "get_last_defect_id", lambda: 25)
+    # Defects 21-25 were added during the failover or weren't finished by the previous leader
+    monkeypatch.setattr(db_listener, "get_defect_ids_after",
+                        lambda defect_id, limit: list(range(defect_id + 1, 26))[:limit])
+    monkeypatch.setitem(LISTENER_STATE, "last_defect_id", None)
+    monkeypatch.setitem(LISTENER_STATE, "last_notified_defect_id", None)
+
+    async def run():
+        try:
+            await db_listener.listen_with_connection(Connection(), None)
+        except OSError:
+            pass
+        return [json.loads(db_listener.new_defects_queue.get_nowait())["id"] for _ in range(5)]
+
+    assert asyncio.run(run()) == [21, 22, 23, 24, 25]
+    assert db_listener.pending_defect_ids == {21, 22, 23, 24, 25}
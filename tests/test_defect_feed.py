@@ -0,0 +1,87 @@
+import asyncio
+import json
+from datetime import datetime, timedelta, timezone
+
+import pytest
+from fastapi import FastAPI, HTTPException, WebSocketDisconnect
+from fastapi.testclient import TestClient
+
+from application.defect_feed import DefectFeed
+from application.services import defect_info_service
+from application.models.api_models import DefectResponseModel, DefectDeltaResponseModel, DefectFeedFilters
+
+
+def create_delta(defect_id: int, defect_type: str = "hole", criticality: str = "normal",
+                 longitudinal_position: int = 100, action: str = "created", previous_criticality: str | None = None):
+    defect = DefectResponseModel(id=defect_id, timestamp=datetime(2025, 1, 1), type=defect_type, is_on_belt=True,
+                                 box_width_in_mm=10, box_length_in_mm=10, longitudinal_position=longitudinal_position,
+                                 transverse_position=10, probability=90, criticality=criticality, base64_photo="")
+    return DefectDeltaResponseModel(action=action, defect=defect, previous_criticality=previous_criticality)
+
+
+def test_client_receives_only_defects_matching_filters():
+    async def run():
+        feed = DefectFeed(buffer_size=10)
+        client = feed.subscribe()
+        client.filters = DefectFeedFilters(types=["hole"], criticalities=["critical"], min_longitudinal_position=50,
+                                           max_longitudinal_position=150)
+        feed.publish(create_delta(1, criticality="critical"))
+        feed.publish(create_delta(2, defect_type="tear", criticality="critical"))
+        feed.publish(create_delta(3, criticality="normal"))
+        feed.publish(create_delta(4, criticality="critical", longitudinal_position=200))
+        # Defect which isn't critical any more has to be removed by the client
+        feed.publish(create_delta(5, action="criticality_changed", previous_criticality="critical"))
+        return await client.get_events()
+
+    events = asyncio.run(run())
+    assert [event_id for event_id, _ in events] == [1, 5]
+    assert DefectDeltaResponseModel.model_validate_json(events[1][1]).action == "criticality_changed"
+
+
+def test_slow_client_is_disconnected():
+    feed = DefectFeed(buffer_size=1)
+    client = feed.subscribe()
+    feed.publish(create_delta(1))
+    assert not client.is_disconnected
+    feed.publish(create_delta(2))
+    assert client.is_disconnected
+    assert not feed.clients
+
+
+@pytest.fixture
+def feed_client(monkeypatch):
+    """
+    Application with the feed only (without the database), the valid token is "valid" and expires in 0.3 seconds
+    """
+    def authenticate_admin_by_token(token: str):
+        if token != "valid":
+            raise HTTPException(status_code=401, detail="Could not validate credentials")
+        return datetime.now(timezone.utc) + timedelta(seconds=0.3)
+
+    monkeypatch.setattr(defect_info_service, "authenticate_admin_by_token", authenticate_admin_by_token)
+    monkeypatch.setattr(defect_info_service, "FEED_AUTHENTICATION_TIMEOUT_SECONDS", 0.3)
+    feed_application = FastAPI()
+    feed_application.include_router(defect_info_service.feed_router)
+    return TestClient(feed_application)
+
+
+@pytest.mark.parametrize("first_message", [json.dumps({"token": "invalid"}), json.dumps({"types": ["hole"]}),
+                                           "not json", None])
+def test_feed_client_without_valid_token_is_disconnected(feed_client, first_message):
+    with feed_client.websocket_connect("/defect_info/feed") as websocket:
+        if first_message is not None:
+            websocket.send_text(first_message)
+        with pytest.raises(WebSocketDisconnect) as disconnection:
+            websocket.receive_text()
+    assert disconnection.value.code == 1008
+    assert disconnection.value.reason == "Invalid token"
+
+
+def test_feed_client_is_disconnected_when_token_expires(feed_client):
+    with feed_client.websocket_connect("/defect_info/feed") as websocket:
+        websocket.send_text(json.dumps({"token": "valid"}))
+        websocket.send_text(json.dumps({"types": ["hole"]}))
+        with pytest.raises(WebSocketDisconnect) as disconnection:
+            websocket.receive_text()
+    assert disconnection.value.code == 1008
+    assert disconnection.value.reason == "Token has expired"
@@ -1,7 +1,7 @@
 import os
 os.environ["TESTING"] = "1"
 from datetime import datetime
-from base64 import b64encode
+from base64 import b64encode, b64decode
 
 import pytest
 from sqlmodel import SQLModel
@@ -9,6 +9,7 @@ from fastapi.testclient import TestClient
 
 from application.main import application
 from application.db_connection import engine, settings
+from application.services.report_service import get_defects_for_report
 
 # Before running the tests, you need to change the DATABASE_URL value in the .env file to the test one.
 
@@ -113,3 +114,43 @@ def test_get_extreme_defects(test_client, auth_headers):
     assert response.status_code == 200
     assert len(data) == 1
     assert data[0] == defect_1_response_json
+
+
+def test_get_count_of_defect_groups(test_client, auth_headers):
+    response = test_client.get(url="/api/v1/defect_info/count", headers=auth_headers)
+    assert response.status_code == 200
+    assert response.json() == {"total": 2, "extreme": 1, "critical": 1}
+
+
+def test_get_defects_for_report():
+    defects, extreme_count, critical_count = get_defects_for_report(include_photos=True)
+    assert (extreme_count, critical_count) == (1, 1)
+    assert [defect.model_dump(mode="json", exclude={"photo"}) | {"base64_photo": encoded_photo}
+            for defect in defects] == [defect_1_response_json, defect_2_response_json]
+    assert all(defect.photo == b64decode(encoded_photo) for defect in defects)
+    defects, _, _ = get_defects_for_report(include_photos=False, defect_id=2)
+    assert len(defects) == 1 and defects[0].photo is None
+
+
+# Changes the data, so it goes last
+def test_get_changes_of_defects_since_version(test_client, auth_headers):
+    response = test_client.get(url="/api/v1/defect_info/changes", params={"since": 0}, headers=auth_headers)
+    data = response.json()
+    assert response.status_code == 200
+    assert data["changed"] == [defect_1_response_json, defect_2_response_json]
+    assert data["deleted_ids"] == []
+
+    response = test_client.get(url="/api/v1/defect_info/changes", params={"since": data["version"]},
+                               headers=auth_headers)
+    assert response.json()["changed"] == []
+
+    test_client.put(url="/api/v1/defect_info/id=1/set_criticality", params={"is_extreme": False, "is_critical": True},
+                    headers=auth_headers)
+    test_client.delete(url="/api/v1/defect_info/id=2/delete", headers=auth_headers)
+    response = test_client.get(url="/api/v1/defect_info/changes", params={"since": data["version"]},
+                               headers=auth_headers)
+    changes = response.json()
+    assert [defect["id"] for defect in changes["changed"]] == [1]
+    assert changes["changed"][0]["criticality"] == "critical"
+    assert changes["deleted_ids"] == [2]
+    assert changes["version"] >= data["version"]
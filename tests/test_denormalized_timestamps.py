@@ -0,0 +1,112 @@
+import os
+os.environ["TESTING"] = "1"
+from datetime import datetime
+
+import pytest
+from sqlmodel import SQLModel, Session, select, text
+from fastapi.testclient import TestClient
+
+from application import denormalized_timestamps
+from application.main import application
+from application.db_connection import engine, settings
+from application.models.db_models import Defect
+from application.denormalized_timestamps import (DENORMALIZATION_STATE, enable_denormalized_timestamps,
+                                                  find_missing_denormalization, backfill_denormalized_timestamps)
+from application.services.defect_info_service import restrict_select_of_defects_to_time_period
+
+# Before running the tests, you need to change the DATABASE_URL value in the .env file to the test one.
+
+
+@pytest.fixture(scope="module")
+def test_client():
+    with TestClient(application) as client:
+        yield client
+
+
+@pytest.fixture(scope="module")
+def auth_headers(test_client):
+    login_response = test_client.post(url="/api/v1/auth/token",
+                                      data={"username": settings.admin_username, "password": settings.admin_password})
+    assert login_response.status_code == 200
+    token = login_response.json()["access_token"]
+    return {"Authorization": f"Bearer {token}"}
+
+
+@pytest.fixture(scope="module", autouse=True)
+def setup_module(test_client, auth_headers):
+    settings.denormalized_timestamps = True
+    test_client.post(url="api/v1/maintenance/create_tables", params={"test_mode": True}, headers=auth_headers)
+    test_client.post(url="api/v1/maintenance/fill_database", headers=auth_headers)
+    yield
+    settings.denormalized_timestamps = False
+    DENORMALIZATION_STATE["is_ready"] = True
+    SQLModel.metadata.drop_all(engine)
+
+
+# Protection against changes to the production database
+if settings.database_url.split("/")[-1] != "test_db":
+    raise ValueError("USING NON-TEST DATABASE CONNECTION PARAMETERS. CHANGE THE \"DATABASE_URL\" PARAMETER "
+                     "IN THE .env FILE")
+
+
+def get_time_and_type_of_defects():
+    with engine.connect() as connection:
+        return connection.execute(text("SELECT defects.id, defects.time, defects.object_type, objects.time, "
+                                       "objects.type FROM defects JOIN objects ON objects.id = defects.obj_id "
+                                       "ORDER BY defects.id")).all()
+
+
+def test_time_and_type_are_copied_on_insert():
+    rows = get_time_and_type_of_defects()
+    assert [row.id for row in rows] == [1, 2]
+    for _, defect_time, defect_object_type, object_time, object_type in rows:
+        assert (defect_time, defect_object_type) == (object_time, object_type)
+
+
+def test_change_of_object_time_is_propagated():
+    with engine.begin() as connection:
+        connection.execute(text("UPDATE objects SET time = '2025-03-01' WHERE id = (SELECT obj_id FROM defects "
+                                "WHERE id = 2)"))
+    assert get_time_and_type_of_defects()[1][1] == datetime(2025, 3, 1)
+
+    with engine.begin() as connection:
+        connection.execute(text("UPDATE objects SET time = '2025-01-02' WHERE id = (SELECT obj_id FROM defects "
+                                "WHERE id = 2)"))
+    assert get_time_and_type_of_defects()[1][1] == datetime(2025, 1, 2)
+
+
+def test_missing_backfill_is_found_and_filled_in_batches(monkeypatch):
+    with engine.begin() as connection:
+        assert find_missing_denormalization(connection) is None
+        # Rows written before the denormalization was introduced
+        connection.execute(text("UPDATE defects SET time = NULL, object_type = NULL"))
+        assert find_missing_denormalization(connection) == "existing rows of the \"defects\" table are not backfilled"
+
+    monkeypatch.setattr(denormalized_timestamps, "BACKFILL_BATCH_SIZE", 1)
+    assert backfill_denormalized_timestamps() == 2
+    # Rows which are already filled aren't updated again
+    assert backfill_denormalized_timestamps() == 0
+    with engine.connect() as connection:
+        assert find_missing_denormalization(connection) is None
+    assert all(row[1:3] == row[3:5] for row in get_time_and_type_of_defects())
+
+
+def test_missing_trigger_is_found():
+    with engine.begin() as connection:
+        connection.execute(text("DROP TRIGGER trigger_copy_time_and_type_of_base_object ON history"))
+        assert find_missing_denormalization(connection) == "trigger on the \"history\" table is not created"
+        enable_denormalized_timestamps(connection)
+        assert find_missing_denormalization(connection) is None
+
+
+def test_defects_of_period_are_selected_without_objects_table(test_client, auth_headers):
+    statement = restrict_select_of_defects_to_time_period(select(Defect), datetime(2025, 1, 1), datetime(2025, 1, 2))
+    assert "objects" not in str(statement)
+    with Session(engine) as session:
+        assert [defect.id for defect in session.exec(statement).all()] == [1, 2]
+
+    response = test_client.get(url="/api/v1/defect_info/by_period", headers=auth_headers,
+                               params={"start_datetime": "2025-01-01T00:00:00", "end_datetime": "2025-01-01T12:00:00"})
+    assert response.status_code == 200
+    assert [defect["id"] for defect in response.json()] == [1]
+    assert response.json()[0]["timestamp"] == "2025-01-01T00:00:00"
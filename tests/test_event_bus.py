@@ -0,0 +1,41 @@
+import asyncio
+
+from application import event_bus
+from application.event_bus import EVENT_BUS_STATE
+from application.services.maintenance_service import events_hub, notify_clients, on_client_event
+
+
+def test_client_event_is_published_locally_without_event_bus(monkeypatch):
+    async def run():
+        monkeypatch.setitem(EVENT_BUS_STATE, "is_connected", False)
+        client = events_hub.subscribe()
+        try:
+            await notify_clients("local")
+            return await client.get_events()
+        finally:
+            events_hub.unsubscribe(client)
+
+    events = asyncio.run(run())
+    assert len(events) == 1
+    assert events[0][1].endswith("data: local\n\n")
+
+
+def test_client_event_has_the_same_id_in_all_processes(monkeypatch):
+    sent_payloads = []
+
+    async def run():
+        monkeypatch.setitem(EVENT_BUS_STATE, "is_connected", True)
+        monkeypatch.setattr(event_bus, "send_to_event_bus", lambda channel, payload: sent_payloads.append(payload))
+        client = events_hub.subscribe()
+        try:
+            await notify_clients("shared")
+            # Event isn't published by the publisher until it's received from the bus
+            assert not client.buffer
+            await on_client_event(sent_payloads[0])
+            return await client.get_events()
+        finally:
+            events_hub.unsubscribe(client)
+
+    events = asyncio.run(run())
+    assert len(sent_payloads) == 1
+    assert events[0][0] == events_hub.last_event_id
@@ -0,0 +1,40 @@
+import os
+os.environ["TESTING"] = "1"
+from datetime import datetime
+
+from fastapi.testclient import TestClient
+
+from application.main import application
+from application.config import settings
+from application.services import health_service
+from application.services.health_service import DatabaseProbe
+
+
+def test_database_probe_result_is_shared_during_its_lifetime(monkeypatch):
+    probe_results = iter([{"is_database_available": True}, {"is_database_available": False}])
+    current_time = {"value": 100.0}
+    monkeypatch.setattr(health_service, "monotonic", lambda: current_time["value"])
+    probe = DatabaseProbe(lifetime_seconds=5, probe_function=lambda: next(probe_results))
+
+    assert probe.get_result()["is_database_available"]
+    current_time["value"] += 4
+    assert probe.get_result()["is_database_available"]
+    current_time["value"] += 1
+    assert not probe.get_result()["is_database_available"]
+
+
+def test_health_contains_state_of_database_and_process(monkeypatch):
+    monkeypatch.setattr(health_service, "database_probe", DatabaseProbe(5, lambda: {
+        "is_database_available": False, "database_details": "Some problems with database connection",
+        "database_checked_at": datetime.now(), "is_leader_elected": None, "waiting_notifications": None}))
+    # The server is checked without the authentication
+    response = TestClient(application).get(url="/api/v1/health/")
+    data = response.json()
+    assert response.status_code == 200
+    assert data["server"] == "OK"
+    assert not data["is_database_available"]
+    assert data["database_details"] == "Some problems with database connection"
+    assert set(data["connection_pool"]) == {"size", "checked_out", "checked_in", "overflow"}
+    assert not data["is_leader"]
+    assert data["new_defects_queue_size"] == 0
+    assert data["health_push_interval_seconds"] == settings.health_push_interval_seconds
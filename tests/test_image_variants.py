@@ -0,0 +1,78 @@
+import time
+from hashlib import blake2b
+from io import BytesIO
+
+from PIL import Image
+
+from application.image_variants import ImageVariantsCache, create_image_variant, choose_variant_for_size
+
+
+def create_photo(size: tuple[int, int], color: str = "gray", image_format: str = "PNG"):
+    output = BytesIO()
+    Image.new("RGB", size, color).save(output, format=image_format)
+    return output.getvalue()
+
+
+def test_variants_are_downscaled():
+    photo = create_photo((4000, 3000))
+    sizes = {}
+    for name in ("full", "preview", "thumbnail"):
+        with Image.open(BytesIO(create_image_variant(photo, name))) as image:
+            assert image.format == "JPEG"
+            sizes[name] = image.size
+    assert sizes == {"full": (3840, 2880), "preview": (1280, 960), "thumbnail": (266, 200)}
+
+
+def test_small_jpeg_is_not_recompressed():
+    photo = create_photo((800, 600), image_format="JPEG")
+    assert create_image_variant(photo, "full") is photo
+    assert create_image_variant(photo, "thumbnail") is not photo
+
+
+def test_variants_are_cached_and_evicted_by_size():
+    first_photo, second_photo = create_photo((800, 600), "red"), create_photo((800, 600), "blue")
+    cache = ImageVariantsCache(max_size_bytes=1)
+    thumbnail = cache.get_variant(first_photo, "thumbnail")
+    assert cache.get_variant(first_photo, "thumbnail") is thumbnail
+
+    # The cache over the limit keeps only the last photo
+    cache.get_variant(second_photo, "preview")
+    assert cache.get_variant(first_photo, "thumbnail") is not thumbnail
+
+
+def test_variants_are_read_from_directory_after_restart(tmp_path, monkeypatch):
+    photo = create_photo((800, 600))
+    thumbnail = ImageVariantsCache(max_size_bytes=1024 * 1024, directory=str(tmp_path)).get_variant(photo, "thumbnail")
+    assert len(list(tmp_path.rglob("*_thumbnail.jpg"))) == 1
+    # Only the requested variant is created
+    assert not list(tmp_path.rglob("*_preview.jpg"))
+
+    def create_image_variant_again(*_args):
+        raise AssertionError("Variant is created again")
+
+    monkeypatch.setattr("application.image_variants.create_image_variant", create_image_variant_again)
+    restarted_cache = ImageVariantsCache(max_size_bytes=1024 * 1024, directory=str(tmp_path))
+    assert restarted_cache.get_variant(photo, "thumbnail") == thumbnail
+
+
+def test_variant_is_chosen_by_drawing_size():
+    assert choose_variant_for_size(133, 100) == "thumbnail"
+    assert choose_variant_for_size(575, 430) == "preview"
+    assert choose_variant_for_size(2000, 1500) == "full"
+
+
+def test_least_recently_used_variants_are_removed_from_directory(tmp_path):
+    photos = [create_photo((800, 600), color) for color in ("red", "green", "blue")]
+    variant_size = len(create_image_variant(photos[0], "thumbnail"))
+    cache = ImageVariantsCache(max_size_bytes=1, directory=str(tmp_path),
+                               max_directory_size_bytes=int(variant_size * 2.5))
+    cache.get_variant(photos[0], "thumbnail")
+    cache.get_variant(photos[1], "thumbnail")
+    # Variant read from the directory becomes the recently used one
+    time.sleep(0.01)
+    cache.get_variant(photos[0], "thumbnail")
+    cache.get_variant(photos[2], "thumbnail")
+
+    expected_variants = {f"{blake2b(photo, digest_size=16).hexdigest()}_thumbnail.jpg"
+                         for photo in (photos[0], photos[2])}
+    assert {path.name for path in tmp_path.rglob("*.jpg")} == expected_variants
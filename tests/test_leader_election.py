@@ -0,0 +1,150 @@
+import asyncio
+
+from application import leader_election
+from application.config import settings
+from application.leader_election import LEADER_STATE, run_as_leader
+
+
+class AdvisoryLock:
+    def __init__(self):
+        self.holder = None
+
+
+class Connection:
+    """
+    Connection of one server process, the lock is released when it's closed like the session advisory lock
+    """
+
+    def __init__(self, lock: AdvisoryLock):
+        self.lock = lock
+        self.is_broken = False
+
+    async def fetchval(self, query: str, *_args):
+        if self.is_broken:
+            raise OSError("Connection is lost")
+        if "pg_try_advisory_lock" in query:
+            if self.lock.holder is None:
+                self.lock.holder = self
+            return self.lock.holder is self
+        return 1
+
+    def terminate(self):
+        if self.lock.holder is self:
+            self.lock.holder = None
+
+
+def set_up_election(monkeypatch, lock: AdvisoryLock, log_records: list):
+    async def connect(*_args, **_kwargs):
+        return Connection(lock)
+
+    monkeypatch.setattr(leader_election, "connect", connect)
+    monkeypatch.setattr(leader_election, "create_log_record", lambda *record: log_records.append(record))
+    monkeypatch.setattr(settings, "leader_election_interval_seconds", 0.01)
+    monkeypatch.setitem(LEADER_STATE, "is_leader", False)
+
+
+def test_only_one_process_leads_and_another_takes_over_after_failure(monkeypatch):
+    lock, running = AdvisoryLock(), {"first": 0, "second": 0}
+    set_up_election(monkeypatch, lock, [])
+
+    def create_leader_task(process: str):
+        async def leader_task():
+            running[process] += 1
+            try:
+                await asyncio.Event().wait()
+            finally:
+                running[process] -= 1
+        return leader_task
+
+    async def run():
+        processes = [asyncio.create_task(run_as_leader(create_leader_task(process))) for process in running]
+        await asyncio.sleep(0.1)
+        first_leader = [process for process, count in running.items() if count]
+        # Connection of the leader is lost, its tasks are stopped and the other process becomes the leader
+        lock.holder.is_broken = True
+        await asyncio.sleep(0.1)
+        second_leader = [process for process, count in running.items() if count]
+        for process in processes:
+            process.cancel()
+        await asyncio.gather(*processes, return_exceptions=True)
+        return first_leader, second_leader
+
+    first_leader, second_leader = asyncio.run(run())
+    assert len(first_leader) == 1 and len(second_leader) == 1
+    assert first_leader != second_leader
+
+
+def test_crashed_leader_task_is_restarted_while_lock_is_held(monkeypatch):
+    lock, log_records, starts = AdvisoryLock(), [], []
+    set_up_election(monkeypatch, lock, log_records)
+
+    async def leader_task():
+        starts.append(len(starts))
+        if len(starts) == 1:
+            raise RuntimeError("Crash of the task")
+        await asyncio.Event().wait()
+
+    async def run():
+        process = asyncio.create_task(run_as_leader(leader_task))
+        await asyncio.sleep(0.1)
+        is_lock_held = lock.holder is not None
+        process.cancel()
+        await asyncio.gather(process, return_exceptions=True)
+        return is_lock_held
+
+    assert asyncio.run(run())
+    assert len(starts) == 2
+    assert any(record[0] == "error" and "Crash of the task" in record[1] for record in log_records)
+
+
+def test_election_survives_logging_failure(monkeypatch):
+    lock, starts = AdvisoryLock(), []
+    set_up_election(monkeypatch, lock, [])
+
+    def create_log_record(*_record):
+        raise RuntimeError("Database is unavailable")
+
+    monkeypatch.setattr(leader_election, "create_log_record", create_log_record)
+
+    async def leader_task():
+        starts.append(True)
+        await asyncio.Event().wait()
+
+    async def run():
+        process = asyncio.create_task(run_as_leader(leader_task))
+        await asyncio.sleep(0.1)
+        is_running = not process.done()
+        process.cancel()
+        await asyncio.gather(process, return_exceptions=True)
+        return is_running
+
+    assert asyncio.run(run())
+    assert starts == [True]
+    assert not LEADER_STATE["is_leader"]
+
+
+def test_unexpected_errors_of_election_are_retried(monkeypatch):
+    lock, attempts = AdvisoryLock(), []
+    set_up_election(monkeypatch, lock, [])
+
+    async def connect(*_args, **_kwargs):
+        attempts.append(True)
+        if len(attempts) < 3:
+            raise RuntimeError("Unexpected error")
+        return Connection(lock)
+
+    monkeypatch.setattr(leader_election, "connect", connect)
+
+    async def leader_task():
+        await asyncio.Event().wait()
+
+    async def run():
+        process = asyncio.create_task(run_as_leader(leader_task))
+        await asyncio.sleep(0.2)
+        is_leader = LEADER_STATE["is_leader"]
+        process.cancel()
+        await asyncio.gather(process, return_exceptions=True)
+        return is_leader
+
+    assert asyncio.run(run())
+    assert len(attempts) == 3
@@ -0,0 +1,134 @@
+import os
+os.environ["TESTING"] = "1"
+import asyncio
+import csv
+import gzip
+import io
+import json
+from datetime import datetime
+
+import pytest
+from sqlmodel import SQLModel, Session, update
+from fastapi.testclient import TestClient
+
+from application.main import application
+from application.db_connection import engine, settings
+from application.models.db_models import Log, Object
+from application.models.api_models import LogResponseModel
+from application.services import logging_service
+from application.services.logging_service import stream_new_log_records, log_tail_hub, write_log_record
+
+# Before running the tests, you need to change the DATABASE_URL value in the .env file to the test one.
+
+
+@pytest.fixture(scope="module")
+def test_client():
+    with TestClient(application) as client:
+        yield client
+
+
+@pytest.fixture(scope="module")
+def auth_headers(test_client):
+    login_response = test_client.post(url="/api/v1/auth/token",
+                                      data={"username": settings.admin_username, "password": settings.admin_password})
+    assert login_response.status_code == 200
+    token = login_response.json()["access_token"]
+    return {"Authorization": f"Bearer {token}"}
+
+
+@pytest.fixture(scope="module")
+def log_records_of_three_months(test_client, auth_headers):
+    """
+    Database is needed only by the tests of the export, the tests of the tail don't use it
+    """
+    test_client.post(url="api/v1/maintenance/create_tables", params={"test_mode": True}, headers=auth_headers)
+    test_client.post(url="api/v1/maintenance/fill_database", headers=auth_headers)
+    log_ids = []
+    with Session(engine) as session:
+        for month in (1, 2, 3):
+            log = write_log_record("info", f"Record of month {month}, with comma")
+            time = datetime(2024, month, 10)
+            object_id = session.get(Log, log.id).id_obj
+            session.exec(update(Object).where(Object.id == object_id).values(time=time))
+            session.exec(update(Log).where(Log.id == log.id).values(time=time))
+            log_ids.append(log.id)
+        session.commit()
+    yield log_ids
+    SQLModel.metadata.drop_all(engine)
+
+
+# Protection against changes to the production database
+if settings.database_url.split("/")[-1] != "test_db":
+    raise ValueError("USING NON-TEST DATABASE CONNECTION PARAMETERS. CHANGE THE \"DATABASE_URL\" PARAMETER "
+                     "IN THE .env FILE")
+
+
+def create_log(log_id: int):
+    return LogResponseModel(id=log_id, timestamp=datetime(2025, 1, 1), type="info", text=f"Record {log_id}")
+
+
+def get_ids_of_events(messages: list[str]):
+    return [json.loads(line[len("data: "):])["id"] for message in messages for line in message.split("\n")
+            if line.startswith("data: ")]
+
+
+def read_log_tail(monkeypatch, since_id: int | None = None, last_event_id: int | None = None):
+    requested_ids = []
+
+    def get_log_records_after_id(log_id: int):
+        requested_ids.append(log_id)
+        return [create_log(missed_id) for missed_id in range(log_id + 1, 4)]
+
+    async def run():
+        response = await stream_new_log_records(since_id=since_id, last_event_id=last_event_id)
+        stream = response.body_iterator
+        messages = [await anext(stream) for _ in range(3 - (since_id if since_id is not None else last_event_id))]
+        # Record read with the missed ones is published again and is skipped
+        for log_id in (3, 4):
+            log_tail_hub.publish(create_log(log_id).model_dump_json(), event="log", event_id=log_id)
+        messages.append(await anext(stream))
+        await stream.aclose()
+        return messages
+
+    monkeypatch.setattr(logging_service, "get_log_records_after_id", get_log_records_after_id)
+    return requested_ids, asyncio.run(run())
+
+
+def test_log_tail_sends_missed_records_before_new_ones(monkeypatch):
+    requested_ids, messages = read_log_tail(monkeypatch, since_id=1)
+    assert requested_ids == [1]
+    assert get_ids_of_events(messages) == [2, 3, 4]
+    assert "id: 2\n" in messages[0]
+    assert not log_tail_hub.clients
+
+
+def test_log_tail_resumes_from_last_event_id_on_reconnection(monkeypatch):
+    requested_ids, messages = read_log_tail(monkeypatch, last_event_id=2)
+    assert requested_ids == [2]
+    assert get_ids_of_events(messages) == [3, 4]
+
+
+def export_log_records(test_client, auth_headers, export_format: str):
+    response = test_client.get(url="/api/v1/logs/export", headers=auth_headers,
+                               params={"export_format": export_format, "start_datetime": "2024-02-01T00:00:00",
+                                       "end_datetime": "2024-02-29T23:59:59"})
+    assert response.status_code == 200
+    assert response.headers["content-type"] == "application/gzip"
+    assert (response.headers["content-disposition"] ==
+            f"attachment; filename=\"logs_2024-02-01_2024-02-29.{export_format}.gz\"")
+    # Body is read as is, because the client doesn't decode the gzip without the "Content-Encoding" header
+    return gzip.decompress(response.content).decode()
+
+
+def test_csv_export_contains_only_records_of_period(test_client, auth_headers, log_records_of_three_months):
+    rows = list(csv.reader(io.StringIO(export_log_records(test_client, auth_headers, "csv"))))
+    assert rows == [["id", "timestamp", "type", "text"],
+                    [str(log_records_of_three_months[1]), "2024-02-10T00:00:00", "info",
+                     "Record of month 2, with comma"]]
+
+
+def test_ndjson_export_contains_only_records_of_period(test_client, auth_headers, log_records_of_three_months):
+    lines = export_log_records(test_client, auth_headers, "ndjson").splitlines()
+    assert [json.loads(line) for line in lines] == [{"id": log_records_of_three_months[1],
+                                                     "timestamp": "2024-02-10T00:00:00", "type": "info",
+                                                     "text": "Record of month 2, with comma"}]
@@ -0,0 +1,43 @@
+from io import BytesIO
+
+from PIL import Image
+
+from application.models.db_models import NotificationOutbox
+from application.notification_coalescer import (DefectNotification, make_contact_sheet, form_digest,
+                                                 form_digest_notification)
+
+
+def create_notification(defect_id: int, criticality: str = "normal", photo: bytes | None = None):
+    if photo is None:
+        output = BytesIO()
+        Image.new("RGB", (640, 480), "gray").save(output, format="JPEG")
+        photo = output.getvalue()
+    return DefectNotification(defect_id=defect_id, criticality=criticality, header="NEW DEFECT",
+                              text=f"id = {defect_id}", photo=photo)
+
+
+def test_digest_and_contact_sheet():
+    notifications = [create_notification(1, "extreme"), create_notification(2),
+                     create_notification(3, photo=b"corrupted")]
+    subject, text, telegram_text = form_digest(notifications)
+    assert subject == "3 NEW DEFECTS ON THE CONVEYOR!"
+    assert "1 extreme-level, 2 normal-level" in text
+    assert telegram_text.endswith("Defect ids: 1, 2, 3")
+
+    with Image.open(BytesIO(make_contact_sheet(notifications))) as sheet:
+        assert sheet.size == (3 * 240, 200)
+
+
+def test_digest_notification_is_formed_from_outbox_rows():
+    notifications = [NotificationOutbox(idempotency_key=f"new_defect:{defect_id}:Telegram", channel="Telegram",
+                                        text="Text", attachment=create_notification(defect_id).photo,
+                                        digest_item={"defect_id": defect_id, "criticality": "normal",
+                                                     "header": "NEW DEFECT", "text": f"id = {defect_id}"})
+                     for defect_id in (4, 7)]
+    digest = form_digest_notification(notifications)
+    assert digest.idempotency_key == "defect_digest:4-7:Telegram"
+    assert digest.recipient is None
+    assert digest.text.endswith("Defect ids: 4, 7")
+    assert digest.attachment_name == "Defects.jpg"
+    with Image.open(BytesIO(digest.attachment)) as sheet:
+        assert sheet.size == (2 * 240, 200)
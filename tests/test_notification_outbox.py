@@ -0,0 +1,186 @@
+import os
+os.environ["TESTING"] = "1"
+from datetime import datetime, timedelta
+
+import pytest
+from sqlmodel import SQLModel, Session, select, update
+from fastapi.testclient import TestClient
+
+from application.main import application
+from application.db_connection import engine, settings
+from application.models.db_models import NotificationOutbox
+from application.notification_outbox import (enqueue_notification, claim_due_notifications, mark_notification_failed,
+                                             mark_notifications_delivered, mark_notifications_split,
+                                             requeue_dead_notifications, get_notification_outbox_statistics)
+
+# Before running the tests, you need to change the DATABASE_URL value in the .env file to the test one.
+
+
+@pytest.fixture(scope="module")
+def test_client():
+    with TestClient(application) as client:
+        yield client
+
+
+@pytest.fixture(scope="module")
+def auth_headers(test_client):
+    login_response = test_client.post(url="/api/v1/auth/token",
+                                      data={"username": settings.admin_username, "password": settings.admin_password})
+    assert login_response.status_code == 200
+    token = login_response.json()["access_token"]
+    return {"Authorization": f"Bearer {token}"}
+
+
+@pytest.fixture(scope="module", autouse=True)
+def setup_module(test_client, auth_headers):
+    test_client.post(url="api/v1/maintenance/create_tables", params={"test_mode": True}, headers=auth_headers)
+    yield
+    SQLModel.metadata.drop_all(engine)
+
+
+@pytest.fixture(autouse=True)
+def clear_outbox():
+    with Session(engine) as session:
+        session.exec(NotificationOutbox.__table__.delete())
+        session.commit()
+
+
+# Protection against changes to the production database
+if settings.database_url.split("/")[-1] != "test_db":
+    raise ValueError("USING NON-TEST DATABASE CONNECTION PARAMETERS. CHANGE THE \"DATABASE_URL\" PARAMETER "
+                     "IN THE .env FILE")
+
+
+def get_notification(notification_id: int):
+    with Session(engine) as session:
+        return session.exec(select(NotificationOutbox).where(NotificationOutbox.id == notification_id)).one()
+
+
+def claim_due_notification():
+    notifications = claim_due_notifications()
+    assert len(notifications) <= 1
+    return notifications[0] if notifications else None
+
+
+def enqueue_digest_item(defect_id: int, channel: str = "Gmail"):
+    return enqueue_notification(idempotency_key=f"new_defect:{defect_id}:{channel}", channel=channel, text="Text",
+                                digest_item={"defect_id": defect_id, "criticality": "normal", "header": "NEW DEFECT",
+                                             "text": f"id = {defect_id}"})
+
+
+def move_next_attempt_to_past(notification_id: int):
+    with Session(engine) as session:
+        session.exec(update(NotificationOutbox).where(NotificationOutbox.id == notification_id)
+                     .values(next_attempt_at=datetime.now() - timedelta(seconds=1)))
+        session.commit()
+
+
+def test_notification_with_the_same_key_is_enqueued_once():
+    assert enqueue_notification(idempotency_key="new_defect:1:Gmail", channel="Gmail", text="Text")
+    assert not enqueue_notification(idempotency_key="new_defect:1:Gmail", channel="Gmail", text="Other text")
+    with Session(engine) as session:
+        assert len(session.exec(select(NotificationOutbox)).all()) == 1
+
+
+def test_claimed_notification_is_leased():
+    enqueue_notification(idempotency_key="new_defect:2:Gmail", channel="Gmail", text="Text")
+    notification = claim_due_notification()
+    assert notification.status == "sending"
+    assert notification.attempts == 1
+    assert notification.next_attempt_at > datetime.now() + timedelta(minutes=4)
+    # Leased notification isn't claimed by another worker
+    assert claim_due_notification() is None
+
+    # Notification whose lease has expired (e.g. the server was stopped during the delivery) is claimed again
+    move_next_attempt_to_past(notification.id)
+    claimed_again = claim_due_notification()
+    assert claimed_again.id == notification.id
+    assert claimed_again.attempts == 2
+
+
+def test_failed_notification_is_retried_with_backoff():
+    enqueue_notification(idempotency_key="new_defect:3:Gmail", channel="Gmail", text="Text")
+    notification = claim_due_notification()
+    assert not mark_notification_failed(notification, "Some error")
+
+    failed_notification = get_notification(notification.id)
+    assert failed_notification.status == "pending"
+    assert failed_notification.last_error == "Some error"
+    assert failed_notification.next_attempt_at > datetime.now() + timedelta(
+        seconds=0.7 * settings.notification_retry_base_seconds)
+    assert claim_due_notification() is None
+
+
+def test_notification_becomes_dead_after_max_attempts_and_can_be_requeued():
+    enqueue_notification(idempotency_key="new_defect:4:Gmail", channel="Gmail", text="Text")
+    for attempt in range(1, settings.notification_max_attempts + 1):
+        notification = claim_due_notification()
+        assert notification.attempts == attempt
+        is_dead = mark_notification_failed(notification, "Some error")
+        assert is_dead == (attempt == settings.notification_max_attempts)
+        move_next_attempt_to_past(notification.id)
+
+    assert get_notification(notification.id).status == "dead"
+    assert claim_due_notification() is None
+    assert get_notification_outbox_statistics().dead == 1
+
+    assert requeue_dead_notifications() == 1
+    requeued_notification = claim_due_notification()
+    assert requeued_notification.id == notification.id
+    assert requeued_notification.attempts == 1
+
+
+def test_delivered_notification_is_not_claimed():
+    enqueue_notification(idempotency_key="new_defect:5:Gmail", channel="Gmail", text="Text")
+    notification = claim_due_notification()
+    mark_notifications_delivered([notification.id])
+    move_next_attempt_to_past(notification.id)
+
+    assert claim_due_notification() is None
+    statistics = get_notification_outbox_statistics()
+    assert statistics.delivered == 1
+    assert statistics.pending == 0
+
+
+def test_split_notification_is_not_counted_as_delivered():
+    enqueue_notification(idempotency_key="new_defect:10:Telegram", channel="Telegram", text="Text")
+    notification = claim_due_notification()
+    mark_notifications_split([notification.id])
+    move_next_attempt_to_past(notification.id)
+
+    assert claim_due_notification() is None
+    statistics = get_notification_outbox_statistics()
+    assert (statistics.split, statistics.delivered, statistics.pending) == (1, 0, 0)
+    assert statistics.average_delivery_latency_seconds is None
+
+
+def test_digest_items_wait_for_window_and_are_claimed_together(monkeypatch):
+    monkeypatch.setattr(settings, "notification_coalescing_window_seconds", 60)
+    for defect_id in (6, 7, 8):
+        enqueue_digest_item(defect_id)
+    enqueue_digest_item(9, channel="Telegram")
+    # Notifications are stored in the outbox, but aren't delivered until the end of the window
+    assert claim_due_notifications() == []
+
+    with Session(engine) as session:
+        gmail_notifications = session.exec(select(NotificationOutbox).where(NotificationOutbox.channel == "Gmail")
+                                           .order_by(NotificationOutbox.id)).all()
+    assert len({notification.next_attempt_at for notification in gmail_notifications}) == 1
+    move_next_attempt_to_past(gmail_notifications[0].id)
+
+    claimed_notifications = claim_due_notifications()
+    assert [notification.digest_item["defect_id"] for notification in claimed_notifications] == [6, 7, 8]
+    assert all(notification.status == "sending" for notification in claimed_notifications)
+    # Notifications of the other channel are not merged into the digest
+    assert claim_due_notifications() == []
+
+
+def test_full_digest_is_released_before_end_of_window(monkeypatch):
+    monkeypatch.setattr(settings, "notification_coalescing_window_seconds", 60)
+    monkeypatch.setattr(settings, "notification_coalescing_max_batch_size", 3)
+    for defect_id in (10, 11):
+        enqueue_digest_item(defect_id)
+    assert claim_due_notifications() == []
+
+    enqueue_digest_item(12)
+    assert len(claim_due_notifications()) == 3
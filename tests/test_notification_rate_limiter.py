@@ -0,0 +1,47 @@
+from datetime import datetime, timedelta, timezone
+from email.utils import format_datetime
+
+from application.services.notification_service import (NotificationRateLimiter, parse_retry_after,
+                                                       GMAIL_DEFAULT_RETRY_AFTER_SECONDS)
+
+
+def test_sendings_beyond_quota_wait_for_their_turn():
+    limiter = NotificationRateLimiter(channel_rates={"Telegram": 2}, recipient_rates={"Telegram": 1})
+    assert limiter.reserve("Telegram", "1", now=0) == 0
+    assert limiter.reserve("Telegram", "1", now=0) == 1
+    assert limiter.reserve("Telegram", "1", now=0.5) == 1.5
+    # Another recipient doesn't wait for the first one
+    assert limiter.reserve("Telegram", "2", now=0.5) == 0
+
+
+def test_channel_quota_is_shared_by_recipients():
+    limiter = NotificationRateLimiter(channel_rates={"Telegram": 2}, recipient_rates={})
+    waits = [limiter.reserve("Telegram", now=0) for _ in range(4)]
+    assert waits == [0, 0.5, 1, 1.5]
+    assert limiter.reserve("Telegram", "1", now=0) == 0
+
+
+def test_retry_after_blocks_recipient_and_is_reported():
+    limiter = NotificationRateLimiter(channel_rates={}, recipient_rates={"Telegram": 1})
+    limiter.reserve("Telegram", "1", now=0)
+    limiter.block("Telegram", "1", 10, now=0)
+    assert limiter.reserve("Telegram", "1", now=1) == 9
+
+    wait_times = {model.channel: model for model in limiter.get_wait_times(now=5)}
+    assert wait_times["Telegram"].wait_seconds == 6
+    assert wait_times["Telegram"].recipients_wait_seconds == {"1": 6}
+    assert wait_times["Gmail"].wait_seconds == 0
+
+
+def test_channel_without_limits_is_not_limited():
+    limiter = NotificationRateLimiter(channel_rates={}, recipient_rates={})
+    assert all(limiter.reserve("Gmail", "admin@example.com", now=0) == 0 for _ in range(100))
+
+
+def test_retry_after_is_parsed_from_seconds_and_http_date():
+    assert parse_retry_after("30") == 30
+    http_date = format_datetime(datetime.now(timezone.utc) + timedelta(seconds=120), usegmt=True)
+    assert 115 <= parse_retry_after(http_date) <= 120
+    assert parse_retry_after("Wed, 21 Oct 2015 07:28:00 GMT") == 0
+    assert parse_retry_after("soon") == GMAIL_DEFAULT_RETRY_AFTER_SECONDS
+    assert parse_retry_after(None) == GMAIL_DEFAULT_RETRY_AFTER_SECONDS
@@ -0,0 +1,116 @@
+import os
+os.environ["TESTING"] = "1"
+from datetime import date
+
+import pytest
+from sqlmodel import SQLModel, Session, select, text
+from fastapi.testclient import TestClient
+
+from application import partitioning
+from application.main import application
+from application.db_connection import engine, settings
+from application.models.db_models import Defect, DefectTombstone
+from application.partitioning import (enable_partitioning, is_partitioned, get_monthly_partitions,
+                                      create_monthly_partition, archive_partition, restore_archived_partition)
+
+# Before running the tests, you need to change the DATABASE_URL value in the .env file to the test one.
+
+ARCHIVED_MONTH = date(2025, 1, 1)
+
+
+@pytest.fixture(scope="module")
+def test_client():
+    with TestClient(application) as client:
+        yield client
+
+
+@pytest.fixture(scope="module")
+def auth_headers(test_client):
+    login_response = test_client.post(url="/api/v1/auth/token",
+                                      data={"username": settings.admin_username, "password": settings.admin_password})
+    assert login_response.status_code == 200
+    token = login_response.json()["access_token"]
+    return {"Authorization": f"Bearer {token}"}
+
+
+@pytest.fixture(scope="module", autouse=True)
+def setup_module(test_client, auth_headers):
+    test_client.post(url="api/v1/maintenance/create_tables", params={"test_mode": True}, headers=auth_headers)
+    test_client.post(url="api/v1/maintenance/fill_database", headers=auth_headers)
+    # Notification trigger isn't created in the test mode, but restoring must keep it enabled
+    with engine.begin() as connection:
+        connection.execute(text("CREATE OR REPLACE FUNCTION notify_on_new_defect() RETURNS TRIGGER AS $$ "
+                                "BEGIN RETURN NEW; END; $$ LANGUAGE plpgsql"))
+        connection.execute(text("CREATE TRIGGER trigger_on_new_defect AFTER INSERT ON defects "
+                                "FOR EACH ROW EXECUTE FUNCTION notify_on_new_defect()"))
+        pytest.dropped_foreign_keys = enable_partitioning(connection)
+    yield
+    with engine.begin() as connection:
+        connection.execute(text("DROP FUNCTION IF EXISTS notify_on_new_defect CASCADE"))
+    SQLModel.metadata.drop_all(engine)
+
+
+@pytest.fixture(autouse=True)
+def archive_directory(tmp_path, monkeypatch):
+    monkeypatch.setattr(partitioning, "ARCHIVE_DIRECTORY", tmp_path)
+
+
+# Protection against changes to the production database
+if settings.database_url.split("/")[-1] != "test_db":
+    raise ValueError("USING NON-TEST DATABASE CONNECTION PARAMETERS. CHANGE THE \"DATABASE_URL\" PARAMETER "
+                     "IN THE .env FILE")
+
+
+def get_defects():
+    with Session(engine) as session:
+        return {defect.id: defect.change_version for defect in session.exec(select(Defect)).all()}
+
+
+def test_tables_are_partitioned_by_month():
+    with engine.connect() as connection:
+        for table in ("objects", "history"):
+            assert is_partitioned(connection, table)
+            assert ARCHIVED_MONTH in get_monthly_partitions(connection, table)
+        assert connection.execute(text("SELECT COUNT(*) FROM objects_2025_01")).scalar() == 4
+
+
+def test_dropped_foreign_keys_are_returned():
+    assert "defects.defects_obj_id_fkey" in pytest.dropped_foreign_keys
+    assert "photo.photo_obj_id_fkey" in pytest.dropped_foreign_keys
+
+
+def test_rows_of_new_partition_are_moved_from_default_partition():
+    with engine.begin() as connection:
+        connection.execute(text("INSERT INTO objects (type, time) SELECT type, '2020-05-10' FROM objects LIMIT 1"))
+        assert connection.execute(text("SELECT COUNT(*) FROM objects_default")).scalar() == 1
+
+        partition_name = create_monthly_partition(connection, "objects", date(2020, 5, 1))
+
+        assert connection.execute(text(f"SELECT COUNT(*) FROM {partition_name}")).scalar() == 1
+        assert connection.execute(text("SELECT COUNT(*) FROM objects_default")).scalar() == 0
+        connection.execute(text(f"DELETE FROM {partition_name}"))
+
+
+def test_archived_partition_is_restored_with_new_change_versions(tmp_path):
+    defects_before_archiving = get_defects()
+    assert defects_before_archiving
+
+    archive_path = archive_partition(ARCHIVED_MONTH)
+
+    assert (archive_path / "defects.csv.gz").exists()
+    assert get_defects() == {}
+    with Session(engine) as session:
+        tombstones = session.exec(select(DefectTombstone.defect_id)).all()
+    assert set(tombstones) == set(defects_before_archiving)
+
+    assert restore_archived_partition(ARCHIVED_MONTH) == tmp_path / "objects_2025_01"
+
+    restored_defects = get_defects()
+    assert set(restored_defects) == set(defects_before_archiving)
+    assert all(restored_defects[defect_id] > change_version
+               for defect_id, change_version in defects_before_archiving.items())
+    with Session(engine) as session:
+        assert session.exec(select(DefectTombstone)).all() == []
+        assert session.connection().execute(text("SELECT tgenabled FROM pg_trigger WHERE tgname = "
+                                                 "'trigger_on_new_defect'")).scalar() == "O"
+        assert session.connection().execute(text("SELECT COUNT(*) FROM relation")).scalar() == 1
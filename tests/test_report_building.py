@@ -0,0 +1,109 @@
+import os
+import time
+from concurrent.futures.process import BrokenProcessPool
+from datetime import datetime
+from io import BytesIO
+
+import pytest
+from PIL import Image
+
+from application import report_jobs
+from application.config import settings
+from application.report_cache import ReportCache, get_report_cache_key
+from application.models.api_models import DefectReportModel
+from application.report_building import (ReportBuildingError, build_csv_report_of_all_defects,
+                                         build_pdf_report_of_all_defects, build_pdf_report_of_defect)
+
+
+def create_defect(defect_id: int, criticality: str = "normal", photo: bytes | None = None):
+    if photo is None:
+        output = BytesIO()
+        Image.new("RGB", (400, 300), "gray").save(output, format="JPEG")
+        photo = output.getvalue()
+    return DefectReportModel(id=defect_id, timestamp=datetime(2025, 1, 1, 12, 0), type="hole", is_on_belt=True,
+                             box_width_in_mm=10, box_length_in_mm=20, longitudinal_position=100, transverse_position=50,
+                             probability=90, criticality=criticality, photo=photo)
+
+
+def test_csv_report_has_no_photos():
+    lines = build_csv_report_of_all_defects([create_defect(1), create_defect(2, "critical")]).decode().splitlines()
+    assert lines[0] == ("id,timestamp,type,is_on_belt,box_width_in_mm,box_length_in_mm,longitudinal_position,"
+                        "transverse_position,probability,criticality")
+    assert len(lines) == 3 and lines[2].endswith(",critical")
+
+
+def test_csv_report_of_no_defects_has_header():
+    assert build_csv_report_of_all_defects([]).decode().startswith("id,timestamp,type")
+
+
+def test_pdf_report_is_built_in_memory():
+    assert build_pdf_report_of_all_defects([create_defect(1, "extreme")], 1, 0).startswith(b"%PDF")
+
+
+def test_corrupted_photo_raises_report_building_error():
+    with pytest.raises(ReportBuildingError, match="Unidentified image error"):
+        build_pdf_report_of_defect(create_defect(1, photo=b"not an image"))
+
+
+def test_saved_report_is_streamed_by_chunks(tmp_path, monkeypatch):
+    monkeypatch.setattr(settings, "reports_directory", str(tmp_path))
+    monkeypatch.setattr(report_jobs, "REPORT_CHUNK_SIZE", 4)
+    assert report_jobs.iterate_report("job") is None
+    report_jobs.save_report("job", b"0123456789")
+    assert list(report_jobs.iterate_report("job")) == [b"0123", b"4567", b"89"]
+    assert [path.name for path in tmp_path.iterdir()] == ["job"]
+
+
+def test_broken_report_process_pool_is_replaced():
+    pool = report_jobs.get_report_process_pool()
+    try:
+        # Process of the pool dies during the building of the report
+        with pytest.raises(BrokenProcessPool):
+            pool.submit(os._exit, 1).result(timeout=60)
+
+        report_jobs.reset_report_process_pool(pool)
+        new_pool = report_jobs.get_report_process_pool()
+        assert new_pool is not pool
+        assert new_pool.submit(abs, -1).result(timeout=60) == 1
+        # Reset of the already replaced pool keeps the new one
+        report_jobs.reset_report_process_pool(pool)
+        assert report_jobs.get_report_process_pool() is new_pool
+    finally:
+        report_jobs.shutdown_report_process_pool()
+
+
+def test_report_cache_returns_report_of_same_data_only(tmp_path):
+    cache = ReportCache(max_size_bytes=1024, directory=str(tmp_path))
+    key = get_report_cache_key("all_defects", "pdf", {}, "2:100:0:0")
+    assert cache.get(key) is None
+    cache.put(key, b"report", {"total_count": 2})
+    assert cache.get(key) == (b"report", {"total_count": 2})
+    assert cache.get(get_report_cache_key("all_defects", "pdf", {}, "3:200:0:0")) is None
+    assert cache.get(get_report_cache_key("all_defects", "csv", {}, "2:100:0:0")) is None
+
+
+def test_report_cache_removes_least_recently_used_reports(tmp_path):
+    cache = ReportCache(max_size_bytes=3000, directory=str(tmp_path))
+    for key in ("first", "second"):
+        cache.put(key, bytes(1000), {})
+        # Modification times of the files are distinguishable
+        time.sleep(0.01)
+    assert cache.get("first") is not None
+    time.sleep(0.01)
+    cache.put("third", bytes(1000), {})
+    assert cache.get("second") is None
+    assert cache.get("first") is not None and cache.get("third") is not None
+
+
+def test_cached_report_is_linked_without_copying(tmp_path):
+    cache = ReportCache(max_size_bytes=1500, directory=str(tmp_path / "cache"))
+    cache.put("first", bytes(1000), {})
+    job_report_path = tmp_path / "job"
+    assert cache.link("first", job_report_path)
+    assert job_report_path.stat().st_ino == (tmp_path / "cache" / "first").stat().st_ino
+
+    # Report of the job stays downloadable after the removal from the cache
+    cache.put("second", bytes(1000), {})
+    assert cache.get("first") is None
+    assert job_report_path.read_bytes() == bytes(1000)
+    assert not cache.link("first", tmp_path / "other_job")
@@ -0,0 +1,93 @@
+import asyncio
+
+from application.sse_hub import SSEBroadcastHub, format_server_sent_event, HEARTBEAT_MESSAGE, RESYNC_MESSAGE
+
+
+def test_slow_client_loses_oldest_events():
+    async def run():
+        hub = SSEBroadcastHub("test", buffer_size=2, disconnect_slow_clients=False)
+        client = hub.subscribe()
+        for event_id in range(3):
+            hub.publish(f"{event_id}", event_id=event_id)
+        return hub, await client.get_events()
+
+    hub, events = asyncio.run(run())
+    assert [event_id for event_id, _ in events] == [1, 2]
+    metrics = hub.get_metrics()
+    assert (metrics.connected_clients, metrics.published_events, metrics.dropped_events) == (1, 3, 1)
+
+
+def test_slow_client_is_disconnected_by_policy():
+    async def run():
+        hub = SSEBroadcastHub("test", buffer_size=1, disconnect_slow_clients=True)
+        stream = hub.stream(hub.subscribe())
+        hub.publish("first")
+        first_message = await anext(stream)
+        hub.publish("second")
+        hub.publish("third")
+        remaining_messages = [message async for message in stream]
+        return hub, first_message, remaining_messages
+
+    hub, first_message, remaining_messages = asyncio.run(run())
+    assert first_message == "data: first\n\n"
+    assert not remaining_messages
+    assert hub.get_metrics().connected_clients == 0
+    assert hub.get_metrics().disconnected_slow_clients == 1
+
+
+def test_idle_client_gets_heartbeat():
+    async def run():
+        hub = SSEBroadcastHub("test", buffer_size=10, disconnect_slow_clients=False)
+        stream = hub.stream(hub.subscribe())
+        next_message = asyncio.create_task(anext(stream))
+        await asyncio.sleep(0.01)
+        # Idle client isn't woken up without events
+        assert not next_message.done()
+        hub.send_heartbeats()
+        return await next_message
+
+    assert asyncio.run(run()) == HEARTBEAT_MESSAGE
+
+
+def test_event_is_formatted_with_id_and_name():
+    assert format_server_sent_event("line 1\nline 2", event="log", event_id=7) == \
+        "id: 7\nevent: log\ndata: line 1\ndata: line 2\n\n"
+
+
+def test_reconnected_client_gets_missed_events():
+    async def run():
+        hub = SSEBroadcastHub("test", buffer_size=10, disconnect_slow_clients=False, replay_size=10)
+        client = hub.subscribe()
+        for number in range(5):
+            hub.publish(f"{number}")
+        event_ids = [event_id for event_id, _ in await client.get_events()]
+        return event_ids, await hub.subscribe(last_event_id=event_ids[1]).get_events()
+
+    event_ids, events = asyncio.run(run())
+    assert event_ids == sorted(set(event_ids))
+    assert [event_id for event_id, _ in events] == event_ids[2:]
+    assert events[0][1] == format_server_sent_event("2", event_id=event_ids[2])
+
+
+def test_client_is_told_to_resync_if_missed_events_are_not_kept():
+    async def run():
+        hub = SSEBroadcastHub("test", buffer_size=10, disconnect_slow_clients=False, replay_size=2)
+        client = hub.subscribe()
+        for number in range(5):
+            hub.publish(f"{number}")
+        event_ids = [event_id for event_id, _ in await client.get_events()]
+        # Client of the previous run of the server and the client which has missed the events removed from the buffer
+        old_server_client = hub.subscribe(last_event_id=event_ids[0] - 10 ** 9)
+        lagging_client = hub.subscribe(last_event_id=event_ids[1])
+        return event_ids, await old_server_client.get_events(), await lagging_client.get_events()
+
+    event_ids, old_server_events, events = asyncio.run(run())
+    assert old_server_events[0] == (None, RESYNC_MESSAGE)
+    assert [event_id for event_id, _ in events] == [None, event_ids[3], event_ids[4]]
+
+
+def test_event_published_by_another_process_keeps_its_id():
+    hub = SSEBroadcastHub("test", buffer_size=10, disconnect_slow_clients=False, replay_size=10)
+    event_id = hub.last_event_id + 1000
+    hub.publish("remote", event_id=event_id)
+    assert hub.generate_event_id() > event_id
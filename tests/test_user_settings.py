@@ -0,0 +1,71 @@
+import json
+import os
+from concurrent.futures import ThreadPoolExecutor
+
+from application.user_settings import UserSettingsStore
+
+
+def write_settings_by_hand(settings_file, data: dict):
+    settings_file.write_text(json.dumps(data), encoding="utf-8")
+    # Modification time is changed explicitly, because the file system may not notice two writes in a row
+    file_stat = settings_file.stat()
+    os.utime(settings_file, ns=(file_stat.st_atime_ns, file_stat.st_mtime_ns + 1_000_000_000))
+
+
+def test_settings_are_reloaded_only_after_file_change(tmp_path):
+    settings_file = tmp_path / "user_settings.json"
+    store = UserSettingsStore(settings_file)
+    assert store.load() == {}
+
+    write_settings_by_hand(settings_file, {"report_sending_scope": ["Gmail"]})
+    settings = store.load()
+    assert settings == {"report_sending_scope": ["Gmail"]}
+    # Returned settings are a copy, so the changes of the caller don't affect the store
+    settings["report_sending_scope"].append("Telegram")
+    assert store.load() == {"report_sending_scope": ["Gmail"]}
+
+    write_settings_by_hand(settings_file, {"report_sending_scope": []})
+    assert store.load() == {"report_sending_scope": []}
+
+
+def test_saving_is_atomic_and_notifies_subscribers(tmp_path):
+    settings_file = tmp_path / "user_settings.json"
+    write_settings_by_hand(settings_file, {"report_sending_scope": ["Gmail"]})
+    store = UserSettingsStore(settings_file)
+    changes = []
+    store.subscribe(changes.append)
+    store.load()
+    assert not changes
+
+    store.save({"report_sending_scope": ["Telegram"]})
+    assert json.loads(settings_file.read_text(encoding="utf-8")) == {"report_sending_scope": ["Telegram"]}
+    assert [path.name for path in tmp_path.iterdir()] == ["user_settings.json"]
+    # Saving the same settings is not a change
+    store.save({"report_sending_scope": ["Telegram"]})
+    write_settings_by_hand(settings_file, {"report_sending_scope": []})
+    store.load()
+    assert changes == [{"report_sending_scope": ["Telegram"]}, {"report_sending_scope": []}]
+
+
+def test_concurrent_saving_uses_unique_temporary_files(tmp_path):
+    settings_file = tmp_path / "user_settings.json"
+    # Stores of the different worker processes
+    stores = [UserSettingsStore(settings_file) for _ in range(4)]
+
+    def save_repeatedly(store: UserSettingsStore, index: int):
+        for count in range(50):
+            store.save({"report_sending_scope": [f"{index}:{count}"]})
+
+    with ThreadPoolExecutor(max_workers=len(stores)) as executor:
+        futures = [executor.submit(save_repeatedly, store, index) for index, store in enumerate(stores)]
+    for future in futures:
+        future.result()
+
+    assert "report_sending_scope" in json.loads(settings_file.read_text(encoding="utf-8"))
+    assert [path.name for path in tmp_path.iterdir()] == ["user_settings.json"]
+
+
+def test_saving_returns_whether_settings_were_changed(tmp_path):
+    store = UserSettingsStore(tmp_path / "user_settings.json")
+    assert store.save({"report_sending_scope": ["Gmail"]})
+    assert not store.save({"report_sending_scope": ["Gmail"]})
@@ -2,28 +2,53 @@ import {createServiceApi} from "./BaseAPI";
 
 const api = createServiceApi('report')
 
+const JOB_POLLING_INTERVAL_MS = 1000;
+
 export default class ReportService {
+    // Report is generated by the server in background, so the job is polled until it is finished and then the report
+    // is downloaded
+    static waitForReportAndDownload = async (response) => {
+        let job = response.data;
+        while (job.status === 'queued' || job.status === 'running') {
+            await new Promise(resolve => setTimeout(resolve, JOB_POLLING_INTERVAL_MS));
+            job = (await api.get(`/jobs/${job.job_id}`)).data;
+        }
+        if (job.status === 'failed') {
+            throw new Error(job.error);
+        }
+
+        const file = await api.get(`/jobs/${job.job_id}/download`, {responseType: 'blob'});
+        const filename = file.headers['content-disposition']?.match(/filename="?([^"]+)"?/)?.[1]
+            ?? `report.${job.doc_type}`;
+        const link = document.createElement('a');
+        link.href = URL.createObjectURL(file.data);
+        link.download = filename;
+        link.click();
+        URL.revokeObjectURL(link.href);
+        return job;
+    }
+
     static downloadReportOfDefect = async (id, report_type='pdf') => {
         if (report_type === 'pdf') {
-            return await api.post(`/id=${id}/pdf`);
+            return await ReportService.waitForReportAndDownload(await api.post(`/id=${id}/pdf`));
         } else if (report_type === 'csv') {
-            return await api.post(`/id=${id}/csv`);
+            return await ReportService.waitForReportAndDownload(await api.post(`/id=${id}/csv`));
         }
     }
 
     static downloadReportOfAllDefects = async (report_type='pdf') => {
         if (report_type === 'pdf') {
-            return await api.post('/all/pdf');
+            return await ReportService.waitForReportAndDownload(await api.post('/all/pdf'));
         } else if (report_type === 'csv') {
-            return await api.post('/all/csv');
+            return await ReportService.waitForReportAndDownload(await api.post('/all/csv'));
         }
     }
 
     static downloadReportOfConveyorStateAndParameters = async (report_type='pdf') => {
         if (report_type === 'pdf') {
-            return await api.post('/conveyor/pdf');
+            return await ReportService.waitForReportAndDownload(await api.post('/conveyor/pdf'));
         } else if (report_type === 'csv') {
-            return await api.post('/conveyor/csv');
+            return await ReportService.waitForReportAndDownload(await api.post('/conveyor/csv'));
         }
     }
 }
@@ -10,7 +10,8 @@ import ErrorDialog from "./components/Dialogs/ErrorDialog";
 import NotificationDialog from "./components/Dialogs/NotificationDialog";
 
 export default function App() {
-    useSSE();
+    const [health, setHealth] = useState(null);
+    useSSE(setHealth);
 
     const [sidebarOpen, setSidebarOpen] = useState(false);
     const [currentSection, setCurrentSection] = useState('Conveyor Belt Monitoring Web Application');
@@ -37,7 +38,7 @@ export default function App() {
                     <Route path={route.path} key={route.path} element={route.element} exact={route.exact} />
                 )}
             </Routes>
-            <HealthChecker />
+            <HealthChecker health={health} />
             <ErrorDialog />
             <NotificationDialog />
         </div>
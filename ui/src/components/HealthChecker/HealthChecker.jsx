@@ -1,25 +1,33 @@
-import { useEffect } from 'react';
+import { useEffect, useRef } from 'react';
 import {useError} from "../../context/ErrorContext";
-import MaintenanceService from "../../API/MaintenanceService";
 import {useAuth} from "../../context/AuthenticationContext";
 
-export default function HealthChecker() {
+// The server is considered unavailable after three missed health updates. The interval of the updates is sent by
+// the server with the health, the default one is used until the first update
+const MISSED_HEALTH_UPDATES = 3;
+const DEFAULT_HEALTH_PUSH_INTERVAL_SECONDS = 10;
+const HEALTH_UPDATE_MARGIN_MS = 5000;
+
+export default function HealthChecker({ health }) {
     const { showError } = useError();
     const { authenticated } = useAuth();
+    const pushIntervalSecondsRef = useRef(DEFAULT_HEALTH_PUSH_INTERVAL_SECONDS);
 
-    const checkServerAndDatabaseHealth = () => {
-        MaintenanceService.checkServer()
-            .then(() => MaintenanceService.checkDatabase()
-                .catch(error => showError(error, "DATABASE UNAVAILABLE")))
-            .catch(error => {showError(error, "SERVER UNAVAILABLE"); return null;});
-    }
+    useEffect(() => {
+        if (!authenticated || !health || health.is_database_available) return;
+        showError(new Error(health.database_details), "DATABASE UNAVAILABLE");
+    }, [authenticated, health]);
 
+    // Every health update restarts the timeout
     useEffect(() => {
         if (!authenticated) return;
+        if (health?.health_push_interval_seconds) pushIntervalSecondsRef.current = health.health_push_interval_seconds;
 
-        const interval = setInterval(checkServerAndDatabaseHealth, 10000);
-        return () => clearInterval(interval);
-    }, [authenticated]);
+        const timeoutMs = MISSED_HEALTH_UPDATES * pushIntervalSecondsRef.current * 1000 + HEALTH_UPDATE_MARGIN_MS;
+        const timeout = setTimeout(() => showError(new Error("Health of the server hasn't been received"),
+            "SERVER UNAVAILABLE"), timeoutMs);
+        return () => clearTimeout(timeout);
+    }, [authenticated, health]);
 
     return null;
 };
@@ -0,0 +1,63 @@
+import { useEffect, useRef } from "react";
+import {useAuth} from "../context/AuthenticationContext";
+
+const RECONNECT_DELAY_MS = 3000;
+// The token is invalid or has expired, reconnection with it would be rejected again
+const POLICY_VIOLATION_CODE = 1008;
+
+// Changes of the defects (created, criticality changed, deleted) pushed by the server. WebSocket can't send
+// the authorization header, so the token is sent in the first message (not in the URL, which gets into the logs).
+// Changes missed while the connection was closed aren't sent again, so "onReconnect" has to reload the defects
+export const useDefectFeed = (filters, onDelta, onReconnect) => {
+    const { authenticated } = useAuth();
+    const socketRef = useRef(null);
+
+    useEffect(() => {
+        if (!authenticated) return;
+
+        let isClosedByHook = false;
+        let reconnectTimeout = null;
+
+        const connect = (isReconnection) => {
+            const url = `ws://${process.env.REACT_APP_SERVER_ADDRESS}:${process.env.REACT_APP_CONNECTION_PORT}/api/v1/defect_info/feed`
+            const socket = new WebSocket(url);
+            socketRef.current = socket;
+
+            socket.onopen = () => {
+                socket.send(JSON.stringify({token: localStorage.getItem('access_token')}));
+                socket.send(JSON.stringify(filters || {}));
+                if (isReconnection && onReconnect) onReconnect();
+            };
+            socket.onmessage = (event) => {
+                const data = JSON.parse(event.data);
+                if (data.error) {
+                    console.log(data.error);
+                    return;
+                }
+                onDelta(data);
+            };
+            socket.onclose = (event) => {
+                if (event.code === POLICY_VIOLATION_CODE) {
+                    console.log(`Defect feed is closed: ${event.reason}`);
+                    return;
+                }
+                if (!isClosedByHook) reconnectTimeout = setTimeout(() => connect(true), RECONNECT_DELAY_MS);
+            };
+        };
+
+        connect(false);
+
+        return () => {
+            isClosedByHook = true;
+            clearTimeout(reconnectTimeout);
+            socketRef.current?.close();
+        };
+    }, [authenticated]);
+
+    // Filters are replaced without reconnection
+    useEffect(() => {
+        if (socketRef.current?.readyState === WebSocket.OPEN) {
+            socketRef.current.send(JSON.stringify(filters || {}));
+        }
+    }, [JSON.stringify(filters)]);
+};
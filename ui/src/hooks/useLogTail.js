@@ -0,0 +1,73 @@
+import { useEffect } from "react";
+import {useError} from "../context/ErrorContext";
+import {useAuth} from "../context/AuthenticationContext";
+
+const RECONNECT_DELAY_MS = 3000;
+
+// EventSource can't send the authorization header, so the stream of server-sent events is read with fetch().
+// When the stream ends or the connection is lost, the stream is requested again from the last received record
+export const useLogTail = (sinceId, onNewLog) => {
+    const { authenticated } = useAuth();
+    const { showError } = useError();
+
+    useEffect(() => {
+        if (!authenticated || sinceId === null) return;
+
+        const controller = new AbortController();
+        let lastId = sinceId;
+        let reconnectTimeout = null;
+
+        const readStream = async () => {
+            const url = `http://${process.env.REACT_APP_SERVER_ADDRESS}:${process.env.REACT_APP_CONNECTION_PORT}/api/v1/logs/tail?since_id=${lastId}`
+            const response = await fetch(url, {
+                headers: {"Authorization": `Bearer ${localStorage.getItem('access_token')}`},
+                signal: controller.signal
+            });
+            if (!response.ok) {
+                const error = new Error(`Server responded with status ${response.status}`);
+                // Request with the expired token or without the rights isn't repeated
+                error.isFatal = response.status === 401 || response.status === 403;
+                throw error;
+            }
+            const reader = response.body.pipeThrough(new TextDecoderStream()).getReader();
+            let buffer = '';
+            while (true) {
+                const { value, done } = await reader.read();
+                if (done) break;
+                buffer += value;
+                const events = buffer.split('\n\n');
+                buffer = events.pop();
+                events.forEach(event => {
+                    const dataLine = event.split('\n').find(line => line.startsWith('data: '));
+                    if (!dataLine) return;
+                    const log = JSON.parse(dataLine.slice('data: '.length));
+                    lastId = log.id;
+                    onNewLog(log);
+                });
+            }
+        };
+
+        const connect = () => {
+            readStream()
+                .then(() => {
+                    reconnectTimeout = setTimeout(connect, RECONNECT_DELAY_MS);
+                })
+                .catch(error => {
+                    if (error.name === 'AbortError') return;
+                    if (error.isFatal) {
+                        showError(error, "Live log records stream error");
+                        return;
+                    }
+                    console.log(error);
+                    reconnectTimeout = setTimeout(connect, RECONNECT_DELAY_MS);
+                });
+        };
+
+        connect();
+
+        return () => {
+            clearTimeout(reconnectTimeout);
+            controller.abort();
+        };
+    }, [authenticated, sinceId]);
+};
@@ -3,7 +3,7 @@ import {useError} from "../context/ErrorContext";
 import {useNotification} from "../context/NotificationContext";
 import {useAuth} from "../context/AuthenticationContext";
 
-export const useSSE = () => {
+export const useSSE = (onHealth) => {
     const { authenticated } = useAuth();
     const { showError } = useError();
     const { showNotification } = useNotification();
@@ -24,11 +24,25 @@ export const useSSE = () => {
             }
         };
 
+        // Health of the server is pushed periodically, so the tabs don't poll it
+        eventSource.addEventListener("health", (event) => {
+            if (onHealth) onHealth(JSON.parse(event.data));
+        });
+
+        // Server couldn't send some of the events missed during the reconnection
+        eventSource.addEventListener("resync", () => {
+            showNotification("Connection restored", "Some notifications may have been missed while the " +
+                "connection was lost. Check the \"Defects\" section.");
+        });
+
+        // The browser reconnects by itself and sends the id of the last received event (Last-Event-ID),
+        // so the missed events are sent again by the server
         eventSource.onerror = (error) => {
             console.log(error);
-            showError(error, "Some server-sent events (SSE) error. This was probably a notification about a new " +
-                "defect. Check the \"Defects\" section.");
-            eventSource.close();
+            if (eventSource.readyState === EventSource.CLOSED) {
+                showError(error, "Some server-sent events (SSE) error. This was probably a notification about a " +
+                    "new defect. Check the \"Defects\" section.");
+            }
         };
 
         return () => {
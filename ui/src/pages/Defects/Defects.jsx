@@ -4,6 +4,7 @@ import DefectInfoService from "../../API/DefectInfoService";
 import DefectsTable from "./DefectsTable";
 import Filters from "./Filters";
 import DefectTab from "./DefectTab/DefectTab";
+import {useDefectFeed} from "../../hooks/useDefectFeed";
 
 export default function Defects() {
     const [rows, setRows] = useState([]);
@@ -12,11 +13,22 @@ export default function Defects() {
     const [tabOpen, setTabOpen] = useState(false);
     const [selectedDefect, setSelectedDefect] = useState(null);
 
-    useEffect(() => {
+    const fetchAllDefects = () => {
         DefectInfoService.getAllDefects()
             .then(response => setRows(response.data))
             .catch(error => showError(error, "Table of defects fetching error"));
-    }, []);
+    };
+
+    useEffect(fetchAllDefects, []);
+
+    // The table is updated by the changes pushed by the server instead of refetching
+    const applyDefectDelta = (delta) => setRows(rows => {
+        if (delta.action === "created") return [...rows, delta.defect];
+        if (delta.action === "deleted") return rows.filter(row => row.id !== delta.defect.id);
+        return rows.map(row => row.id === delta.defect.id ? {...row, criticality: delta.defect.criticality} : row);
+    });
+
+    useDefectFeed(null, applyDefectDelta, fetchAllDefects);
 
     return (
         <>
@@ -3,10 +3,12 @@ import {useError} from "../../context/ErrorContext";
 import LogsTableOptions from "./LogsTableOptions";
 import LogsTable from './LogsTable';
 import LoggingService from '../../API/LoggingService';
+import {useLogTail} from "../../hooks/useLogTail";
 
 export default function Logs() {
     const [rows, setRows] = useState([]);
     const [filteredLatestRows, setFilteredLatestRows] = useState([]);
+    const [tailSinceId, setTailSinceId] = useState(null);
     const {showError} = useError();
 
     useEffect(() => {
@@ -14,10 +16,16 @@ export default function Logs() {
             .then(response => {
                 setRows(response.data);
                 setFilteredLatestRows(response.data);
+                // Log records are in reverse order, so the first one is the latest
+                setTailSinceId(response.data.length > 0 ? response.data[0].id : 0);
             })
             .catch(error => showError(error, "Log records fetching error"));
     }, []);
 
+    // After the initial fetching only new log records are received from the server
+    useLogTail(tailSinceId, newLog => setRows(previousRows =>
+        previousRows.some(row => row.id === newLog.id) ? previousRows : [newLog, ...previousRows]));
+
     return (
         <>
             <LogsTableOptions rows={rows} setRows={setRows} setFilteredLatestRows={setFilteredLatestRows} />